@@ -0,0 +1,125 @@
+"""
+Measure recall, memory and search latency of truncated and reduced-precision embeddings.
+
+Every combination of stored dimension and vector dtype is compared against exact
+search over the full float32 vectors:
+
+    python benchmarks/bench_embedding_precision.py --items 50000 --dim 1536
+
+By default the embeddings are synthetic, clustered, with variance decaying over
+the components like a Matryoshka-trained model. Pass ``--embeddings file.npy``
+(an n x d float32 matrix, e.g. saved text-embedding-3-small vectors) to measure
+real ones; queries are then noisy copies of stored rows.
+"""
+import argparse
+import asyncio
+import time
+from typing import List
+
+import faiss
+import numpy as np
+
+from echoforgeai.memory.embeddings import Embedder, TruncatingEmbedder
+from echoforgeai.memory.index_backends import IndexConfig
+from echoforgeai.memory.vector_store import MemoryBank
+
+
+class MatrixEmbedder(Embedder):
+    """Serves rows of a precomputed matrix for texts of the form "<i>"."""
+    model = "matrix"
+
+    def __init__(self, vectors: np.ndarray):
+        self.dim = vectors.shape[1]
+        self.vectors = vectors
+
+    async def embed(self, texts: List[str]) -> np.ndarray:
+        return self.vectors[[int(t) for t in texts]]
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def synthetic(n: int, dim: int, rng: np.random.Generator) -> np.ndarray:
+    clusters = rng.standard_normal((max(1, n // 50), dim), dtype=np.float32)
+    vectors = clusters[rng.integers(len(clusters), size=n)]
+    vectors += 0.6 * rng.standard_normal((n, dim), dtype=np.float32)
+    vectors *= (np.arange(1, dim + 1, dtype=np.float32) ** -0.5)[None, :]
+    return normalize(vectors)
+
+
+def noisy_copies(vectors: np.ndarray, n: int, rng: np.random.Generator) -> np.ndarray:
+    rows = vectors[rng.integers(len(vectors), size=n)]
+    scale = np.abs(vectors).mean()
+    return normalize(rows + scale * rng.standard_normal(rows.shape, dtype=np.float32))
+
+
+async def measure(args, embedder: Embedder, items: int, queries: List[str], truth: np.ndarray, dim: int, dtype: str):
+    bank = MemoryBank(
+        backend=args.backend,
+        embedding_dim=dim,
+        max_items=items,
+        embedder=embedder,
+        max_batch_wait=0,
+        result_cache_size=0,
+        index_config=IndexConfig(min_train_size=min(items, 10000)),
+        vector_dtype=dtype
+    )
+    for start in range(0, items, 10000):
+        await bank.store_many([str(i) for i in range(start, min(start + 10000, items))])
+
+    vector_bytes = bank._vectors.nbytes + (bank._scales.nbytes if bank._scales is not None else 0)
+    if bank.index is not None:
+        vector_bytes += faiss.serialize_index(bank.index).nbytes
+
+    start = time.perf_counter()
+    results = [await bank.retrieve_relevant(q, limit=args.k) for q in queries]
+    latency = 1000 * (time.perf_counter() - start) / len(queries)
+    recall = np.mean([
+        len({m.id for m in found} & set(row.tolist())) / args.k
+        for found, row in zip(results, truth)
+    ])
+    return vector_bytes, latency, recall
+
+
+async def run(args: argparse.Namespace) -> None:
+    rng = np.random.default_rng(0)
+    if args.embeddings:
+        stored = normalize(np.load(args.embeddings).astype(np.float32))
+    else:
+        stored = synthetic(args.items, args.dim, rng)
+    items, full_dim = stored.shape
+    vectors = np.vstack([stored, noisy_copies(stored, args.queries, rng)])
+    queries = [str(items + i) for i in range(args.queries)]
+    _, truth = faiss.knn(vectors[items:], stored, args.k)
+
+    print(f"{items} memories, dim={full_dim}, backend={args.backend}, recall@{args.k} vs exact float32")
+    print(f"{'dim':>5} {'dtype':>8} {'MiB':>9} {'saved':>7} {'ms/query':>9} {'speedup':>8} {'recall':>7}")
+    baseline = None
+    for dim in [full_dim] + [d for d in args.truncate if d < full_dim]:
+        source = MatrixEmbedder(vectors)
+        embedder = source if dim == full_dim else TruncatingEmbedder(source, dim)
+        for dtype in args.dtypes:
+            size, latency, recall = await measure(args, embedder, items, queries, truth, dim, dtype)
+            baseline = baseline or (size, latency)
+            print(
+                f"{dim:>5} {dtype:>8} {size / 2 ** 20:>9.1f} {1 - size / baseline[0]:>6.0%} "
+                f"{latency:>9.3f} {baseline[1] / latency:>7.2f}x {recall:>7.3f}"
+            )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--items", type=int, default=50000)
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--backend", default="flat")
+    parser.add_argument("--truncate", type=int, nargs="*", default=[512, 256])
+    parser.add_argument("--dtypes", nargs="*", default=["float32", "float16", "int8"])
+    parser.add_argument("--embeddings", help="Optional .npy matrix of real embeddings to use")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+Measure the latency cost of hybrid (BM25 + vector) retrieval over vector-only retrieval.
+
+Memories are synthetic sentences over a Zipf-distributed vocabulary with a sprinkling
+of proper names, so both common and rare query terms are exercised:
+
+    python benchmarks/bench_hybrid_retrieval.py --items 100000 --dim 256
+"""
+import argparse
+import asyncio
+import time
+from typing import List
+
+import numpy as np
+
+from echoforgeai.memory.embeddings import Embedder
+from echoforgeai.memory.vector_store import MemoryBank
+
+NAMES = ["Old Tom", "Silver Flagon", "Ravenhollow", "The Stranger", "Mira", "Blackwater Keep"]
+
+
+class MatrixEmbedder(Embedder):
+    """Serves rows of a precomputed matrix for texts of the form "<i>: ..."."""
+    model = "matrix"
+
+    def __init__(self, vectors: np.ndarray):
+        self.dim = vectors.shape[1]
+        self.vectors = vectors
+
+    async def embed(self, texts: List[str]) -> np.ndarray:
+        return self.vectors[[int(t.split(":", 1)[0]) for t in texts]]
+
+
+def sentences(n: int, vocabulary: int, rng: np.random.Generator, offset: int = 0) -> List[str]:
+    words = np.minimum(rng.zipf(1.3, size=(n, 12)), vocabulary)
+    names = rng.integers(len(NAMES), size=n)
+    return [
+        f"{offset + i}: {NAMES[names[i]] if i % 10 == 0 else ''} "
+        + " ".join(f"w{w}" for w in row)
+        for i, row in enumerate(words)
+    ]
+
+
+async def mean_latency_ms(bank: MemoryBank, queries: List[str], k: int) -> float:
+    start = time.perf_counter()
+    for query in queries:
+        await bank.retrieve_relevant(query, limit=k)
+    return 1000 * (time.perf_counter() - start) / len(queries)
+
+
+async def run(args: argparse.Namespace) -> None:
+    rng = np.random.default_rng(0)
+    vectors = rng.random((args.items + args.queries, args.dim), dtype=np.float32)
+    embedder = MatrixEmbedder(vectors)
+    contents = sentences(args.items, args.vocabulary, rng)
+    queries = sentences(args.queries, args.vocabulary, rng, offset=args.items)
+
+    print(f"{args.items} memories, dim={args.dim}, k={args.k}, {args.queries} queries")
+    latencies = {}
+    for hybrid in (False, True):
+        bank = MemoryBank(
+            embedding_dim=args.dim,
+            max_items=args.items,
+            embedder=embedder,
+            max_batch_wait=0,
+            hybrid=hybrid
+        )
+        start = time.perf_counter()
+        await bank.store_many(contents)
+        build = time.perf_counter() - start
+        latencies[hybrid] = await mean_latency_ms(bank, queries, args.k)
+        label = "hybrid" if hybrid else "vector"
+        print(f"{label:<7} build {build:7.2f} s   query {latencies[hybrid]:8.3f} ms")
+    print(f"hybrid overhead: {latencies[True] - latencies[False]:.3f} ms/query")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--items", type=int, default=100000)
+    parser.add_argument("--dim", type=int, default=256)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--vocabulary", type=int, default=20000)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+Benchmark MemoryBank index backends against an exact flat baseline.
+
+Reports build time, mean query latency and recall@k for each backend:
+
+    python benchmarks/bench_index_backends.py --items 100000 --dim 256
+"""
+import argparse
+import asyncio
+import time
+from typing import List
+
+import faiss
+import numpy as np
+
+from echoforgeai.memory.embeddings import Embedder
+from echoforgeai.memory.index_backends import BACKENDS, IndexConfig
+from echoforgeai.memory.vector_store import MemoryBank
+
+
+class LookupEmbedder(Embedder):
+    """Maps "doc <i>" / "query <i>" to precomputed vectors."""
+    model = "lookup"
+
+    def __init__(self, docs: np.ndarray, queries: np.ndarray):
+        self.dim = docs.shape[1]
+        self._tables = {"doc": docs, "query": queries}
+
+    def embed_sync(self, texts: List[str]) -> np.ndarray:
+        rows = []
+        for text in texts:
+            table, i = text.split(" ")
+            rows.append(self._tables[table][int(i)])
+        return np.stack(rows)
+
+    async def embed(self, texts: List[str]) -> np.ndarray:
+        return self.embed_sync(texts)
+
+
+def clustered_vectors(n: int, dim: int, clusters: int, rng: np.random.Generator) -> np.ndarray:
+    """Gaussian blobs, closer to real embeddings than uniform noise."""
+    centers = rng.normal(size=(clusters, dim)).astype(np.float32)
+    points = centers[rng.integers(clusters, size=n)] + 0.3 * rng.normal(size=(n, dim))
+    return points.astype(np.float32)
+
+
+async def run(args: argparse.Namespace) -> None:
+    rng = np.random.default_rng(0)
+    docs = clustered_vectors(args.items, args.dim, 256, rng)
+    queries = clustered_vectors(args.queries, args.dim, 256, rng)
+    embedder = LookupEmbedder(docs, queries)
+    _, truth = faiss.knn(queries, docs, args.k)
+
+    print(f"{args.items} memories, dim={args.dim}, k={args.k}, {args.queries} queries")
+    print(f"{'backend':<8} {'build s':>9} {'query ms':>9} {'recall@k':>9}")
+    for backend in args.backends:
+        bank = MemoryBank(
+            backend=backend,
+            embedding_dim=args.dim,
+            max_items=args.items,
+            embedder=embedder,
+            max_batch_wait=0,
+            index_config=IndexConfig(
+                min_train_size=args.items,
+                nprobe=args.nprobe,
+                ef_search=args.ef_search
+            )
+        )
+        start = time.perf_counter()
+        await bank.store_many([f"doc {i}" for i in range(args.items)])
+        build = time.perf_counter() - start
+
+        hits = 0
+        elapsed = 0.0
+        for q in range(args.queries):
+            start = time.perf_counter()
+            results = await bank.retrieve_relevant(f"query {q}", limit=args.k)
+            elapsed += time.perf_counter() - start
+            hits += len({m.id for m in results} & set(truth[q].tolist()))
+
+        recall = hits / (args.queries * args.k)
+        print(f"{backend:<8} {build:>9.2f} {1000 * elapsed / args.queries:>9.3f} {recall:>9.3f}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--items", type=int, default=50000)
+    parser.add_argument("--dim", type=int, default=256)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--nprobe", type=int, default=16)
+    parser.add_argument("--ef-search", type=int, default=64)
+    parser.add_argument("--backends", nargs="+", default=list(BACKENDS), choices=BACKENDS)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
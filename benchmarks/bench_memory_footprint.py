@@ -0,0 +1,88 @@
+"""
+Compare the per-memory footprint of MemoryBank against the old list-of-models layout.
+
+The old layout kept one pydantic ``Memory`` per entry, with its embedding as a list
+of Python floats, plus a second copy of every vector inside an ``IndexFlatL2``:
+
+    python benchmarks/bench_memory_footprint.py --items 5000 --dim 1536
+"""
+import argparse
+import asyncio
+import tracemalloc
+from typing import List
+
+import faiss
+import numpy as np
+
+from echoforgeai.memory.embeddings import Embedder
+from echoforgeai.memory.vector_store import Memory, MemoryBank
+
+
+class MatrixEmbedder(Embedder):
+    """Serves rows of a precomputed matrix for texts of the form "<i>: ..."."""
+    model = "matrix"
+
+    def __init__(self, vectors: np.ndarray):
+        self.dim = vectors.shape[1]
+        self.vectors = vectors
+
+    async def embed(self, texts: List[str]) -> np.ndarray:
+        return self.vectors[[int(t.split(":", 1)[0]) for t in texts]]
+
+
+def sample_metadata(i: int) -> dict:
+    return {"character": f"npc {i % 10}", "type": "learned_knowledge", "importance": 0.5}
+
+
+def legacy_bytes(contents: List[str], vectors: np.ndarray) -> int:
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    memories = [
+        Memory(content=c, metadata=sample_metadata(i), embedding=v.tolist())
+        for i, (c, v) in enumerate(zip(contents, vectors))
+    ]
+    python_bytes = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+
+    index = faiss.IndexFlatL2(vectors.shape[1])
+    index.add(vectors)
+    del memories
+    return python_bytes + index.ntotal * index.d * 4  # FAISS memory is not traced
+
+
+async def bank_bytes(contents: List[str], vectors: np.ndarray) -> int:
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    bank = MemoryBank(
+        embedding_dim=vectors.shape[1],
+        max_items=len(contents),
+        embedder=MatrixEmbedder(vectors)
+    )
+    await bank.store_many(contents, [sample_metadata(i) for i in range(len(contents))])
+    await asyncio.sleep(0)  # Let finished embedding batches release their buffers
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return used
+
+
+async def run(args: argparse.Namespace) -> None:
+    vectors = np.random.default_rng(0).random((args.items, args.dim), dtype=np.float32)
+    contents = [f"{i}: The patron mentions rumour number {i % 500}" for i in range(args.items)]
+
+    legacy = legacy_bytes(contents, vectors) / args.items
+    columnar = await bank_bytes(contents, vectors) / args.items
+    print(f"{args.items} memories, dim={args.dim}")
+    print(f"list of models: {legacy / 1024:8.1f} KiB/memory")
+    print(f"columnar bank:  {columnar / 1024:8.1f} KiB/memory")
+    print(f"reduction:      {legacy / columnar:8.1f}x")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--items", type=int, default=5000)
+    parser.add_argument("--dim", type=int, default=1536)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
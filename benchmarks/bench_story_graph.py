@@ -0,0 +1,147 @@
+"""
+Compare peak memory and traversal speed of the StoryGraph node backends.
+
+Builds a synthetic pre-authored world (every node with a few branches, titles
+and tags drawn from small vocabularies) in a fresh process per backend, so the
+peak RSS of each is measured on its own:
+
+    python benchmarks/bench_story_graph.py --nodes 500000
+
+Traversal is timed through the graph API (``get_node`` and ``branches``, which
+builds a view per node on the compact backend), through each backend's native
+layout (the dict of models, or integer handles over the CSR arrays), and for
+parent lookups via ``get_previous_node``.
+"""
+import argparse
+import multiprocessing
+import random
+import resource
+import time
+from collections import deque
+from uuid import UUID
+
+import numpy as np
+
+from echoforgeai.graph.node_store import CompactNodeStore
+from echoforgeai.graph.story_graph import StoryGraph, StoryNode
+
+
+def peak_rss_mib() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # KiB on Linux
+
+
+def node_id(ids: np.ndarray, i: int) -> UUID:
+    return UUID(bytes=ids[i].tobytes())
+
+
+def build(args: argparse.Namespace, ids: np.ndarray) -> StoryGraph:
+    rng = random.Random(0)
+    graph = StoryGraph(backend=args.backend)
+    for i in range(args.nodes):
+        targets = [rng.randrange(args.nodes) for _ in range(args.branches)]
+        graph.add_node(StoryNode(
+            id=node_id(ids, i),
+            title=f"{rng.choice(['Corridor', 'Hall', 'Cellar', 'Tower', 'Glade'])} {rng.randrange(200)}",
+            content=f"Scene {i}. " + "The torches gutter as you pass. " * rng.randint(2, 8),
+            tags={f"tag {rng.randrange(50)}" for _ in range(3)},
+            branches={f"choice {k}": node_id(ids, t) for k, t in enumerate(targets)},
+            is_entry_point=i == 0,
+            depth=i % 100
+        ))
+    if isinstance(graph.nodes, CompactNodeStore):
+        graph.nodes.pack()
+    return graph
+
+
+def api_traversal(graph: StoryGraph, limit: int) -> float:
+    """Breadth-first walk through ``get_node``; returns nodes per second."""
+    start = time.perf_counter()
+    seen = {graph.get_entry_node().id}
+    queue = deque(seen)
+    while queue and len(seen) < limit:
+        node = graph.get_node(queue.popleft())
+        for target in node.branches.values():
+            if target not in seen:
+                seen.add(target)
+                queue.append(target)
+    return len(seen) / (time.perf_counter() - start)
+
+
+def native_traversal(graph: StoryGraph) -> float:
+    """Breadth-first walk over the whole graph in the backend's own layout; returns nodes per second."""
+    start = time.perf_counter()
+    if isinstance(graph.nodes, CompactNodeStore):
+        store = graph.nodes
+        seen = np.zeros(len(store._hi), dtype=bool)
+        frontier = np.array([store.handle_of(graph.get_entry_node().id)])
+        seen[frontier] = True
+        count = 1
+        while len(frontier):
+            starts, ends = store._branch_ptr[frontier], store._branch_ptr[frontier + 1]
+            edges = np.concatenate([np.arange(s, e) for s, e in zip(starts, ends)])
+            children = np.unique(store._branch_handle[edges])
+            frontier = children[(children >= 0) & ~seen[np.maximum(children, 0)]]
+            seen[frontier] = True
+            count += len(frontier)
+    else:
+        nodes = graph.nodes
+        seen = {graph.get_entry_node().id}
+        queue = deque(seen)
+        while queue:
+            for target in nodes[queue.popleft()].branches.values():
+                if target not in seen and target in nodes:
+                    seen.add(target)
+                    queue.append(target)
+        count = len(seen)
+    return count / (time.perf_counter() - start)
+
+
+def parent_lookups(graph: StoryGraph, ids: np.ndarray, n: int) -> float:
+    """Microseconds per ``get_previous_node``."""
+    picks = [node_id(ids, i) for i in random.Random(1).sample(range(len(ids)), n)]
+    start = time.perf_counter()
+    for target in picks:
+        graph.get_previous_node(target)
+    return 1e6 * (time.perf_counter() - start) / n
+
+
+def measure(args: argparse.Namespace) -> dict:
+    ids = np.frombuffer(np.random.default_rng(0).bytes(16 * args.nodes), dtype="V16")
+    baseline = peak_rss_mib()
+    start = time.perf_counter()
+    graph = build(args, ids)
+    build_seconds = time.perf_counter() - start
+    rss = peak_rss_mib() - baseline
+    return {
+        "build_s": build_seconds,
+        "rss_mib": rss,
+        "bytes_per_node": rss * 2 ** 20 / args.nodes,
+        "api_nodes_s": api_traversal(graph, args.api_limit),
+        "native_nodes_s": native_traversal(graph),
+        "parent_us": parent_lookups(graph, ids, args.lookups)
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--nodes", type=int, default=200000)
+    parser.add_argument("--branches", type=int, default=3)
+    parser.add_argument("--api-limit", type=int, default=50000, help="Nodes visited through get_node")
+    parser.add_argument("--lookups", type=int, default=10000)
+    args = parser.parse_args()
+
+    print(f"{args.nodes} nodes, {args.branches} branches each")
+    print(f"{'backend':>8} {'build s':>8} {'peak MiB':>9} {'B/node':>7} {'api n/s':>10} {'native n/s':>11} {'parent us':>10}")
+    context = multiprocessing.get_context("spawn")
+    for backend in ["dict", "compact"]:
+        args.backend = backend
+        with context.Pool(1) as pool:
+            r = pool.apply(measure, (args,))
+        print(
+            f"{backend:>8} {r['build_s']:>8.1f} {r['rss_mib']:>9.0f} {r['bytes_per_node']:>7.0f} "
+            f"{r['api_nodes_s']:>10.0f} {r['native_nodes_s']:>11.0f} {r['parent_us']:>10.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -5,7 +5,7 @@ from typing import Dict, List, Optional
 from pydantic import BaseModel, Field
 from datetime import datetime
 
-from echoforgeai.memory.vector_store import MemoryBank
+from echoforgeai.memory.vector_store import MemoryBank, RetrievalWeights
 from echoforgeai.core.llm_service import LLMService
 
 
@@ -54,7 +54,12 @@ class Character:
         self._initial_knowledge = initial_knowledge or []
         
     def bind_memory_bank(self, memory_bank: MemoryBank) -> None:
-        """Bind a memory bank to this character and initialize their knowledge."""
+        """
+        Bind a memory bank to this character and initialize their knowledge.
+        
+        Embeds synchronously, so the bank's embedder must support ``embed_sync``;
+        use ``bind_memory_bank_async`` from async code.
+        """
         self._memory = memory_bank
         # Store initial knowledge
         for knowledge in self._initial_knowledge:
@@ -63,6 +68,19 @@ class Character:
                 metadata={"character": self.name, "type": "initial_knowledge"}
             )
             
+    async def bind_memory_bank_async(self, memory_bank: MemoryBank) -> None:
+        """Bind a memory bank to this character, storing their knowledge in one embeddings batch."""
+        self._memory = memory_bank
+        await self._memory.store_many(
+            self._initial_knowledge,
+            [{"character": self.name, "type": "initial_knowledge"} for _ in self._initial_knowledge]
+        )
+            
+    @property
+    def memory_filter(self) -> dict:
+        """Metadata filter selecting this character's memories in a shared bank."""
+        return {"character": self.name}
+            
     def bind_llm_service(self, llm_service: LLMService) -> None:
         """Bind an LLM service to this character."""
         self._llm = llm_service
@@ -84,7 +102,7 @@ class Character:
         Returns:
             Generated dialogue string
         """
-        if not self._memory:
+        if self._memory is None:
             raise RuntimeError("Character must be bound to a memory bank before speaking")
         if not self._llm:
             raise RuntimeError("Character must be bound to an LLM service before speaking")
@@ -92,7 +110,7 @@ class Character:
         # Retrieve relevant memories
         memories = await self._memory.retrieve_relevant(
             topic,
-            filter_metadata={"character": self.name}
+            filter_metadata=self.memory_filter
         )
         
         # Generate dialogue using LLM
@@ -141,7 +159,7 @@ class Character:
         
     async def learn(self, knowledge: str, importance: float = 0.5) -> None:
         """Add new knowledge to the character's memory."""
-        if not self._memory:
+        if self._memory is None:
             raise RuntimeError("Character must be bound to a memory bank before learning")
             
         await self._memory.store(
@@ -155,12 +173,12 @@ class Character:
         
     async def recall(self, query: str, limit: int = 5) -> List[str]:
         """Retrieve relevant memories for this character."""
-        if not self._memory:
+        if self._memory is None:
             raise RuntimeError("Character must be bound to a memory bank before recalling")
             
         memories = await self._memory.retrieve_relevant(
             query,
-            filter_metadata={"character": self.name},
+            filter_metadata=self.memory_filter,
             limit=limit
         )
         return [m.content for m in memories]
@@ -183,22 +201,26 @@ class Character:
             initial_knowledge=state["initial_knowledge"]
         )
 
-    async def get_contextual_memories(self, query: str, recent_weight=0.3) -> List[str]:
-        """Get memories with recency weighting"""
-        memories = await self.recall(query)
-        if not memories:
-            return []
+    async def get_contextual_memories(
+        self,
+        query: str,
+        recent_weight: float = 0.3,
+        importance_weight: float = 0.3,
+        limit: int = 5
+    ) -> List[str]:
+        """Get this character's memories ranked by relevance, recency and importance"""
+        if self._memory is None:
+            raise RuntimeError("Character must be bound to a memory bank before recalling")
             
-        # Apply recency weighting
-        sorted_memories = sorted(
-            self._memory.memories,
-            key=lambda m: m.timestamp,
-            reverse=True
-        )[:len(memories)]
-        
+        memories = await self._memory.retrieve_relevant(
+            query,
+            filter_metadata=self.memory_filter,
+            limit=limit,
+            weights=RetrievalWeights(recency=recent_weight, importance=importance_weight)
+        )
         return [
             f"{m.content} ({(datetime.now() - m.timestamp).days} days ago)"
-            for m in sorted_memories
+            for m in memories
         ]
 
     async def generate_dialogue_prompt(self, situation: str) -> str:
@@ -16,6 +16,7 @@ class LLMResponse(BaseModel):
     metadata: Dict[str, Any] = Field(default_factory=dict)
     dialogues: Dict[str, str] = Field(default_factory=dict)  # {character_name: dialogue_text}
     internal_monologues: Dict[str, str] = Field(default_factory=dict)  # Add internal thoughts
+    usage: Dict[str, int] = Field(default_factory=dict)  # Token counts reported by the API
 
     class Config:
         arbitrary_types_allowed = True
@@ -142,6 +143,12 @@ You are a professional novelist crafting an immersive story experience. Below is
         # Parse the response
         try:
             result = json.loads(response.choices[0].message.content)
+            if response.usage is not None:
+                result["usage"] = {
+                    "prompt_tokens": response.usage.prompt_tokens,
+                    "completion_tokens": response.usage.completion_tokens,
+                    "total_tokens": response.usage.total_tokens
+                }
             return LLMResponse(**result)
         except Exception as e:
             raise ValueError(f"Failed to parse LLM response: {e}")
@@ -216,6 +223,43 @@ Generate dialogue that:
         )
         return response.data[0].embedding 
 
+    @retry(stop=stop_after_attempt(3), wait=wait_exponential(min=1, max=10))
+    async def generate_embeddings(
+        self,
+        texts: List[str],
+        model: str = "text-embedding-3-small",
+        dimensions: Optional[int] = None
+    ) -> List[List[float]]:
+        """Generate embeddings for a batch of texts in a single request, optionally shortened."""
+        if self.debug_mode:
+            self.logger.debug(f"Embedding batch of {len(texts)} texts")
+            
+        options = {"dimensions": dimensions} if dimensions else {}
+        response = await self.client.embeddings.create(
+            model=model,
+            input=texts,
+            **options
+        )
+        # The API may return items out of order, so sort by their input index
+        return [item.embedding for item in sorted(response.data, key=lambda d: d.index)]
+
+    @retry(stop=stop_after_attempt(3), wait=wait_exponential(min=1, max=10))
+    async def summarize(self, text: str) -> str:
+        """Condense a run of story memories into one short memory."""
+        response = await self.client.chat.completions.create(
+            model="gpt-4-turbo-preview",
+            messages=[
+                {"role": "system", "content": "You are a careful chronicler of the story so far."},
+                {
+                    "role": "user",
+                    "content": "Summarize these memories in 2-3 sentences, keeping names, "
+                               f"key events and relationships:\n\n{text}"
+                }
+            ],
+            temperature=0.3
+        )
+        return response.choices[0].message.content.strip()
+
     async def generate_story_beat(self, context: Dict) -> LLMResponse:
         """Enhanced context handling"""
         prompt_template = """
@@ -260,9 +304,14 @@ Generate dialogue that:
         personality: dict,
         current_scene: str,
         relevant_memories: List[str],
-        relationships: Dict[str, float]
+        relationships: Dict[str, float],
+        usage: Optional[Dict[str, int]] = None
     ) -> str:
-        """Generate a character's internal monologue about the current situation."""
+        """
+        Generate a character's internal monologue about the current situation.
+        
+        The call's token counts are added to ``usage`` when it is given.
+        """
         memory_context = "\n".join(f"- {m}" for m in relevant_memories)
         relationship_context = "\n".join([f"{name}: {sentiment}" for name, sentiment in relationships.items()])
         
@@ -295,4 +344,7 @@ Generate dialogue that:
             ],
             temperature=0.5
         )
+        if usage is not None and response.usage is not None:
+            for key in ("prompt_tokens", "completion_tokens", "total_tokens"):
+                usage[key] = usage.get(key, 0) + getattr(response.usage, key)
         return response.choices[0].message.content.strip() 
\ No newline at end of file
@@ -0,0 +1,127 @@
+"""
+Speculative execution of the player's likely next inputs.
+"""
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional
+
+logger = logging.getLogger("echoforgeai.speculation")
+
+
+class Speculator:
+    """
+    Runs ``generate(choice)`` for the first ``max_choices`` offered choices in
+    background tasks while the player decides, so that picking one of them is
+    served from its finished (or already running) task.
+
+    At most ``max_concurrency`` speculations run at once. ``cost`` reports the
+    tokens a result used; once a round has spent ``token_budget`` tokens, its
+    queued speculations are skipped. When the player picks, the other
+    speculations of the round are cancelled, and the tokens of those that had
+    already finished are counted as wasted.
+    """
+
+    def __init__(
+        self,
+        generate: Callable[[str], Awaitable[Any]],
+        max_choices: int = 3,
+        max_concurrency: int = 2,
+        token_budget: Optional[int] = None,
+        cost: Callable[[Any], int] = lambda result: 0
+    ):
+        self.generate = generate
+        self.max_choices = max_choices
+        self.token_budget = token_budget
+        self.cost = cost
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._key: Optional[Hashable] = None
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._spent = 0  # Tokens used by the current round
+        self.rounds = 0
+        self.launched = 0
+        self.skipped = 0  # Queued speculations dropped by the token budget
+        self.hits = 0
+        self.misses = 0
+        self.cancelled = 0  # Speculations stopped before they finished
+        self.used_tokens = 0
+        self.wasted_tokens = 0
+
+    @staticmethod
+    def _normalize(choice: str) -> str:
+        return " ".join(choice.split()).casefold()
+
+    def speculate(self, key: Hashable, choices: List[str]) -> None:
+        """Start a new round for the choices offered at ``key``, cancelling the previous one."""
+        self.cancel()
+        self._key = key
+        self._spent = 0
+        self.rounds += 1
+        for choice in choices[:self.max_choices]:
+            normalized = self._normalize(choice)
+            if normalized not in self._tasks:
+                self._tasks[normalized] = asyncio.ensure_future(self._run(choice))
+                self.launched += 1
+
+    async def _run(self, choice: str) -> Any:
+        async with self._semaphore:
+            if self.token_budget is not None and self._spent >= self.token_budget:
+                self.skipped += 1
+                return None
+            result = await self.generate(choice)
+            self._spent += self.cost(result)
+            return result
+
+    async def take(self, key: Hashable, choice: str) -> Optional[Any]:
+        """
+        The speculated result for ``choice`` at ``key``, or None if there is none.
+
+        Ends the round: every other speculation is cancelled.
+        """
+        if not self._tasks:
+            return None
+        task = self._tasks.pop(self._normalize(choice), None) if key == self._key else None
+        self.cancel()
+        result = None
+        if task is not None:
+            try:
+                result = await task
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.warning("Speculation for %r failed", choice, exc_info=True)
+        if result is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.used_tokens += self.cost(result)
+        return result
+
+    def cancel(self) -> None:
+        """Cancel the current round."""
+        for task in self._tasks.values():
+            if not task.done():
+                task.cancel()
+                self.cancelled += 1
+            elif not task.cancelled() and task.exception() is None and task.result() is not None:
+                self.wasted_tokens += self.cost(task.result())
+        self._tasks.clear()
+        self._key = None
+
+    @property
+    def hit_rate(self) -> float:
+        picks = self.hits + self.misses
+        return self.hits / picks if picks else 0.0
+
+    def stats(self) -> dict:
+        """Counters for tuning how much to speculate."""
+        return {
+            "rounds": self.rounds,
+            "launched": self.launched,
+            "skipped": self.skipped,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hit_rate,
+            "cancelled": self.cancelled,
+            "used_tokens": self.used_tokens,
+            "wasted_tokens": self.wasted_tokens
+        }
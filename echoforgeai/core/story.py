@@ -1,16 +1,25 @@
 """
 Core Story class that serves as the main entry point for HearthKin 2.
 """
-from typing import Dict, List, Optional, Union, UUID
+from typing import Dict, List, Optional, Union
 import logging
-from pydantic import BaseModel
-from uuid import uuid4
+from pydantic import BaseModel, Field
+from uuid import UUID, uuid4
 from datetime import datetime
+from pathlib import Path
 
-from echoforgeai.graph.story_graph import StoryGraph, StoryNode
-from echoforgeai.memory.vector_store import MemoryBank
+from echoforgeai.graph.story_graph import NodeArchive, StoryGraph, StoryNode
+from echoforgeai.memory.vector_store import Memory, MemoryBank
+from echoforgeai.memory.embeddings import Embedder, HashingEmbedder, LLMEmbedder
+from echoforgeai.memory.embedding_cache import EmbeddingCache
+from echoforgeai.memory.index_backends import IndexConfig
+from echoforgeai.memory.concurrency import shared_executor
+from echoforgeai.memory.consolidation import ColdArchive, MemoryConsolidator
+from echoforgeai.memory.service import MemoryService
+from echoforgeai.memory.summarizers import LLMSummarizer
 from echoforgeai.core.character import Character
-from echoforgeai.core.llm_service import LLMService
+from echoforgeai.core.llm_service import LLMResponse, LLMService
+from echoforgeai.core.speculation import Speculator
 
 
 class StoryConfig(BaseModel):
@@ -18,35 +27,125 @@ class StoryConfig(BaseModel):
     title: str
     description: Optional[str] = None
     default_llm_provider: str = "openai"
-    memory_backend: str = "faiss"
+    memory_backend: str = "faiss"  # "flat" (alias "faiss"), "ivf", "hnsw" or "ivfpq"
+    memory_index: IndexConfig = Field(default_factory=IndexConfig)
     enable_multimodal: bool = False
     enable_critique: bool = True
     max_memory_items: int = 1000
+    embedding_provider: str = "openai"  # "openai", or "hashing" for a local deterministic embedder
+    embedding_model: str = "text-embedding-3-small"
+    embedding_dim: int = 1536
+    memory_vector_dim: Optional[int] = None  # Store embeddings truncated and renormalized to this size, e.g. 256 or 512
+    memory_vector_dtype: str = "float32"  # "float32", "float16" or "int8" (scalar-quantized)
+    embedding_batch_size: int = 64  # Max texts per embeddings request
+    embedding_batch_wait: float = 0.005  # Seconds to wait for a batch to fill
+    embedding_cache_size: int = 0  # In-memory LRU entries, e.g. 4096; 0 (without embedding_cache_dir) disables the cache
+    embedding_cache_dir: Optional[str] = None  # Persist cached embeddings across restarts
+    memory_threads: int = 0  # Shared thread pool for index work; 0 runs it on the event loop
+    memory_dedup_threshold: Optional[float] = None  # Cosine similarity at which memories merge, e.g. 0.97; None keeps every memory
+    memory_hybrid_search: bool = False  # Fuse BM25 keyword matches into vector retrieval
+    memory_consolidation: bool = False  # Summarize the oldest memories with the LLM as the bank fills up
+    memory_archive_dir: Optional[str] = None  # Keep consolidated raw memories on disk
+    memory_max_distance: Optional[float] = None  # Leave out memories farther than this (squared L2) from the query
+    memory_result_cache_size: int = 0  # Retrieval results reused until the bank changes, e.g. 1024; 0 disables
+    memory_wal_dir: Optional[str] = None  # Log memories here, one subdirectory per story, and recover them on restart
+    graph_backend: str = "dict"  # "dict", or "compact" for packed storage of very large pre-authored graphs
+    graph_archive_dir: Optional[str] = None  # Keep finalized story nodes on disk, one subdirectory per story
+    speculative_choices: int = 0  # Pre-generate the beats of this many offered choices while the player reads; 0 disables
+    speculation_concurrency: int = 2  # Speculative beats generated at once
+    speculation_token_budget: Optional[int] = None  # Max tokens spent on speculation per turn
     api_key: Optional[str] = None
     debug_mode: bool = False
     debug_level: str = "INFO"
 
 
+class TurnDraft(BaseModel):
+    """Everything generated for a player input before the story state is changed."""
+    relevant_memories: List[Memory]
+    recalled: Dict[str, List[Memory]]
+    internal_monologues: Dict[str, str]
+    llm_response: LLMResponse
+    reflection_usage: Dict[str, int] = Field(default_factory=dict)  # Tokens of the character reflections
+    
+    @property
+    def tokens(self) -> int:
+        return self.llm_response.usage.get("total_tokens", 0) + self.reflection_usage.get("total_tokens", 0)
+
+
+def _remap_memory_ids(graph_state: dict, id_map: Dict[int, int]) -> dict:
+    """A copy of an exported graph whose node ``memory_ids`` use the new ids, dropping unmapped ones."""
+    def remap(nodes: dict) -> dict:
+        return {
+            node_id: {**data, "memory_ids": [id_map[i] for i in data.get("memory_ids", []) if i in id_map]}
+            for node_id, data in nodes.items()
+        }
+    return {
+        **graph_state,
+        "nodes": remap(graph_state["nodes"]),
+        "archived_nodes": remap(graph_state.get("archived_nodes", {}))
+    }
+
+
 class Story:
     """
     Main story controller that manages the narrative flow, characters, and story state.
+    
+    With ``speculative_choices`` set, the beats for the first choices offered are
+    drafted in the background while the player reads; picking one of them skips
+    the LLM round-trip. ``speculation_stats`` reports hits and wasted tokens.
     """
     
-    def __init__(self, config: StoryConfig):
-        """Initialize a new story with the given configuration."""
+    def __init__(
+        self,
+        config: StoryConfig,
+        memory_service: Optional[MemoryService] = None,
+        story_id: Optional[UUID] = None
+    ):
+        """
+        Initialize a new story with the given configuration.
+        
+        Stories given a ``memory_service`` keep their memories there, as a tenant
+        identified by the story id, instead of owning a private memory bank.
+        """
         self.config = config
-        self.graph = StoryGraph()
-        self.narrative_memory = MemoryBank(
-            backend=config.memory_backend,
-            max_items=config.max_memory_items
-        )
-        self.characters: Dict[str, Character] = {}
-        self.current_node: Optional[StoryNode] = None
+        self.id = story_id or uuid4()  # Add unique identifier
         self.llm = LLMService(
             provider=config.default_llm_provider,
             api_key=config.api_key,
             debug_mode=config.debug_mode
         )
+        self.graph = StoryGraph(
+            summarizer=LLMSummarizer(self.llm),
+            archive=NodeArchive(
+                Path(config.graph_archive_dir) / str(self.id) if config.graph_archive_dir else None
+            ),
+            backend=config.graph_backend
+        )
+        self.memory_service = memory_service
+        self.consolidator: Optional[MemoryConsolidator] = None
+        if memory_service is not None:
+            # Shared banks enforce per-tenant quotas instead of consolidating
+            self.narrative_memory = memory_service.tenant(self.id, quota=config.max_memory_items)
+        else:
+            self.narrative_memory = self._create_memory_bank(config)
+            if config.memory_wal_dir:
+                self.narrative_memory.open_log(Path(config.memory_wal_dir) / str(self.id))
+            if config.memory_consolidation:
+                self.consolidator = MemoryConsolidator(
+                    self.narrative_memory,
+                    archive=ColdArchive(config.memory_archive_dir) if config.memory_archive_dir else None
+                )
+        self.characters: Dict[str, Character] = {}
+        self.current_node: Optional[StoryNode] = None
+        self.speculator: Optional[Speculator] = None
+        if config.speculative_choices:
+            self.speculator = Speculator(
+                self._draft,
+                max_choices=config.speculative_choices,
+                max_concurrency=config.speculation_concurrency,
+                token_budget=config.speculation_token_budget,
+                cost=lambda draft: draft.tokens
+            )
         
         # Set up logging if debug mode is enabled
         if config.debug_mode:
@@ -63,13 +162,50 @@ class Story:
         self.active_players: Dict[str, UUID] = {}  # player_id -> current_node_id
         self.player_sessions: Dict[str, dict] = {}  # Session state for each player
         
-        self.id = uuid4()  # Add unique identifier
         self.created_at = datetime.now()
         
+    def _create_memory_bank(self, config: StoryConfig) -> MemoryBank:
+        """Build the story's private memory bank."""
+        return MemoryBank(
+            backend=config.memory_backend,
+            embedding_dim=config.memory_vector_dim or config.embedding_dim,
+            vector_dtype=config.memory_vector_dtype,
+            max_items=config.max_memory_items,
+            index_config=config.memory_index,
+            embedder=self._create_embedder(config),
+            max_batch_size=config.embedding_batch_size,
+            max_batch_wait=config.embedding_batch_wait,
+            embedding_cache=EmbeddingCache(
+                max_entries=config.embedding_cache_size,
+                path=config.embedding_cache_dir
+            ) if config.embedding_cache_size or config.embedding_cache_dir else None,
+            executor=shared_executor(config.memory_threads) if config.memory_threads else None,
+            dedup_threshold=config.memory_dedup_threshold,
+            hybrid=config.memory_hybrid_search,
+            result_cache_size=config.memory_result_cache_size,
+            max_distance=config.memory_max_distance,
+            summarizer=LLMSummarizer(self.llm)
+        )
+
+    def _create_embedder(self, config: StoryConfig) -> Embedder:
+        """Build the embedder selected by ``config.embedding_provider``."""
+        if config.embedding_provider == "hashing":
+            # Hashed features have no leading components to keep; hash straight into the smaller space
+            return HashingEmbedder(config.memory_vector_dim or config.embedding_dim)
+        if config.embedding_provider == "openai":
+            # The API shortens and renormalizes the vectors itself
+            return LLMEmbedder(
+                self.llm,
+                model=config.embedding_model,
+                dim=config.embedding_dim,
+                dimensions=config.memory_vector_dim
+            )
+        raise ValueError(f"Unsupported embedding provider: {config.embedding_provider}")
+
     async def add_character(self, character: Character) -> None:
         """Add a character to the story."""
         self.characters[character.name] = character
-        character.bind_memory_bank(self.narrative_memory)
+        await character.bind_memory_bank_async(self.narrative_memory)
         character.bind_llm_service(self.llm)
         
     async def advance(self, user_input: str) -> dict:
@@ -83,41 +219,15 @@ class Story:
         if self.config.debug_mode:
             self.logger.debug(f"Advancing story with user input: {user_input}")
             
-        # Retrieve relevant memories
-        relevant_memories = await self.narrative_memory.retrieve_relevant(user_input)
-        if self.config.debug_mode:
-            self.logger.debug(f"Retrieved {len(relevant_memories)} relevant memories")
-            
-        # Get character contexts
-        character_contexts = {
-            name: char.get_context()
-            for name, char in self.characters.items()
-        }
-        if self.config.debug_mode:
-            self.logger.debug(f"Character contexts: {list(character_contexts.keys())}")
-        
-        # Generate character reflections
-        internal_monologues = {}
-        for name, char in self.characters.items():
-            char_memories = await char.recall(user_input)
-            internal_monologues[name] = await self.llm.generate_character_reflection(
-                character_name=name,
-                personality=char.personality.model_dump(),
-                current_scene=self.current_node.content if self.current_node else "",
-                relevant_memories=char_memories,
-                relationships=char.personality.relationships
-            )
+        draft = None
+        if self.speculator is not None:
+            draft = await self.speculator.take(self.current_node.id, user_input)
             if self.config.debug_mode:
-                self.logger.debug(f"{name} internal monologue: {internal_monologues[name]}")
-        
-        # Pass monologues to story beat generation
-        llm_response = await self.llm.generate_story_beat(
-            current_content=self.current_node.content,
-            user_input=user_input,
-            memories=[m.content for m in relevant_memories],
-            character_contexts=character_contexts,
-            internal_monologues=internal_monologues
-        )
+                self.logger.debug(f"Speculated beat {'hit' if draft else 'missed'} for: {user_input}")
+        if draft is None:
+            draft = await self._draft(user_input)
+        relevant_memories = draft.relevant_memories
+        llm_response = draft.llm_response
         
         # Update character states based on metadata
         if llm_response.metadata.get("character_updates"):
@@ -143,12 +253,22 @@ class Story:
             self.logger.debug(f"Advanced to new story node: {next_beat.next_node.id}")
         
         # Store new memories from this interaction
-        await self.narrative_memory.store(next_beat.to_memory())
+        memory_id = await self.narrative_memory.store(
+            next_beat.to_memory(),
+            {"type": "story_beat"}
+        )
+        if memory_id >= 0:
+            next_beat.next_node.memory_ids.append(memory_id)
+            self.graph.save_node(next_beat.next_node)
         if self.config.debug_mode:
             self.logger.debug("Stored new memory from interaction")
+        if self.consolidator is not None:
+            self.consolidator.schedule()
         
         if self.config.debug_mode:
             self.logger.debug(f"Character Contexts:\n{self._get_character_context_debug()}")
+        if self.speculator is not None:
+            self.speculator.speculate(self.current_node.id, next_beat.available_choices)
         
         return {
             "text": next_beat.text,
@@ -156,10 +276,66 @@ class Story:
             "generated_content": next_beat.generated_content
         }
         
+    async def _draft(self, user_input: str) -> TurnDraft:
+        """Retrieve memories and generate the reflections and beat for an input, without applying them."""
+        # Retrieve narrative memories and every character's recall in one batched search
+        names = list(self.characters)
+        retrieved = await self.narrative_memory.retrieve_many(
+            [user_input] * (len(names) + 1),
+            [None] + [self.characters[name].memory_filter for name in names],
+            max_distance=self.config.memory_max_distance
+        )
+        relevant_memories = retrieved[0]
+        recalled = dict(zip(names, retrieved[1:]))
+        if self.config.debug_mode:
+            self.logger.debug(f"Retrieved {len(relevant_memories)} relevant memories")
+            
+        # Get character contexts
+        character_contexts = {
+            name: char.get_context()
+            for name, char in self.characters.items()
+        }
+        if self.config.debug_mode:
+            self.logger.debug(f"Character contexts: {list(character_contexts.keys())}")
+        
+        # Generate character reflections
+        internal_monologues = {}
+        reflection_usage: Dict[str, int] = {}
+        for name, char in self.characters.items():
+            internal_monologues[name] = await self.llm.generate_character_reflection(
+                character_name=name,
+                personality=char.personality.model_dump(),
+                current_scene=self.current_node.content if self.current_node else "",
+                relevant_memories=[m.content for m in recalled[name]],
+                relationships=char.personality.relationships,
+                usage=reflection_usage
+            )
+            if self.config.debug_mode:
+                self.logger.debug(f"{name} internal monologue: {internal_monologues[name]}")
+        
+        # Pass monologues to story beat generation
+        llm_response = await self.llm.generate_story_beat(
+            current_content=self.current_node.content,
+            user_input=user_input,
+            memories=[m.content for m in relevant_memories],
+            character_contexts=character_contexts,
+            chapter_summaries=self.graph.chapter_summaries,
+            internal_monologues=internal_monologues
+        )
+        return TurnDraft(
+            relevant_memories=relevant_memories,
+            recalled=recalled,
+            internal_monologues=internal_monologues,
+            llm_response=llm_response,
+            reflection_usage=reflection_usage
+        )
+        
     async def start(self, entry_node_id: Optional[str] = None) -> dict:
         """Start the story from the specified entry node or the default start node."""
         self.current_node = self.graph.get_entry_node(entry_node_id)
         initial_beat = await self.graph.get_initial_beat(self.current_node)
+        if self.speculator is not None:
+            self.speculator.speculate(self.current_node.id, initial_beat.available_choices)
         
         return {
             "text": initial_beat.text,
@@ -167,6 +343,10 @@ class Story:
             "generated_content": initial_beat.generated_content
         }
         
+    def speculation_stats(self) -> dict:
+        """Hit rate and token counters of speculative pre-generation; empty when it is off."""
+        return self.speculator.stats() if self.speculator is not None else {}
+        
     def save_state(self) -> dict:
         """Save the current story state."""
         return {
@@ -183,17 +363,19 @@ class Story:
         }
         
     @classmethod
-    async def load_state(cls, state: dict) -> "Story":
+    async def load_state(cls, state: dict, memory_service: Optional[MemoryService] = None) -> "Story":
         """Load a story from a saved state."""
         config = StoryConfig(**state["config"])
-        story = cls(config)
+        story = cls(config, memory_service=memory_service, story_id=UUID(state["story_id"]))
         
-        story.id = UUID(state["story_id"])
         story.created_at = datetime.fromisoformat(state["created_at"])
         
-        # Restore state
-        await story.narrative_memory.import_state(state["narrative_memory"])
-        await story.graph.import_state(state["graph"])
+        # Restore state; a shared memory service numbers the memories anew
+        id_map = await story.narrative_memory.import_state(state["narrative_memory"])
+        graph_state = state["graph"]
+        if id_map is not None:
+            graph_state = _remap_memory_ids(graph_state, id_map)
+        await story.graph.import_state(graph_state)
         
         # Restore characters
         for char_name, char_state in state["characters"].items():
@@ -0,0 +1,482 @@
+"""
+Storage backends for the nodes of a story graph.
+"""
+import copy
+from collections import Counter
+from collections.abc import MutableMapping
+from typing import TYPE_CHECKING, Dict, Iterable, Iterator, List, Tuple, Type
+from uuid import UUID
+
+import numpy as np
+
+if TYPE_CHECKING:
+    from echoforgeai.graph.story_graph import StoryNode
+
+NODE_BACKENDS = ("dict", "compact")
+
+# Fields kept per node only when they differ from their defaults
+_EXTRA_FIELDS = (
+    "requirements", "user_input", "hidden_requirements", "player_inputs",
+    "collaborative_context", "memory_ids"
+)
+
+
+def _split_ids(ids: Iterable[UUID]) -> Tuple[np.ndarray, np.ndarray]:
+    """High and low 64 bits of UUIDs."""
+    words = np.frombuffer(b"".join(u.bytes for u in ids), dtype=">u8").reshape(-1, 2)
+    return words[:, 0].astype(np.uint64), words[:, 1].astype(np.uint64)
+
+
+def _words(node_id: UUID) -> Tuple[np.uint64, np.uint64]:
+    """High and low 64 bits of one UUID."""
+    return np.uint64(node_id.int >> 64), np.uint64(node_id.int & 0xFFFFFFFFFFFFFFFF)
+
+
+def _join_id(hi: int, lo: int) -> UUID:
+    return UUID(int=(int(hi) << 64) | int(lo))
+
+
+def _relink(store, source_id: UUID, old_targets: Iterable[UUID], new_targets: Iterable[UUID]) -> None:
+    """Move a node's reverse edges from its old branch targets to its new ones."""
+    old, new = Counter(old_targets), Counter(new_targets)
+    for target_id, count in (old - new).items():
+        for _ in range(count):
+            store.unlink(source_id, target_id)
+    for target_id, count in (new - old).items():
+        for _ in range(count):
+            store.link(source_id, target_id)
+
+
+class DictNodeStore(dict):
+    """
+    The default backend: a dict of ``StoryNode`` models, plus the reverse edges
+    as a dict of lists.
+
+    Storing or deleting a node moves its reverse edges to match its branches,
+    including branches changed in place since it was last stored.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._parents: Dict[UUID, List[UUID]] = {}  # Target node -> nodes branching to it
+        self._targets: Dict[UUID, List[UUID]] = {}  # Branch targets each node was last stored with
+
+    def __setitem__(self, node_id: UUID, node: "StoryNode") -> None:
+        targets = list(node.branches.values())
+        _relink(self, node_id, self._targets.get(node_id, ()), targets)
+        self._targets[node_id] = targets
+        super().__setitem__(node_id, node)
+
+    def __delitem__(self, node_id: UUID) -> None:
+        super().__delitem__(node_id)
+        _relink(self, node_id, self._targets.pop(node_id, ()), ())
+
+    def pop(self, node_id: UUID, *default):
+        if node_id not in self:
+            if default:
+                return default[0]
+            raise KeyError(node_id)
+        node = self[node_id]
+        del self[node_id]
+        return node
+
+    def link(self, source_id: UUID, target_id: UUID) -> None:
+        self._parents.setdefault(target_id, []).append(source_id)
+
+    def unlink(self, source_id: UUID, target_id: UUID) -> None:
+        parents = self._parents.get(target_id)
+        if parents and source_id in parents:
+            parents.remove(source_id)
+            if not parents:
+                del self._parents[target_id]
+
+    def parents(self, target_id: UUID) -> List[UUID]:
+        """Nodes with a branch to ``target_id``, in the order the edges were added."""
+        return self._parents.get(target_id, [])
+
+    def clear(self) -> None:
+        super().clear()
+        self._parents.clear()
+        self._targets.clear()
+
+
+class CompactNodeStore(MutableMapping):
+    """
+    Struct-of-arrays node storage for very large graphs, e.g. pre-authored worlds.
+
+    Nodes are packed into numpy columns indexed by an integer handle: UUIDs as
+    two uint64 words, titles, tags and branch conditions as ids into one
+    interned string pool, contents as offsets into UTF-8 blobs, and tags and
+    branches as CSR arrays. Fields that are rarely set (requirements, player
+    inputs, memory ids, ...) are kept in a sparse dict. The reverse edges are a
+    CSR sorted by target. Reading a packed node builds a ``StoryNode`` view.
+
+    New and rewritten nodes go to an overlay dict of models first, so the nodes
+    in play stay live objects; every ``pack_every`` of them are packed. Views are
+    snapshots: changes to one are kept by storing it back (``StoryGraph`` does so
+    for its own changes). Storing or deleting a node moves its reverse edges to
+    match its branches.
+    """
+
+    def __init__(self, node_type: Type["StoryNode"], pack_every: int = 4096):
+        self.node_type = node_type
+        self.pack_every = pack_every
+        self._defaults = {
+            field: node_type.model_fields[field].get_default(call_default_factory=True)
+            for field in _EXTRA_FIELDS
+        }
+        self.clear()
+
+    def clear(self) -> None:
+        self._overlay: Dict[UUID, "StoryNode"] = {}
+        self._overlay_targets: Dict[UUID, List[UUID]] = {}  # Branch targets the overlay nodes were stored with
+        self._strings: List[str] = []
+        self._string_ids: Dict[str, int] = {}
+        self._chunks: List[bytes] = []
+        self._extras: Dict[int, dict] = {}
+        self._live = 0
+
+        # One row per packed node
+        self._hi = np.empty(0, dtype=np.uint64)
+        self._lo = np.empty(0, dtype=np.uint64)
+        self._alive = np.empty(0, dtype=bool)
+        self._title = np.empty(0, dtype=np.int32)
+        self._thread = np.empty(0, dtype=np.int32)
+        self._strategy = np.empty(0, dtype=np.int32)
+        self._depth = np.empty(0, dtype=np.int32)
+        self._entry = np.empty(0, dtype=bool)
+        self._updated = np.empty(0, dtype="datetime64[us]")
+        self._chunk = np.empty(0, dtype=np.int32)
+        self._offset = np.empty(0, dtype=np.int64)
+        self._length = np.empty(0, dtype=np.int64)
+
+        # Tags and branches in CSR layout: row r owns [ptr[r], ptr[r + 1])
+        self._tag_ptr = np.zeros(1, dtype=np.int64)
+        self._tag_ids = np.empty(0, dtype=np.int32)
+        self._branch_ptr = np.zeros(1, dtype=np.int64)
+        self._branch_label = np.empty(0, dtype=np.int32)
+        self._branch_hi = np.empty(0, dtype=np.uint64)
+        self._branch_lo = np.empty(0, dtype=np.uint64)
+        self._branch_handle = np.empty(0, dtype=np.int64)  # -1 until the target is packed
+
+        # UUID lookup: row handles sorted by the high word
+        self._sorted_hi = np.empty(0, dtype=np.uint64)
+        self._sorted_rows = np.empty(0, dtype=np.int64)
+
+        # Reverse edges sorted by target high word, plus the changes since the last pack
+        self._rev_thi = np.empty(0, dtype=np.uint64)
+        self._rev_tlo = np.empty(0, dtype=np.uint64)
+        self._rev_shi = np.empty(0, dtype=np.uint64)
+        self._rev_slo = np.empty(0, dtype=np.uint64)
+        self._new_parents: Dict[UUID, List[UUID]] = {}
+        self._dead_edges: Dict[Tuple[UUID, UUID], int] = {}  # Packed copies of an edge removed, oldest first
+
+    def _intern(self, text: str) -> int:
+        index = self._string_ids.get(text)
+        if index is None:
+            index = self._string_ids[text] = len(self._strings)
+            self._strings.append(text)
+        return index
+
+    # Handles
+
+    def handle_of(self, node_id: UUID) -> int:
+        """Handle of a packed node, or -1 if it is unknown or still in the overlay."""
+        return self._find_row(*_words(node_id))
+
+    def _find_row(self, hi: np.uint64, lo: np.uint64) -> int:
+        i = int(np.searchsorted(self._sorted_hi, hi))
+        while i < len(self._sorted_hi) and self._sorted_hi[i] == hi:
+            row = int(self._sorted_rows[i])
+            if self._lo[row] == lo and self._alive[row]:
+                return row
+            i += 1
+        return -1
+
+    def _find_rows(self, hi: np.ndarray, lo: np.ndarray) -> np.ndarray:
+        """Vectorized ``_find_row``."""
+        if not len(self._sorted_hi):
+            return np.full(len(hi), -1, dtype=np.int64)
+        i = np.minimum(np.searchsorted(self._sorted_hi, hi), len(self._sorted_hi) - 1)
+        rows = self._sorted_rows[i]
+        found = (self._sorted_hi[i] == hi) & (self._lo[rows] == lo) & self._alive[rows]
+        rows = np.where(found, rows, -1)
+        # Shared high words or dead duplicates need the scalar walk
+        for k in np.flatnonzero(~found & (self._sorted_hi[i] == hi)):
+            rows[k] = self._find_row(hi[k], lo[k])
+        return rows
+
+    def uuid_of(self, handle: int) -> UUID:
+        return _join_id(self._hi[handle], self._lo[handle])
+
+    def children(self, handle: int) -> np.ndarray:
+        """Handles of the packed nodes a packed node branches to (-1 for the others)."""
+        start, end = self._branch_ptr[handle], self._branch_ptr[handle + 1]
+        handles = self._branch_handle[start:end]
+        return np.where((handles >= 0) & self._alive[np.maximum(handles, 0)], handles, -1)
+
+    def view(self, handle: int) -> "StoryNode":
+        """Build the ``StoryNode`` stored at a handle."""
+        strings = self._strings
+        start, end = int(self._branch_ptr[handle]), int(self._branch_ptr[handle + 1])
+        offset = int(self._offset[handle])
+        fields = {
+            "id": self.uuid_of(handle),
+            "title": strings[self._title[handle]],
+            "content": self._chunks[self._chunk[handle]][offset:offset + int(self._length[handle])].decode("utf-8"),
+            "tags": {strings[t] for t in self._tag_ids[self._tag_ptr[handle]:self._tag_ptr[handle + 1]].tolist()},
+            "branches": {
+                strings[label]: UUID(int=(hi << 64) | lo)
+                for label, hi, lo in zip(
+                    self._branch_label[start:end].tolist(),
+                    self._branch_hi[start:end].tolist(),
+                    self._branch_lo[start:end].tolist()
+                )
+            },
+            "is_entry_point": bool(self._entry[handle]),
+            "depth": int(self._depth[handle]),
+            "story_thread": strings[self._thread[handle]],
+            "branching_strategy": strings[self._strategy[handle]],
+            "last_updated": self._updated[handle].item()
+        }
+        # Every field is given, so no default factories run
+        extras = self._extras.get(handle)
+        if extras is None:
+            fields.update({f: copy.copy(v) for f, v in self._defaults.items()})
+        else:
+            fields.update(copy.deepcopy(extras))
+        return self.node_type.model_construct(**fields)
+
+    # Mapping
+
+    def __getitem__(self, node_id: UUID) -> "StoryNode":
+        node = self._overlay.get(node_id)
+        if node is not None:
+            return node
+        row = self.handle_of(node_id)
+        if row < 0:
+            raise KeyError(node_id)
+        return self.view(row)
+
+    def __contains__(self, node_id: object) -> bool:
+        return node_id in self._overlay or (isinstance(node_id, UUID) and self.handle_of(node_id) >= 0)
+
+    def __setitem__(self, node_id: UUID, node: "StoryNode") -> None:
+        targets = list(node.branches.values())
+        old_targets = self._overlay_targets.get(node_id)
+        if old_targets is None:
+            old_targets = []
+            row = self.handle_of(node_id)
+            if row >= 0:
+                old_targets = self._branch_targets(row)
+                self._kill(row)
+        _relink(self, node_id, old_targets, targets)
+        self._overlay[node_id] = node
+        self._overlay_targets[node_id] = targets
+        if len(self._overlay) >= self.pack_every:
+            self.pack()
+
+    def __delitem__(self, node_id: UUID) -> None:
+        if self._overlay.pop(node_id, None) is not None:
+            _relink(self, node_id, self._overlay_targets.pop(node_id), ())
+            return
+        row = self.handle_of(node_id)
+        if row < 0:
+            raise KeyError(node_id)
+        _relink(self, node_id, self._branch_targets(row), ())
+        self._kill(row)
+
+    def _branch_targets(self, row: int) -> List[UUID]:
+        start, end = self._branch_ptr[row], self._branch_ptr[row + 1]
+        return [
+            _join_id(hi, lo)
+            for hi, lo in zip(self._branch_hi[start:end].tolist(), self._branch_lo[start:end].tolist())
+        ]
+
+    def _kill(self, row: int) -> None:
+        self._alive[row] = False
+        self._extras.pop(row, None)
+        self._live -= 1
+
+    def __iter__(self) -> Iterator[UUID]:
+        for row in np.flatnonzero(self._alive):
+            yield self.uuid_of(row)
+        yield from list(self._overlay)
+
+    def __len__(self) -> int:
+        return self._live + len(self._overlay)
+
+    # Reverse edges
+
+    def link(self, source_id: UUID, target_id: UUID) -> None:
+        self._new_parents.setdefault(target_id, []).append(source_id)
+
+    def unlink(self, source_id: UUID, target_id: UUID) -> None:
+        # Like list.remove on DictNodeStore's parents: the oldest copy of the edge goes
+        edge = (source_id, target_id)
+        dead = self._dead_edges.get(edge, 0)
+        if self._packed_sources(target_id).count(source_id) > dead:
+            self._dead_edges[edge] = dead + 1
+            return
+        parents = self._new_parents.get(target_id)
+        if parents and source_id in parents:
+            parents.remove(source_id)
+            if not parents:
+                del self._new_parents[target_id]
+
+    def _packed_edges(self, target_id: UUID) -> range:
+        hi, _ = _words(target_id)
+        return range(
+            int(np.searchsorted(self._rev_thi, hi, side="left")),
+            int(np.searchsorted(self._rev_thi, hi, side="right"))
+        )
+
+    def _packed_sources(self, target_id: UUID) -> List[UUID]:
+        """Sources of the packed edges to ``target_id``, removed ones included."""
+        _, lo = _words(target_id)
+        return [
+            _join_id(self._rev_shi[k], self._rev_slo[k])
+            for k in self._packed_edges(target_id) if self._rev_tlo[k] == lo
+        ]
+
+    def parents(self, target_id: UUID) -> List[UUID]:
+        """Nodes with a branch to ``target_id``, oldest edges first."""
+        found = self._packed_sources(target_id)
+        if self._dead_edges and found:
+            dead = {s: self._dead_edges.get((s, target_id), 0) for s in set(found)}
+            live = []
+            for source_id in found:
+                if dead[source_id]:
+                    dead[source_id] -= 1
+                else:
+                    live.append(source_id)
+            found = live
+        return found + self._new_parents.get(target_id, [])
+
+    # Packing
+
+    def pack(self) -> None:
+        """Move the overlay into the columns and fold the edge changes into the reverse CSR."""
+        self._pack_nodes()
+        self._pack_edges()
+
+    def _pack_nodes(self) -> None:
+        # Overlay nodes may have been changed in place since they were stored
+        for node_id, node in self._overlay.items():
+            _relink(self, node_id, self._overlay_targets[node_id], node.branches.values())
+        self._overlay_targets.clear()
+        nodes = list(self._overlay.values())
+        if not nodes:
+            return
+        first = len(self._hi)
+        hi, lo = _split_ids(n.id for n in nodes)
+        encoded = [n.content.encode("utf-8") for n in nodes]
+        lengths = np.fromiter(map(len, encoded), dtype=np.int64, count=len(nodes))
+        tags = [sorted(n.tags) for n in nodes]
+        branches = [list(n.branches.items()) for n in nodes]
+        intern = self._intern
+
+        self._hi = np.concatenate([self._hi, hi])
+        self._lo = np.concatenate([self._lo, lo])
+        self._alive = np.concatenate([self._alive, np.ones(len(nodes), dtype=bool)])
+        self._title = np.concatenate([self._title, [intern(n.title) for n in nodes]]).astype(np.int32)
+        self._thread = np.concatenate([self._thread, [intern(n.story_thread) for n in nodes]]).astype(np.int32)
+        self._strategy = np.concatenate(
+            [self._strategy, [intern(n.branching_strategy) for n in nodes]]
+        ).astype(np.int32)
+        self._depth = np.concatenate([self._depth, [n.depth for n in nodes]]).astype(np.int32)
+        self._entry = np.concatenate([self._entry, [n.is_entry_point for n in nodes]]).astype(bool)
+        self._updated = np.concatenate(
+            [self._updated, np.array([n.last_updated.replace(tzinfo=None) for n in nodes], dtype="datetime64[us]")]
+        )
+        self._chunk = np.concatenate([self._chunk, np.full(len(nodes), len(self._chunks), dtype=np.int32)])
+        self._offset = np.concatenate([self._offset, np.cumsum(lengths) - lengths])
+        self._length = np.concatenate([self._length, lengths])
+        self._chunks.append(b"".join(encoded))
+
+        self._tag_ids = np.concatenate(
+            [self._tag_ids, np.array([intern(t) for row in tags for t in row], dtype=np.int32)]
+        )
+        self._tag_ptr = np.concatenate(
+            [self._tag_ptr, self._tag_ptr[-1] + np.cumsum([len(row) for row in tags], dtype=np.int64)]
+        )
+        targets = [target for row in branches for _, target in row]
+        branch_hi, branch_lo = _split_ids(targets) if targets else (
+            np.empty(0, dtype=np.uint64), np.empty(0, dtype=np.uint64)
+        )
+        self._branch_label = np.concatenate(
+            [self._branch_label, np.array([intern(c) for row in branches for c, _ in row], dtype=np.int32)]
+        )
+        self._branch_hi = np.concatenate([self._branch_hi, branch_hi])
+        self._branch_lo = np.concatenate([self._branch_lo, branch_lo])
+        self._branch_handle = np.concatenate([self._branch_handle, np.full(len(targets), -1, dtype=np.int64)])
+        self._branch_ptr = np.concatenate(
+            [self._branch_ptr, self._branch_ptr[-1] + np.cumsum([len(row) for row in branches], dtype=np.int64)]
+        )
+
+        for i, node in enumerate(nodes):
+            extras = {
+                field: copy.deepcopy(getattr(node, field))
+                for field, default in self._defaults.items()
+                if getattr(node, field) != default
+            }
+            if node.last_updated.tzinfo is not None:
+                extras["last_updated"] = node.last_updated
+            if extras:
+                self._extras[first + i] = {**self._defaults, **extras}
+        self._live += len(nodes)
+        self._overlay.clear()
+
+        # Merge the new rows into the sorted lookup
+        order = np.argsort(hi, kind="stable")
+        at = np.searchsorted(self._sorted_hi, hi[order], side="right")
+        self._sorted_hi = np.insert(self._sorted_hi, at, hi[order])
+        self._sorted_rows = np.insert(self._sorted_rows, at, first + order)
+
+        # Resolve branch targets that were not packed, or moved, before
+        stale = self._branch_handle < 0
+        stale[~stale] = ~self._alive[self._branch_handle[~stale]]
+        stale = np.flatnonzero(stale)
+        if len(stale):
+            self._branch_handle[stale] = self._find_rows(self._branch_hi[stale], self._branch_lo[stale])
+
+    def _pack_edges(self) -> None:
+        if self._dead_edges:
+            keep = np.ones(len(self._rev_thi), dtype=bool)
+            for (source_id, target_id), dead in self._dead_edges.items():
+                source = _words(source_id)
+                target_lo = _words(target_id)[1]
+                for k in self._packed_edges(target_id):
+                    if not dead:
+                        break
+                    if self._rev_tlo[k] == target_lo and (self._rev_shi[k], self._rev_slo[k]) == source:
+                        keep[k] = False
+                        dead -= 1
+            self._rev_thi, self._rev_tlo = self._rev_thi[keep], self._rev_tlo[keep]
+            self._rev_shi, self._rev_slo = self._rev_shi[keep], self._rev_slo[keep]
+            self._dead_edges.clear()
+        if self._new_parents:
+            pairs = [(t, s) for t, sources in self._new_parents.items() for s in sources]
+            thi, tlo = _split_ids(t for t, _ in pairs)
+            shi, slo = _split_ids(s for _, s in pairs)
+            order = np.argsort(thi, kind="stable")
+            at = np.searchsorted(self._rev_thi, thi[order], side="right")
+            self._rev_thi = np.insert(self._rev_thi, at, thi[order])
+            self._rev_tlo = np.insert(self._rev_tlo, at, tlo[order])
+            self._rev_shi = np.insert(self._rev_shi, at, shi[order])
+            self._rev_slo = np.insert(self._rev_slo, at, slo[order])
+            self._new_parents.clear()
+
+    def nbytes(self) -> int:
+        """Bytes held by the packed columns and content blobs."""
+        arrays = [value for value in vars(self).values() if isinstance(value, np.ndarray)]
+        return sum(a.nbytes for a in arrays) + sum(len(c) for c in self._chunks)
+
+
+def build_node_store(backend: str, node_type: Type["StoryNode"]) -> MutableMapping:
+    """Create the node storage for a ``StoryGraph`` backend name."""
+    if backend == "dict":
+        return DictNodeStore()
+    if backend == "compact":
+        return CompactNodeStore(node_type)
+    raise ValueError(f"Unsupported graph backend: {backend}. Expected one of {NODE_BACKENDS}")
@@ -1,12 +1,21 @@
 """
 Story graph implementation for managing branching narratives.
 """
-from typing import Dict, List, Optional, Set, Any
+import asyncio
+import heapq
+import json
+import logging
+from pathlib import Path
+from typing import Dict, Iterator, List, NamedTuple, Optional, Set, Any, Tuple, Union
 from uuid import UUID, uuid4
 from pydantic import BaseModel, Field
 from datetime import datetime
 
 from echoforgeai.core.llm_service import LLMResponse
+from echoforgeai.graph.node_store import build_node_store
+from echoforgeai.memory.summarizers import ExtractiveSummarizer, Summarizer
+
+logger = logging.getLogger("echoforgeai.graph")
 
 
 class StoryBeat(BaseModel):
@@ -21,6 +30,16 @@ class StoryBeat(BaseModel):
         return self.text
 
 
+PLACEHOLDER_CONTENT = "To be generated"
+
+
+class PendingBranch(NamedTuple):
+    """A choice offered to the player whose node has not been generated yet."""
+    source_id: UUID
+    choice: str
+    tags: Set[str]
+
+
 class StoryNode(BaseModel):
     """
     Represents a node in the story graph, containing content and branching logic.
@@ -40,12 +59,18 @@ class StoryNode(BaseModel):
     collaborative_context: str = ""
     last_updated: datetime = Field(default_factory=datetime.now)
     branching_strategy: str = Field(default="linear")  # Options: "save_point", "parallel", "time_jump"
+    memory_ids: List[int] = Field(default_factory=list)  # Ids of the memories stored for this node
     
     class Config:
         arbitrary_types_allowed = True
     
     def add_branch(self, condition: str, target_node: "StoryNode") -> None:
-        """Add a new branch from this node."""
+        """
+        Add a new branch from this node.
+        
+        Use ``StoryGraph.add_branch`` once the node is in a graph, so the graph's
+        parent index sees the new edge.
+        """
         self.branches[condition] = target_node.id
         
     def meets_requirements(self, state: dict) -> bool:
@@ -57,29 +82,246 @@ class StoryNode(BaseModel):
         return True
 
 
+class NodeArchive:
+    """
+    Cold store for story nodes finalized out of a graph's working set.
+    
+    Nodes are kept serialized as JSON, in memory or, given a ``path``, appended to
+    ``nodes.jsonl`` in that directory with only their offsets held in memory, and
+    are rebuilt on demand.
+    """
+    
+    def __init__(self, path: Optional[Union[str, Path]] = None):
+        self._records: Dict[UUID, str] = {}
+        self._offsets: Dict[UUID, Tuple[int, int]] = {}
+        self._file: Optional[Path] = None
+        if path is not None:
+            Path(path).mkdir(parents=True, exist_ok=True)
+            self._file = Path(path) / "nodes.jsonl"
+            if self._file.exists():
+                self._scan()
+                
+    def _scan(self) -> None:
+        """Index the nodes already in the archive file; later lines win."""
+        offset = 0
+        with open(self._file, "rb") as f:
+            for line in f:
+                if line.endswith(b"\n"):
+                    node_id = UUID(json.loads(line)["id"])
+                    self._offsets[node_id] = (offset, len(line))
+                offset += len(line)
+                
+    def __contains__(self, node_id: UUID) -> bool:
+        return node_id in self._offsets or node_id in self._records
+        
+    def __len__(self) -> int:
+        return len(self._offsets) + len(self._records)
+        
+    def put(self, nodes: List[StoryNode]) -> None:
+        """Archive nodes, replacing earlier copies."""
+        lines = [node.model_dump_json() for node in nodes]
+        if self._file is None:
+            for node, line in zip(nodes, lines):
+                self._records[node.id] = line
+            return
+        with open(self._file, "ab") as f:
+            offset = f.tell()
+            for node, line in zip(nodes, lines):
+                data = (line + "\n").encode("utf-8")
+                f.write(data)
+                self._offsets[node.id] = (offset, len(data))
+                offset += len(data)
+                
+    def _read(self, node_id: UUID) -> str:
+        if node_id in self._records:
+            return self._records[node_id]
+        offset, length = self._offsets[node_id]
+        with open(self._file, "rb") as f:
+            f.seek(offset)
+            return f.read(length).decode("utf-8")
+            
+    def get(self, node_id: UUID) -> StoryNode:
+        """Rebuild an archived node; raises KeyError if it was never archived."""
+        if node_id not in self:
+            raise KeyError(f"Node {node_id} not found in archive")
+        return StoryNode.model_validate_json(self._read(node_id))
+        
+    def items(self) -> Iterator[Tuple[UUID, dict]]:
+        """Every archived node as (id, exported dict)."""
+        for node_id in list(self._records) + list(self._offsets):
+            yield node_id, json.loads(self._read(node_id))
+
+
 class StoryGraph:
     """
     Manages the graph of story nodes and handles navigation between them.
+    
+    Besides the nodes' outgoing ``branches``, the graph keeps the reverse edges: for
+    every node, the nodes branching to it, in the order the edges were added. Parent
+    lookups and narrative paths follow them instead of scanning the graph, so they
+    cost one lookup per step however many nodes there are.
+    
+    The choices offered after a beat are pending branches: the branch points to a
+    reserved node id, but the graph only records the choice in ``_pending`` until a
+    player takes it (or ``get_node`` asks for it), so untaken choices neither
+    allocate nodes nor count towards ``max_context_nodes``. Exports write them as
+    the placeholder nodes earlier versions stored, and imports turn those back
+    into pending branches.
+    
+    Once the graph holds more than ``max_context_nodes`` nodes, the oldest half
+    (by ``last_updated``, from a heap, so finding them costs O(k log n)) is moved
+    to the ``archive``; ``get_node`` still finds them there. The chapter they
+    formed is condensed by the ``summarizer`` in a background task and appended
+    to ``chapter_summaries`` in order. The heap is built on the first
+    finalization.
+    
+    ``backend`` selects how nodes are stored: "dict", a dict of ``StoryNode``
+    models, or "compact", a ``CompactNodeStore`` of packed columns for very large
+    pre-authored worlds, which hands out ``StoryNode`` views. Either way, code
+    that changes a node it got from the graph stores it back with ``save_node``.
     """
     
-    def __init__(self):
+    def __init__(
+        self,
+        summarizer: Optional[Summarizer] = None,
+        archive: Optional[NodeArchive] = None,
+        backend: str = "dict"
+    ):
         """Initialize an empty story graph."""
-        self.nodes: Dict[UUID, StoryNode] = {}
+        self.summarizer = summarizer or ExtractiveSummarizer()
+        self.archive = archive if archive is not None else NodeArchive()
+        self.nodes = build_node_store(backend, StoryNode)  # Also keeps the reverse edges
+        self._ages: Optional[List[Tuple[datetime, UUID]]] = None  # Min-heap of (last_updated, id); stale entries are skipped
+        self._chapter_task: Optional[asyncio.Task] = None
+        self._pending: Dict[UUID, PendingBranch] = {}  # Reserved node id -> untaken choice
         self._entry_nodes: List[UUID] = []
         self.chapter_summaries: List[str] = []  # Store summarized chapters
         self.max_context_nodes = 20  # Configurable
         
     def add_node(self, node: StoryNode) -> None:
-        """Add a node to the graph."""
+        """Add a node to the graph, replacing the node with the same id."""
         self.nodes[node.id] = node
-        if node.is_entry_point:
+        self._push_age(node)
+        if node.is_entry_point and node.id not in self._entry_nodes:
             self._entry_nodes.append(node.id)
             
+    def add_branch(self, source: StoryNode, condition: str, target: StoryNode) -> None:
+        """Add or replace the branch ``condition`` from ``source`` to ``target``."""
+        self._set_branch(source, condition, target.id)
+            
+    def save_node(self, node: StoryNode) -> bool:
+        """
+        Store back changes made to a node taken from the graph.
+        
+        The node store moves the reverse edges to match ``node``'s branches.
+        
+        Returns:
+            False if the node is not in the graph
+        """
+        if node.id not in self.nodes:
+            return False
+        self.nodes[node.id] = node
+        return True
+        
+    def _set_branch(self, source: StoryNode, condition: str, target_id: UUID) -> None:
+        """Point a branch of ``source`` at ``target_id`` and store the node back if it is in the graph."""
+        previous = source.branches.get(condition)
+        if previous is not None and previous != target_id:
+            self._pending.pop(previous, None)
+        source.branches[condition] = target_id
+        self.save_node(source)
+            
+    def remove_node(self, node_id: UUID) -> StoryNode:
+        """
+        Remove a node and its outgoing edges from the graph.
+        
+        Branches of other nodes that lead to it are kept, so it can be added back.
+        """
+        node = self.nodes.pop(node_id)
+        for target_id in node.branches.values():
+            self._pending.pop(target_id, None)
+        if node_id in self._entry_nodes:
+            self._entry_nodes.remove(node_id)
+        return node
+        
     def get_node(self, node_id: UUID) -> StoryNode:
-        """Get a node by its ID."""
-        if node_id not in self.nodes:
-            raise KeyError(f"Node {node_id} not found in graph")
-        return self.nodes[node_id]
+        """
+        Get a node by its ID, materializing a pending branch as a placeholder node.
+        
+        Archived nodes are rebuilt from the archive without rejoining the graph.
+        """
+        if isinstance(node_id, str):
+            node_id = UUID(node_id)
+        node = self.nodes.get(node_id)
+        if node is not None:
+            return node
+        if node_id in self._pending:
+            node = self._placeholder(node_id, self._pending.pop(node_id))
+            self.add_node(node)
+            return node
+        if node_id in self.archive:
+            return self.archive.get(node_id)
+        raise KeyError(f"Node {node_id} not found in graph")
+        
+    def touch(self, node: StoryNode) -> None:
+        """Mark a node as updated now, making it the last to be archived."""
+        node.last_updated = datetime.now()
+        if self.save_node(node):
+            self._push_age(node)
+            
+    def _push_age(self, node: StoryNode) -> None:
+        if self._ages is None:
+            return
+        heapq.heappush(self._ages, (node.last_updated, node.id))
+        if len(self._ages) > 2 * len(self.nodes) + 64:
+            # Mostly stale entries left by touch and removal
+            self._build_ages()
+            
+    def _build_ages(self) -> None:
+        self._ages = [(n.last_updated, n.id) for n in self.nodes.values()]
+        heapq.heapify(self._ages)
+            
+    def _pop_oldest(self, k: int, keep: Set[UUID]) -> List[StoryNode]:
+        """Up to ``k`` of the least recently updated nodes, skipping entry points and ``keep``."""
+        if self._ages is None:
+            self._build_ages()
+        oldest = []
+        kept = []
+        while self._ages and len(oldest) < k:
+            entry = heapq.heappop(self._ages)
+            node = self.nodes.get(entry[1])
+            if node is None or node.last_updated != entry[0]:
+                continue  # Removed or touched since
+            if node.is_entry_point or node.id in keep:
+                kept.append(entry)
+            else:
+                oldest.append(node)
+        for entry in kept:
+            heapq.heappush(self._ages, entry)
+        return oldest
+        
+    def is_pending(self, node_id: UUID) -> bool:
+        """Whether ``node_id`` is a choice no player has taken yet."""
+        return node_id in self._pending
+        
+    def _is_placeholder(self, node_id: UUID) -> bool:
+        node = self.nodes.get(node_id)
+        return node is not None and node.content == PLACEHOLDER_CONTENT
+        
+    @staticmethod
+    def _placeholder(node_id: UUID, pending: PendingBranch) -> StoryNode:
+        return StoryNode(
+            id=node_id,
+            title=f"Choice: {pending.choice[:50]}...",
+            content=PLACEHOLDER_CONTENT,
+            tags=pending.tags
+        )
+        
+    def _add_pending(self, source: StoryNode, choice: str) -> None:
+        """Offer ``choice`` from ``source`` without creating its node."""
+        target_id = uuid4()
+        self._set_branch(source, choice, target_id)
+        self._pending[target_id] = PendingBranch(source.id, choice, source.tags)
         
     def get_entry_node(self, node_id: Optional[UUID] = None) -> StoryNode:
         """Get the specified entry node or the default one."""
@@ -114,26 +356,30 @@ class StoryGraph:
         """
         # Before generating new beat
         if len(self.nodes) > self.max_context_nodes:
-            await self._finalize_chapter()
+            await self._finalize_chapter(keep={current_node.id})
         
-        # Create a new node for this story beat
+        # Create a new node for this story beat, reached from the current one. Taking
+        # an offered choice resolves its pending branch, or the placeholder node
+        # get_node made of it, into this node; any other branch is re-pointed to it.
+        target_id = current_node.branches.get(user_input)
+        taken = target_id is not None and (
+            self._pending.pop(target_id, None) is not None or self._is_placeholder(target_id)
+        )
         new_node = StoryNode(
             title=f"Response to: {user_input[:50]}...",
             content=llm_response.text,
-            tags=current_node.tags
+            tags=current_node.tags,
+            user_input=user_input,
+            depth=current_node.depth + 1,
+            **({"id": target_id} if taken else {})
         )
         self.add_node(new_node)
+        if not taken:
+            self.add_branch(current_node, user_input, new_node)
         
-        # Add branches based on LLM-generated choices
+        # Offer the LLM-generated choices as pending branches
         for choice in llm_response.choices:
-            # Create a placeholder node for each choice
-            choice_node = StoryNode(
-                title=f"Choice: {choice[:50]}...",
-                content="To be generated",
-                tags=current_node.tags
-            )
-            self.add_node(choice_node)
-            new_node.add_branch(choice, choice_node)
+            self._add_pending(new_node, choice)
             
         return StoryBeat(
             text=llm_response.text,
@@ -152,51 +398,98 @@ class StoryGraph:
         
     def export_state(self) -> dict:
         """Export the graph state for serialization."""
+        nodes = {str(node_id): node.model_dump() for node_id, node in self.nodes.items()}
+        for node_id, pending in self._pending.items():
+            nodes[str(node_id)] = self._placeholder(node_id, pending).model_dump()
         return {
-            "nodes": {
-                str(node_id): node.model_dump()
-                for node_id, node in self.nodes.items()
-            },
+            "nodes": nodes,
+            "archived_nodes": {str(node_id): data for node_id, data in self.archive.items()},
+            "chapter_summaries": list(self.chapter_summaries),
             "entry_nodes": [str(node_id) for node_id in self._entry_nodes]
         }
         
     async def import_state(self, state: dict) -> None:
         """Import a previously exported graph state."""
         self.nodes.clear()
+        self._ages = None
+        self._pending.clear()
         self._entry_nodes.clear()
+        self.chapter_summaries = list(state.get("chapter_summaries", []))
+        archived = [StoryNode(**data) for data in state.get("archived_nodes", {}).values()]
+        if archived:
+            self.archive.put(archived)
         
-        # Restore nodes
+        # Restore nodes and their reverse edges
         for node_id, node_data in state["nodes"].items():
             node = StoryNode(**node_data)
             self.nodes[UUID(node_id)] = node
+            self._push_age(node)
+                
+        # Placeholders no player has reached become pending branches again
+        for node in list(self.nodes.values()):
+            for choice, target_id in node.branches.items():
+                target = self.nodes.get(target_id)
+                if (
+                    target is not None and target.content == PLACEHOLDER_CONTENT
+                    and not target.branches and not target.is_entry_point
+                ):
+                    del self.nodes[target_id]
+                    self._pending[target_id] = PendingBranch(node.id, choice, target.tags)
             
         # Restore entry nodes
         self._entry_nodes = [UUID(node_id) for node_id in state["entry_nodes"]] 
 
-    def get_narrative_path(self, max_depth=10) -> List[StoryNode]:
-        """Get current narrative path for context"""
+    def get_narrative_path(self, node: StoryNode, max_depth: int = 10) -> List[StoryNode]:
+        """The path of at most ``max_depth`` nodes leading to ``node``, oldest first."""
         path = []
-        current = self.current_node
-        while current and len(path) < max_depth:
-            path.insert(0, current)
+        current = node
+        while current is not None and len(path) < max_depth:
+            path.append(current)
             current = self.get_previous_node(current.id)
+        path.reverse()
         return path
 
     def get_previous_node(self, node_id: UUID) -> Optional[StoryNode]:
-        """Find which node leads to this one"""
-        for node in self.nodes.values():
-            if node_id in node.branches.values():
-                return node
-        return None 
-
-    async def _finalize_chapter(self):
-        """Summarize and archive old nodes"""
-        old_nodes = sorted(self.nodes.values(), key=lambda n: n.last_updated)[:self.max_context_nodes//2]
-        summary = await self._summarize_nodes(old_nodes)
-        self.chapter_summaries.append(summary)
-        # Remove old nodes
+        """The first node still in the graph that branches to this one."""
+        for parent_id in self.nodes.parents(node_id):
+            parent = self.nodes.get(parent_id)
+            if parent is not None:
+                return parent
+        return None
+
+    async def _finalize_chapter(self, keep: Optional[Set[UUID]] = None) -> None:
+        """Archive the oldest nodes and summarize them as a chapter in the background."""
+        old_nodes = self._pop_oldest(self.max_context_nodes // 2, keep or set())
+        if not old_nodes:
+            return
+        archived = list(old_nodes)
         for node in old_nodes:
-            del self.nodes[node.id] 
+            # Untaken choices of archived nodes are archived as placeholders
+            for target_id in node.branches.values():
+                pending = self._pending.pop(target_id, None)
+                if pending is not None:
+                    archived.append(self._placeholder(target_id, pending))
+            self.remove_node(node.id)
+        self.archive.put(archived)
+        self._chapter_task = asyncio.ensure_future(
+            self._summarize_chapter([n.content for n in old_nodes], self._chapter_task)
+        )
+        
+    async def _summarize_chapter(self, texts: List[str], previous: Optional[asyncio.Task]) -> None:
+        if previous is not None:
+            await asyncio.wait([previous])  # Keep the summaries in chapter order
+        try:
+            summary = await self.summarizer.summarize(texts)
+        except Exception:
+            logger.warning("Chapter summary failed", exc_info=True)
+            return
+        if summary:
+            self.chapter_summaries.append(summary)
+            
+    async def wait_for_chapters(self) -> None:
+        """Wait until every finalized chapter has been summarized."""
+        if self._chapter_task is not None:
+            await asyncio.wait([self._chapter_task])
 
     async def create_save_point(self, node: StoryNode) -> UUID:
         """Create a restorable branch point"""
@@ -0,0 +1,72 @@
+"""
+Thread pool and locking helpers for running memory bank work off the event loop.
+"""
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict
+
+_shared_executors: Dict[int, ThreadPoolExecutor] = {}
+
+
+def shared_executor(max_workers: int) -> ThreadPoolExecutor:
+    """
+    Process-wide thread pool with ``max_workers`` threads.
+
+    Banks configured with the same pool size share one executor, so hosting many
+    stories in a process does not multiply the number of search threads.
+    """
+    executor = _shared_executors.get(max_workers)
+    if executor is None:
+        executor = _shared_executors[max_workers] = ThreadPoolExecutor(
+            max_workers=max_workers,
+            thread_name_prefix="echoforge-memory"
+        )
+    return executor
+
+
+class ReadWriteLock:
+    """
+    Asyncio lock admitting any number of readers or a single writer.
+
+    A waiting writer holds back new readers so a steady stream of searches cannot
+    starve inserts.
+    """
+
+    def __init__(self):
+        self._condition = asyncio.Condition()
+        self._readers = 0
+        self._writer = False
+        self._writers_waiting = 0
+
+    @asynccontextmanager
+    async def read(self) -> AsyncIterator[None]:
+        async with self._condition:
+            await self._condition.wait_for(
+                lambda: not self._writer and not self._writers_waiting
+            )
+            self._readers += 1
+        try:
+            yield
+        finally:
+            async with self._condition:
+                self._readers -= 1
+                if not self._readers:
+                    self._condition.notify_all()
+
+    @asynccontextmanager
+    async def write(self) -> AsyncIterator[None]:
+        async with self._condition:
+            self._writers_waiting += 1
+            try:
+                await self._condition.wait_for(lambda: not self._writer and not self._readers)
+            finally:
+                self._writers_waiting -= 1
+                self._condition.notify_all()  # Readers held back by this writer may proceed
+            self._writer = True
+        try:
+            yield
+        finally:
+            async with self._condition:
+                self._writer = False
+                self._condition.notify_all()
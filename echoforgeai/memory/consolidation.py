@@ -0,0 +1,239 @@
+"""
+Background consolidation of old memories into summaries, with a compressed cold archive.
+"""
+import asyncio
+import json
+import math
+from collections import defaultdict
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple, Union
+
+import faiss
+import numpy as np
+
+from echoforgeai.memory.summarizers import Summarizer
+from echoforgeai.memory.vector_store import DEFAULT_IMPORTANCE, Memory, MemoryBank
+
+
+class ColdArchive:
+    """
+    Compressed on-disk store for memories that were consolidated out of a bank.
+
+    Each consolidation pass writes one ``batch-<n>.npz`` file holding the raw
+    memories, their float16 vectors and the summary cluster each one went into.
+    """
+
+    def __init__(self, path: Union[str, Path]):
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+
+    def _batch_path(self, batch: int) -> Path:
+        return self.path / f"batch-{batch:06d}.npz"
+
+    def batches(self) -> List[int]:
+        """Numbers of the batches written so far, in order."""
+        return sorted(int(p.stem.split("-")[1]) for p in self.path.glob("batch-*.npz"))
+
+    def next_batch(self) -> int:
+        batches = self.batches()
+        return batches[-1] + 1 if batches else 0
+
+    def write(
+        self,
+        batch: int,
+        memories: List[Memory],
+        vectors: np.ndarray,
+        clusters: List[int]
+    ) -> None:
+        """Archive one consolidation pass."""
+        table = {
+            "contents": [m.content for m in memories],
+            "metadata": [m.metadata for m in memories],
+            "timestamps": [m.timestamp.isoformat() for m in memories],
+            "counts": [m.count for m in memories]
+        }
+        # Write under a temporary name so a crash never leaves a truncated batch
+        tmp = self.path / f"tmp-batch-{batch:06d}.npz"
+        np.savez_compressed(
+            tmp,
+            ids=np.array([m.id for m in memories], dtype=np.int64),
+            clusters=np.asarray(clusters, dtype=np.int32),
+            vectors=np.asarray(vectors, dtype=np.float16),
+            table=np.array(json.dumps(table))
+        )
+        tmp.replace(self._batch_path(batch))
+
+    def read(self, batch: int, cluster: Optional[int] = None) -> List[Memory]:
+        """Raw memories of a batch, optionally only those folded into one summary."""
+        with np.load(self._batch_path(batch)) as data:
+            ids = data["ids"]
+            clusters = data["clusters"]
+            table = json.loads(str(data["table"]))
+        return [
+            Memory(
+                content=table["contents"][i],
+                metadata=table["metadata"][i],
+                timestamp=datetime.fromisoformat(table["timestamps"][i]),
+                id=int(ids[i]),
+                count=table["counts"][i]
+            )
+            for i in range(len(ids))
+            if cluster is None or clusters[i] == cluster
+        ]
+
+    def expand(self, summary: Memory) -> List[Memory]:
+        """The raw memories a summary memory was built from."""
+        batch = summary.metadata.get("archive_batch")
+        if batch is None:
+            return []
+        return self.read(batch, summary.metadata.get("cluster"))
+
+
+class MemoryConsolidator:
+    """
+    Keeps a bank's hot index small by consolidating its oldest memories.
+
+    Once the bank holds ``high_water`` of its capacity, the oldest ``batch_size``
+    memories are grouped by the ``group_by`` metadata fields, clustered by vector
+    into groups of about ``cluster_size``, and each cluster is replaced by one
+    summary memory. The raw memories go to the ``ColdArchive`` when one is given.
+    Summaries are consolidated again like any other memory once they are old,
+    so long campaigns keep an ever coarser record instead of forgetting.
+    """
+
+    def __init__(
+        self,
+        bank: MemoryBank,
+        summarizer: Optional[Summarizer] = None,
+        archive: Optional[ColdArchive] = None,
+        high_water: float = 0.9,
+        batch_size: Optional[int] = None,
+        cluster_size: int = 8,
+        group_by: Tuple[str, ...] = ("character",)
+    ):
+        summarizer = summarizer or bank.summarizer
+        if summarizer is None:
+            raise ValueError("Consolidation needs a summarizer")
+        self.bank = bank
+        self.summarizer = summarizer
+        self.archive = archive
+        self.high_water = high_water
+        self.batch_size = batch_size or max(1, bank.max_items // 4)
+        self.cluster_size = cluster_size
+        self.group_by = tuple(group_by)
+        self._batch = archive.next_batch() if archive is not None else 0
+        self._task: Optional[asyncio.Task] = None
+        self.passes = 0
+        self.consolidated = 0  # Raw memories replaced by summaries
+        self.summaries = 0
+
+    @property
+    def needed(self) -> bool:
+        return len(self.bank) >= self.high_water * self.bank.max_items
+
+    def schedule(self) -> Optional[asyncio.Task]:
+        """Start a consolidation pass in the background if one is due and none is running."""
+        if self._task is not None and not self._task.done():
+            return self._task
+        if not self.needed:
+            return None
+        self._task = asyncio.ensure_future(self.consolidate())
+        return self._task
+
+    async def wait(self) -> None:
+        """Wait for the running background pass, if any."""
+        if self._task is not None:
+            await self._task
+
+    async def consolidate(self) -> int:
+        """
+        Run one consolidation pass now.
+
+        Returns:
+            The number of raw memories replaced by summaries
+        """
+        memories, vectors = await self.bank._run_locked(False, self._oldest)
+        if len(memories) < 2:
+            return 0
+        clusters = self._cluster(memories, vectors)
+
+        # Summarize every cluster concurrently; the bank stays usable meanwhile
+        members: Dict[int, List[int]] = defaultdict(list)
+        for i, cluster in enumerate(clusters):
+            members[cluster].append(i)
+        order = sorted(members)
+        texts = await asyncio.gather(*(
+            self.summarizer.summarize([memories[i].content for i in members[c]]) for c in order
+        ))
+
+        batch = self._batch
+        self._batch += 1
+        if self.archive is not None:
+            await asyncio.get_running_loop().run_in_executor(
+                self.bank.executor, self.archive.write, batch, memories, vectors, clusters
+            )
+
+        metadatas = []
+        timestamps = []
+        for cluster in order:
+            group = [memories[i] for i in members[cluster]]
+            metadata = {f: group[0].metadata[f] for f in self.group_by if f in group[0].metadata}
+            metadata.update({
+                "type": "summary",
+                "importance": max(m.metadata.get("importance", DEFAULT_IMPORTANCE) for m in group),
+                "summarized": sum(m.count for m in group),
+                "archive_batch": batch,
+                "cluster": cluster
+            })
+            metadatas.append(metadata)
+            timestamps.append(max(m.timestamp for m in group))
+
+        await self.bank.remove([m.id for m in memories])
+        await self.bank.store_many(list(texts), metadatas, timestamps)
+
+        self.passes += 1
+        self.consolidated += len(memories)
+        self.summaries += len(texts)
+        return len(memories)
+
+    def _oldest(self) -> Tuple[List[Memory], np.ndarray]:
+        slots = self.bank._live_slots()[:self.batch_size]
+        return [self.bank._memory_at(int(s)) for s in slots], self.bank._decode(slots)
+
+    def _cluster(self, memories: List[Memory], vectors: np.ndarray) -> List[int]:
+        """Cluster ids, one per memory; clusters never mix ``group_by`` values."""
+        groups: Dict[tuple, List[int]] = defaultdict(list)
+        for i, memory in enumerate(memories):
+            groups[tuple(memory.metadata.get(f) for f in self.group_by)].append(i)
+
+        clusters = [0] * len(memories)
+        next_cluster = 0
+        for rows in groups.values():
+            k = math.ceil(len(rows) / self.cluster_size)
+            if k == 1:
+                labels = np.zeros(len(rows), dtype=np.int64)
+            else:
+                kmeans = faiss.Kmeans(
+                    vectors.shape[1], k, niter=20, seed=1234, min_points_per_centroid=1
+                )
+                kmeans.train(np.ascontiguousarray(vectors[rows]))
+                _, labels = kmeans.index.search(np.ascontiguousarray(vectors[rows]), 1)
+                labels = labels[:, 0]
+            # Renumber so empty k-means cells leave no gaps
+            seen = dict.fromkeys(labels.tolist())
+            renumber = {label: next_cluster + n for n, label in enumerate(seen)}
+            for row, label in zip(rows, labels.tolist()):
+                clusters[row] = renumber[label]
+            next_cluster += len(renumber)
+        return clusters
+
+    def stats(self) -> dict:
+        """Counters for tuning the consolidation thresholds."""
+        return {
+            "passes": self.passes,
+            "consolidated": self.consolidated,
+            "summaries": self.summaries,
+            "hot": len(self.bank),
+            "archived_batches": len(self.archive.batches()) if self.archive is not None else 0
+        }
@@ -0,0 +1,263 @@
+"""
+Content-addressed embedding cache with an in-memory LRU tier and a memory-mapped disk tier.
+"""
+import hashlib
+import os
+from collections import OrderedDict
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple, Union
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+import numpy as np
+
+from echoforgeai.memory.embeddings import Embedder
+
+CacheKey = Tuple[str, int, bytes]  # (model, dim, sha256(text))
+
+
+def text_digest(text: str) -> bytes:
+    """Content address of a text."""
+    return hashlib.sha256(text.encode("utf-8")).digest()
+
+
+class _DiskTier:
+    """
+    Append-only vector store for one (model, dim) namespace.
+
+    ``keys.bin`` holds 32-byte digests and ``vectors.f32`` the matching float32 rows,
+    in the same order. Reads go through a read-only memory map that is remapped when
+    rows appended since the last mapping are requested.
+
+    Several caches, in one process or many, may share the directory. Writers append
+    under an exclusive lock on ``keys.bin`` and number their rows from the file
+    size they find there, and lookups that miss pick up the keys others appended.
+    """
+
+    def __init__(self, path: Path, dim: int):
+        path.mkdir(parents=True, exist_ok=True)
+        self.dim = dim
+        self._row_bytes = dim * 4
+        self._keys_path = path / "keys.bin"
+        self._vectors_path = path / "vectors.f32"
+        self._keys_path.touch()
+        self._vectors_path.touch()
+        self._rows: Dict[bytes, int] = {}
+        self._known = 0  # Rows of keys.bin read so far
+        self._map: Optional[np.memmap] = None
+        self._keys_file = open(self._keys_path, "ab")
+        self._vectors_file = open(self._vectors_path, "ab")
+        with self._locked():
+            # Drop any half-written tail left by a crash
+            rows = min(
+                self._keys_path.stat().st_size // 32,
+                self._vectors_path.stat().st_size // self._row_bytes
+            )
+            for file_path, size in ((self._keys_path, rows * 32), (self._vectors_path, rows * self._row_bytes)):
+                if file_path.stat().st_size != size:
+                    os.truncate(file_path, size)
+            self._refresh()
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    @contextmanager
+    def _locked(self) -> Iterator[None]:
+        if fcntl is None:
+            yield  # No advisory locks on this platform; keep one writer per directory
+            return
+        fcntl.flock(self._keys_file.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(self._keys_file.fileno(), fcntl.LOCK_UN)
+
+    def _refresh(self) -> bool:
+        """Index the keys appended to ``keys.bin`` since it was last read; False if there were none."""
+        read = self._known * 32
+        if self._keys_path.stat().st_size < read + 32:
+            return False
+        with open(self._keys_path, "rb") as f:
+            f.seek(read)
+            tail = f.read()
+        # Keys are written after their vectors, so every whole key has its row
+        added = len(tail) // 32
+        for i in range(added):
+            self._rows.setdefault(tail[i * 32:(i + 1) * 32], self._known + i)
+        self._known += added
+        return True
+
+    def get(self, digest: bytes) -> Optional[np.ndarray]:
+        row = self._rows.get(digest)
+        if row is None and self._refresh():
+            row = self._rows.get(digest)
+        if row is None:
+            return None
+        if self._map is None or row >= self._map.shape[0]:
+            self._map = np.memmap(
+                self._vectors_path, dtype=np.float32, mode="r", shape=(self._known, self.dim)
+            )
+        return np.array(self._map[row])
+
+    def put_many(self, items: List[Tuple[bytes, np.ndarray]]) -> None:
+        with self._locked():
+            self._refresh()
+            new = [(d, v) for d, v in dict(items).items() if d not in self._rows]
+            if not new:
+                return
+            # A writer that crashed may have left a partial tail; rows follow the whole keys
+            rows = self._known
+            for file_path, size in ((self._keys_path, rows * 32), (self._vectors_path, rows * self._row_bytes)):
+                if file_path.stat().st_size != size:
+                    os.truncate(file_path, size)
+            # Vectors first so a crash never leaves a key without its row
+            self._vectors_file.write(
+                np.stack([v for _, v in new]).astype(np.float32, copy=False).tobytes()
+            )
+            self._vectors_file.flush()
+            self._keys_file.write(b"".join(d for d, _ in new))
+            self._keys_file.flush()
+            for i, (digest, _) in enumerate(new):
+                self._rows[digest] = rows + i
+            self._known = rows + len(new)
+
+    def close(self) -> None:
+        self._keys_file.close()
+        self._vectors_file.close()
+        self._map = None
+
+
+class EmbeddingCache:
+    """
+    Caches embeddings keyed by (model, dim, sha256(text)).
+
+    A bounded LRU holds recently used vectors in memory. When ``path`` is given,
+    every embedded vector is also appended to a memory-mapped store under
+    ``path/<model>-<dim>/`` so it survives restarts.
+    """
+
+    def __init__(self, max_entries: int = 4096, path: Optional[Union[str, Path]] = None):
+        self.max_entries = max_entries
+        self.path = Path(path) if path else None
+        self._lru: "OrderedDict[CacheKey, np.ndarray]" = OrderedDict()
+        self._disk: Dict[Tuple[str, int], _DiskTier] = {}
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def _disk_tier(self, model: str, dim: int) -> Optional[_DiskTier]:
+        if self.path is None:
+            return None
+        tier = self._disk.get((model, dim))
+        if tier is None:
+            safe_model = "".join(c if c.isalnum() or c in "-_." else "_" for c in model)
+            tier = self._disk[(model, dim)] = _DiskTier(self.path / f"{safe_model}-{dim}", dim)
+        return tier
+
+    def get(self, model: str, dim: int, text: str) -> Optional[np.ndarray]:
+        """Look up a vector, promoting disk hits into the LRU."""
+        key = (model, dim, text_digest(text))
+        vector = self._lru.get(key)
+        if vector is not None:
+            self._lru.move_to_end(key)
+            self.hits += 1
+            return vector
+
+        tier = self._disk_tier(model, dim)
+        vector = tier.get(key[2]) if tier is not None else None
+        if vector is not None:
+            self._remember(key, vector)
+            self.hits += 1
+            self.disk_hits += 1
+            return vector
+
+        self.misses += 1
+        return None
+
+    def put_many(self, model: str, dim: int, texts: List[str], vectors: np.ndarray) -> None:
+        """Add freshly embedded vectors to both tiers."""
+        digests = [text_digest(t) for t in texts]
+        for digest, vector in zip(digests, vectors):
+            self._remember((model, dim, digest), vector)
+        tier = self._disk_tier(model, dim)
+        if tier is not None:
+            tier.put_many(list(zip(digests, vectors)))
+
+    def _remember(self, key: CacheKey, vector: np.ndarray) -> None:
+        # Copy row views so a cached vector does not pin its whole batch matrix
+        self._lru[key] = vector if vector.base is None else vector.copy()
+        self._lru.move_to_end(key)
+        while len(self._lru) > self.max_entries:
+            self._lru.popitem(last=False)
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def stats(self) -> dict:
+        """Counters for sizing the cache."""
+        return {
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": self.hit_rate,
+            "memory_entries": len(self._lru),
+            "disk_entries": sum(len(t) for t in self._disk.values())
+        }
+
+    def close(self) -> None:
+        """Close the on-disk tier's files."""
+        for tier in self._disk.values():
+            tier.close()
+        self._disk.clear()
+
+
+class CachedEmbedder(Embedder):
+    """Serves embeddings from an ``EmbeddingCache``, embedding only the misses."""
+
+    def __init__(self, embedder: Embedder, cache: EmbeddingCache):
+        self.embedder = embedder
+        self.cache = cache
+        self.model = embedder.model
+        self.dim = embedder.dim
+
+    def _lookup(self, texts: List[str]) -> Tuple[np.ndarray, List[str], List[int]]:
+        vectors = np.empty((len(texts), self.dim), dtype=np.float32)
+        missing: List[str] = []
+        missing_rows: List[int] = []
+        for row, text in enumerate(texts):
+            vector = self.cache.get(self.model, self.dim, text)
+            if vector is None:
+                missing.append(text)
+                missing_rows.append(row)
+            else:
+                vectors[row] = vector
+        return vectors, missing, missing_rows
+
+    async def embed(self, texts: List[str]) -> np.ndarray:
+        vectors, missing, missing_rows = self._lookup(texts)
+        if missing:
+            fresh = await self.embedder.embed(missing)
+            self.cache.put_many(self.model, self.dim, missing, fresh)
+            vectors[missing_rows] = fresh
+        return vectors
+
+    async def embed_one(self, text: str) -> np.ndarray:
+        vector = self.cache.get(self.model, self.dim, text)
+        if vector is None:
+            vector = await self.embedder.embed_one(text)
+            self.cache.put_many(self.model, self.dim, [text], vector[None, :])
+        return vector
+
+    def embed_sync(self, texts: List[str]) -> np.ndarray:
+        vectors, missing, missing_rows = self._lookup(texts)
+        if missing:
+            fresh = self.embedder.embed_sync(missing)
+            self.cache.put_many(self.model, self.dim, missing, fresh)
+            vectors[missing_rows] = fresh
+        return vectors
@@ -0,0 +1,233 @@
+"""
+Pluggable text embedders used by the memory bank.
+"""
+import asyncio
+from typing import Dict, List, Optional, Set, Tuple
+
+import numpy as np
+
+
+class Embedder:
+    """
+    Base class for turning texts into float32 embedding matrices.
+
+    Subclasses implement ``embed`` and, when they can work without an event loop,
+    ``embed_sync``.
+    """
+    model: str = "unknown"
+    dim: int = 0
+
+    async def embed(self, texts: List[str]) -> np.ndarray:
+        """Embed a batch of texts into a ``(len(texts), dim)`` float32 matrix."""
+        raise NotImplementedError
+
+    def embed_sync(self, texts: List[str]) -> np.ndarray:
+        """Synchronous variant of ``embed`` for embedders that support it."""
+        raise RuntimeError(
+            f"{type(self).__name__} can only embed asynchronously; use the async MemoryBank APIs"
+        )
+
+    async def embed_one(self, text: str) -> np.ndarray:
+        """Embed a single text."""
+        return (await self.embed([text]))[0]
+
+
+class RandomEmbedder(Embedder):
+    """Placeholder embedder returning random vectors. Retrieval through it is meaningless."""
+    model = "random"
+
+    def __init__(self, dim: int):
+        self.dim = dim
+
+    async def embed(self, texts: List[str]) -> np.ndarray:
+        return self.embed_sync(texts)
+
+    def embed_sync(self, texts: List[str]) -> np.ndarray:
+        return np.random.rand(len(texts), self.dim).astype(np.float32)
+
+
+class HashingEmbedder(Embedder):
+    """
+    Deterministic, offline embedder hashing character n-grams into ``dim`` signed buckets.
+
+    Each lowercased text is padded with spaces and every n-gram (by default of 3 to 5
+    bytes) is hashed to a dimension and a sign, a sparse random projection of the
+    n-gram counts. Rows are L2-normalized, so texts sharing many n-grams land close
+    together. Hashing runs over all texts of a batch at once with numpy, which keeps
+    it fast enough for benchmarks and CI without an API key.
+    """
+
+    _PRIME = np.uint64(0x100000001B3)
+
+    def __init__(self, dim: int, ngrams: Tuple[int, ...] = (3, 4, 5), seed: int = 0):
+        self.dim = dim
+        self.ngrams = tuple(ngrams)
+        self.seed = seed
+        self.model = f"hashing-{'-'.join(map(str, self.ngrams))}-{seed}"
+
+    async def embed(self, texts: List[str]) -> np.ndarray:
+        return self.embed_sync(texts)
+
+    def embed_sync(self, texts: List[str]) -> np.ndarray:
+        encoded = [f" {t.lower()} ".encode("utf-8") for t in texts]
+        lengths = np.fromiter(map(len, encoded), dtype=np.int64, count=len(encoded))
+        data = np.frombuffer(b"".join(encoded), dtype=np.uint8).astype(np.uint64)
+        rows = np.repeat(np.arange(len(texts)), lengths)
+        offsets = np.arange(len(data)) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+        remaining = lengths[rows] - offsets  # Bytes from each position to the end of its text
+
+        counts = np.zeros(len(texts) * self.dim, dtype=np.float64)
+        for n in self.ngrams:
+            starts = np.flatnonzero(remaining >= n)
+            h = np.full(len(starts), np.uint64(self.seed * 1000003 + n))
+            for j in range(n):
+                h = h * self._PRIME + data[starts + j]
+            h = _mix64(h)
+            buckets = rows[starts] * self.dim + (h % np.uint64(self.dim)).astype(np.int64)
+            signs = np.where(h >> np.uint64(63), 1.0, -1.0)
+            counts += np.bincount(buckets, weights=signs, minlength=len(counts))
+
+        vectors = counts.reshape(len(texts), self.dim).astype(np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
+
+
+def _mix64(h: np.ndarray) -> np.ndarray:
+    """SplitMix64 finalizer, spreading the n-gram hashes over all 64 bits."""
+    h = h ^ (h >> np.uint64(30))
+    h = h * np.uint64(0xBF58476D1CE4E5B9)
+    h = h ^ (h >> np.uint64(27))
+    h = h * np.uint64(0x94D049BB133111EB)
+    return h ^ (h >> np.uint64(31))
+
+
+class LLMEmbedder(Embedder):
+    """
+    Embedder backed by ``LLMService.generate_embeddings``.
+
+    With ``dimensions`` set, the API is asked for vectors shortened to that size,
+    which the text-embedding-3 models return truncated and renormalized.
+    """
+
+    def __init__(
+        self,
+        llm_service,
+        model: str = "text-embedding-3-small",
+        dim: int = 1536,
+        dimensions: Optional[int] = None
+    ):
+        self.llm = llm_service
+        self.model = model
+        self.dimensions = dimensions
+        self.dim = dimensions or dim
+
+    async def embed(self, texts: List[str]) -> np.ndarray:
+        embeddings = await self.llm.generate_embeddings(
+            texts, model=self.model, dimensions=self.dimensions
+        )
+        return np.asarray(embeddings, dtype=np.float32).reshape(len(texts), self.dim)
+
+
+class TruncatingEmbedder(Embedder):
+    """
+    Keeps the first ``dim`` components of another embedder's vectors, renormalized.
+
+    Matryoshka-trained models such as text-embedding-3 pack the most information
+    into the leading components, so shortened vectors keep most of their recall.
+    """
+
+    def __init__(self, embedder: Embedder, dim: int):
+        if not 0 < dim <= embedder.dim:
+            raise ValueError(f"Cannot truncate {embedder.dim}-dimensional embeddings to {dim}")
+        self.embedder = embedder
+        self.model = embedder.model
+        self.dim = dim
+
+    def _truncate(self, vectors: np.ndarray) -> np.ndarray:
+        vectors = np.ascontiguousarray(vectors[:, :self.dim], dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
+
+    async def embed(self, texts: List[str]) -> np.ndarray:
+        return self._truncate(await self.embedder.embed(texts))
+
+    def embed_sync(self, texts: List[str]) -> np.ndarray:
+        return self._truncate(self.embedder.embed_sync(texts))
+
+
+class BatchingEmbedder(Embedder):
+    """
+    Coalesces concurrent embedding calls into micro-batches.
+
+    Texts queued within ``max_wait`` seconds of each other are sent to the wrapped
+    embedder as one request of at most ``max_batch_size`` texts. Duplicate texts in a
+    batch are embedded once.
+    """
+
+    def __init__(self, embedder: Embedder, max_batch_size: int = 64, max_wait: float = 0.005):
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size must be at least 1")
+        self.embedder = embedder
+        self.model = embedder.model
+        self.dim = embedder.dim
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self._pending: List[Tuple[str, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._inflight: Set[asyncio.Future] = set()
+        self.requests = 0  # Round-trips made to the wrapped embedder
+        self.texts_embedded = 0
+
+    async def embed(self, texts: List[str]) -> np.ndarray:
+        if not texts:
+            return np.empty((0, self.dim), dtype=np.float32)
+        loop = asyncio.get_running_loop()
+        futures = [self._enqueue(loop, text) for text in texts]
+        return np.stack(await asyncio.gather(*futures))
+
+    async def embed_one(self, text: str) -> np.ndarray:
+        """Embed a single text, sharing a request with any concurrent callers."""
+        return await self._enqueue(asyncio.get_running_loop(), text)
+
+    def embed_sync(self, texts: List[str]) -> np.ndarray:
+        self.requests += 1
+        self.texts_embedded += len(texts)
+        return self.embedder.embed_sync(texts)
+
+    def _enqueue(self, loop: asyncio.AbstractEventLoop, text: str) -> asyncio.Future:
+        future = loop.create_future()
+        self._pending.append((text, future))
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait, self._flush)
+        return future
+
+    def _flush(self) -> None:
+        """Send every queued text to the wrapped embedder in max-size batches."""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        while self._pending:
+            batch = self._pending[:self.max_batch_size]
+            del self._pending[:self.max_batch_size]
+            task = asyncio.ensure_future(self._run(batch))
+            self._inflight.add(task)
+            task.add_done_callback(self._inflight.discard)
+
+    async def _run(self, batch: List[Tuple[str, asyncio.Future]]) -> None:
+        positions: Dict[str, int] = {}
+        for text, _ in batch:
+            positions.setdefault(text, len(positions))
+        self.requests += 1
+        self.texts_embedded += len(positions)
+        try:
+            vectors = await self.embedder.embed(list(positions))
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for text, future in batch:
+            if not future.done():
+                future.set_result(vectors[positions[text]])
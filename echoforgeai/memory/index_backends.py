@@ -0,0 +1,107 @@
+"""
+FAISS index backends selectable through ``MemoryBank(backend=...)``.
+"""
+import math
+from typing import Optional
+
+import faiss
+import numpy as np
+from pydantic import BaseModel
+
+BACKENDS = ("flat", "ivf", "hnsw", "ivfpq")
+_ALIASES = {"faiss": "flat"}
+_SCALAR_QUANTIZERS = {
+    "float16": faiss.ScalarQuantizer.QT_fp16,
+    "int8": faiss.ScalarQuantizer.QT_8bit,
+}
+
+
+class IndexConfig(BaseModel):
+    """Build and search parameters for the approximate backends."""
+    min_train_size: int = 10000  # Banks smaller than this stay on an exact flat index
+    nlist: Optional[int] = None  # IVF cells; defaults to ~4 * sqrt(n) at training time
+    nprobe: int = 16  # IVF cells visited per query
+    hnsw_m: int = 32  # HNSW neighbours per node
+    ef_construction: int = 64
+    ef_search: int = 64  # HNSW candidate list size per query
+    pq_m: int = 16  # PQ sub-quantizers; must divide the embedding dimension
+    pq_bits: int = 8
+
+
+def resolve_backend(backend: str) -> str:
+    """Map a user-facing backend name onto one of ``BACKENDS``."""
+    name = _ALIASES.get(backend.lower(), backend.lower())
+    if name not in BACKENDS:
+        raise ValueError(f"Unsupported memory backend: {backend}. Expected one of {BACKENDS}")
+    return name
+
+
+def supports_removal(kind: str) -> bool:
+    """Whether ``remove_ids`` works on this kind of index; HNSW graphs must be rebuilt."""
+    return kind != "hnsw"
+
+
+def build_index(
+    kind: str,
+    dim: int,
+    config: IndexConfig,
+    train_vectors: Optional[np.ndarray] = None,
+    vector_dtype: str = "float32"
+) -> faiss.Index:
+    """
+    Build an empty, trained approximate index that accepts ``add_with_ids``.
+
+    The "flat" kind has no index: the memory bank searches its slot matrix directly.
+    HNSW is wrapped in an ``IndexIDMap2``; IVF indexes store ids natively (and reorder
+    their lists on removal, which an id map cannot track). ``train_vectors`` is
+    required for the IVF kinds. With a ``vector_dtype`` of "float16" or "int8", the
+    HNSW and IVF indexes store scalar-quantized vectors of that precision.
+    """
+    quantizer_type = _SCALAR_QUANTIZERS.get(vector_dtype)
+    if kind == "hnsw":
+        if quantizer_type is None:
+            inner = faiss.IndexHNSWFlat(dim, config.hnsw_m)
+        else:
+            inner = faiss.IndexHNSWSQ(dim, quantizer_type, config.hnsw_m)
+            if train_vectors is not None and len(train_vectors):
+                inner.train(np.ascontiguousarray(train_vectors, dtype=np.float32))
+        inner.hnsw.efConstruction = config.ef_construction
+    elif kind in ("ivf", "ivfpq"):
+        if train_vectors is None or len(train_vectors) == 0:
+            raise ValueError(f"The {kind} backend needs training vectors")
+        n = len(train_vectors)
+        nlist = config.nlist or int(4 * math.sqrt(n))
+        nlist = max(1, min(nlist, n // 39 or 1))  # FAISS wants ~39 points per centroid
+        quantizer = faiss.IndexFlatL2(dim)
+        if kind == "ivf" and quantizer_type is not None:
+            inner = faiss.IndexIVFScalarQuantizer(quantizer, dim, nlist, quantizer_type)
+        elif kind == "ivf":
+            inner = faiss.IndexIVFFlat(quantizer, dim, nlist)
+        else:
+            if dim % config.pq_m:
+                raise ValueError(f"pq_m={config.pq_m} must divide embedding_dim={dim}")
+            inner = faiss.IndexIVFPQ(quantizer, dim, nlist, config.pq_m, config.pq_bits)
+        inner.train(np.ascontiguousarray(train_vectors, dtype=np.float32))
+        return inner
+    else:
+        raise ValueError(f"Unknown index kind: {kind}")
+    return faiss.IndexIDMap2(inner)
+
+
+def search_params(
+    kind: str,
+    config: IndexConfig,
+    selector: Optional[faiss.IDSelector] = None
+) -> Optional[faiss.SearchParameters]:
+    """Per-query search parameters for the given kind of index."""
+    if kind in ("ivf", "ivfpq"):
+        params = faiss.SearchParametersIVF(nprobe=config.nprobe)
+    elif kind == "hnsw":
+        params = faiss.SearchParametersHNSW(efSearch=config.ef_search)
+    elif selector is None:
+        return None
+    else:
+        params = faiss.SearchParameters()
+    if selector is not None:
+        params.sel = selector
+    return params
@@ -0,0 +1,148 @@
+"""
+In-process BM25 inverted index kept alongside the vector index of a memory bank.
+"""
+import math
+import re
+from array import array
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+_TOKEN = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased word tokens."""
+    return _TOKEN.findall(text.lower())
+
+
+class BM25Index:
+    """
+    Okapi BM25 over memory texts, addressed by memory id.
+
+    Like ``MemoryBank``, the index maps id ``i`` onto slot ``i % capacity``, so
+    per-document lengths live in flat arrays. Postings are append-only arrays of
+    document stamps, slots and term frequencies. Every ``add`` gets a new stamp,
+    so postings of removed texts are skipped at query time even when their id is
+    added again with other text, and they are purged once dead postings
+    outnumber live ones; removal costs one pass over the text.
+
+    Terms found in more than ``max_df`` of the memories act as stop words: they
+    carry almost no idf weight and are skipped at query time.
+    """
+
+    def __init__(self, capacity: int, k1: float = 1.2, b: float = 0.75, max_df: float = 0.5):
+        self.capacity = capacity
+        self.k1 = k1
+        self.b = b
+        self.max_df = max_df
+        self._slot_ids = np.full(capacity, -1, dtype=np.int64)
+        self._stamps = np.full(capacity, -1, dtype=np.int64)  # Stamp of the document in each slot
+        self._next_stamp = 0
+        self._lengths = np.zeros(capacity, dtype=np.float32)
+        self._postings: Dict[str, Tuple[array, array, array]] = {}  # term -> (stamps, slots, tfs)
+        self._df: Counter = Counter()  # Live documents per term
+        self._docs = 0
+        self._total_length = 0
+        self._live_postings = 0
+        self._dead_postings = 0
+
+    def __len__(self) -> int:
+        return self._docs
+
+    def add(self, memory_id: int, text: str) -> None:
+        """Index a memory's text."""
+        terms = Counter(tokenize(text))
+        slot = memory_id % self.capacity
+        stamp = self._next_stamp
+        self._next_stamp += 1
+        self._slot_ids[slot] = memory_id
+        self._stamps[slot] = stamp
+        self._lengths[slot] = sum(terms.values())
+        self._docs += 1
+        self._total_length += int(self._lengths[slot])
+        for term, tf in terms.items():
+            postings = self._postings.get(term)
+            if postings is None:
+                postings = self._postings[term] = (array("q"), array("i"), array("f"))
+            postings[0].append(stamp)
+            postings[1].append(slot)
+            postings[2].append(tf)
+            self._df[term] += 1
+        self._live_postings += len(terms)
+
+    def remove(self, memory_id: int, text: str) -> None:
+        """Forget a memory; ``text`` must be the text it was added with."""
+        slot = memory_id % self.capacity
+        if self._slot_ids[slot] != memory_id:
+            return
+        self._slot_ids[slot] = -1
+        self._stamps[slot] = -1
+        self._docs -= 1
+        self._total_length -= int(self._lengths[slot])
+        terms = set(tokenize(text))
+        for term in terms:
+            self._df[term] -= 1
+            if not self._df[term]:
+                del self._df[term]
+        self._live_postings -= len(terms)
+        self._dead_postings += len(terms)
+        if self._dead_postings > self._live_postings:
+            self._purge()
+
+    def _purge(self) -> None:
+        """Drop postings of removed memories."""
+        for term in list(self._postings):
+            stamps, slots, tfs = (np.frombuffer(a, dtype=a.typecode) for a in self._postings[term])
+            live = self._stamps[slots] == stamps
+            if not live.any():
+                del self._postings[term]
+            elif not live.all():
+                self._postings[term] = tuple(
+                    array(a.dtype.char, a[live].tobytes()) for a in (stamps, slots, tfs)
+                )
+        self._dead_postings = 0
+
+    def search(
+        self,
+        query: str,
+        limit: int,
+        candidates: Optional[np.ndarray] = None
+    ) -> Tuple[List[int], List[float]]:
+        """
+        Best-scoring memory ids for ``query`` with their BM25 scores.
+
+        Args:
+            query: The query text
+            limit: Maximum number of results
+            candidates: Optional ids the results are restricted to
+        """
+        if not self._docs:
+            return [], []
+        average_length = self._total_length / self._docs
+        norms = self.k1 * (1 - self.b + self.b * self._lengths / np.float32(average_length))
+        # Term postings hold each slot once, so scores accumulate by plain fancy indexing
+        scores = np.zeros(self.capacity, dtype=np.float32)
+        for term in set(tokenize(query)):
+            df = self._df.get(term)
+            if not df or (df > 1 and df > self.max_df * self._docs):
+                continue
+            stamps, slots, tfs = (np.frombuffer(a, dtype=a.typecode) for a in self._postings[term])
+            if self._dead_postings:
+                live = self._stamps[slots] == stamps
+                tfs, slots = tfs[live], slots[live]
+            idf = np.float32(math.log(1 + (self._docs - df + 0.5) / (df + 0.5)))
+            scores[slots] += idf * (self.k1 + 1) * tfs / (tfs + norms[slots])
+        if candidates is not None:
+            allowed = np.zeros(self.capacity, dtype=bool)
+            allowed[candidates % self.capacity] = True
+            scores[~allowed] = 0
+
+        k = min(limit, self.capacity)
+        if k <= 0:
+            return [], []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        top = top[scores[top] > 0]
+        return self._slot_ids[top].tolist(), scores[top].tolist()
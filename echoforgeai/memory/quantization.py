@@ -0,0 +1,41 @@
+"""
+Reduced-precision storage for embedding vectors.
+"""
+from typing import Optional, Tuple
+
+import numpy as np
+
+VECTOR_DTYPES = ("float32", "float16", "int8")
+
+
+def check_vector_dtype(dtype: str) -> str:
+    if dtype not in VECTOR_DTYPES:
+        raise ValueError(f"Unsupported vector dtype: {dtype}. Expected one of {VECTOR_DTYPES}")
+    return dtype
+
+
+def quantize(vectors: np.ndarray, dtype: str) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+    """
+    Convert float32 vectors to ``dtype``.
+
+    int8 quantization is symmetric per vector: each row is scaled so its largest
+    component maps to 127, and the float32 scales are returned alongside the
+    codes (None for the float dtypes).
+    """
+    check_vector_dtype(dtype)
+    if dtype != "int8":
+        return np.asarray(vectors).astype(dtype, copy=False), None
+    vectors = np.asarray(vectors, dtype=np.float32)
+    scales = np.maximum(np.abs(vectors).max(axis=-1), 1e-12) / 127
+    codes = np.round(vectors / scales[..., None]).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+
+def dequantize(stored: np.ndarray, scales: Optional[np.ndarray] = None) -> np.ndarray:
+    """Float32 vectors from the output of ``quantize``."""
+    if stored.dtype == np.float32:
+        return stored
+    vectors = stored.astype(np.float32)
+    if scales is not None:
+        vectors *= scales[..., None]
+    return vectors
@@ -0,0 +1,97 @@
+"""
+Cache of retrieval results, valid for one version of a memory bank.
+"""
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+
+import numpy as np
+
+
+class QueryResultCache:
+    """
+    Maps a query to the result it retrieved, e.g. the ranked memory ids.
+
+    Entries are keyed by the query vector quantized to ``resolution``, so repeated
+    and numerically near-identical queries share an entry, together with the
+    filter, limit and ranking options. Every entry belongs to one bank
+    generation; the first lookup after the bank changed drops them all. At most
+    ``max_entries`` results are kept, least recently used first out.
+    """
+
+    def __init__(self, max_entries: int = 1024, resolution: float = 1e-4):
+        self.max_entries = max_entries
+        self.resolution = resolution
+        self._entries: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self._generation: Optional[int] = None
+        # Searches share a read lock, so lookups can race on executor threads
+        self._mutex = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def key(
+        self,
+        query_vector: np.ndarray,
+        filter_metadata: Optional[Dict[str, Any]],
+        *options: Hashable
+    ) -> Optional[Hashable]:
+        """Cache key of a query, or None when its filter cannot be hashed."""
+        quantized = np.round(query_vector / self.resolution).astype(np.int64)
+        digest = hashlib.blake2b(quantized.tobytes(), digest_size=16).digest()
+        try:
+            filter_key = tuple(sorted((filter_metadata or {}).items()))
+            hash(filter_key)
+        except TypeError:
+            return None
+        return (digest, filter_key) + options
+
+    def get(self, key: Optional[Hashable], generation: int) -> Any:
+        """The result cached for ``key`` in the given bank generation, or None."""
+        if key is None:
+            return None
+        with self._mutex:
+            self._sync(generation)
+            result = self._entries.get(key)
+            if result is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return result
+
+    def put(self, key: Optional[Hashable], result: Any, generation: int) -> None:
+        if key is None:
+            return
+        with self._mutex:
+            self._sync(generation)
+            self._entries[key] = result
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _sync(self, generation: int) -> None:
+        if generation != self._generation:
+            if self._entries:
+                self.invalidations += 1
+            self._entries.clear()
+            self._generation = generation
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def stats(self) -> dict:
+        """Counters for sizing the cache."""
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hit_rate,
+            "invalidations": self.invalidations,
+            "entries": len(self._entries)
+        }
@@ -0,0 +1,259 @@
+"""
+Multi-tenant memory service: many sessions sharing a few large memory banks.
+"""
+import heapq
+import zlib
+from datetime import datetime
+from typing import TYPE_CHECKING, Any, Dict, List, Optional
+
+import numpy as np
+
+from echoforgeai.memory.embeddings import Embedder
+from echoforgeai.memory.vector_store import Memory, MemoryBank, RetrievalWeights
+
+if TYPE_CHECKING:
+    from echoforgeai.graph.story_graph import StoryNode
+
+TENANT_FIELD = "tenant"
+
+
+class MemoryService:
+    """
+    Hosts the memories of many tenants (stories or sessions) in ``shards`` banks.
+
+    Each tenant lives in one shard, picked by a stable hash of its id, and every
+    memory carries the tenant id in an indexed ``tenant`` metadata field. Tenant
+    searches resolve their candidates from that posting list, so they only score
+    the tenant's own vectors. A tenant holding more than its quota loses its own
+    oldest memories first; a shard's ring buffer only evicts across tenants once
+    the shard itself is full, so ``shard_capacity`` should cover the tenants'
+    quotas.
+
+    Extra keyword arguments are passed to every shard's ``MemoryBank``.
+    """
+
+    def __init__(
+        self,
+        shards: int = 1,
+        shard_capacity: int = 100000,
+        tenant_quota: int = 1000,
+        embedding_dim: int = 1536,
+        embedder: Optional[Embedder] = None,
+        indexed_fields: tuple = ("character", "type"),
+        **bank_options: Any
+    ):
+        if shards < 1:
+            raise ValueError("A memory service needs at least one shard")
+        self.tenant_quota = tenant_quota
+        self.embedding_dim = embedding_dim
+        self.shards = [
+            MemoryBank(
+                embedding_dim=embedding_dim,
+                max_items=shard_capacity,
+                embedder=embedder,
+                indexed_fields=(TENANT_FIELD,) + tuple(f for f in indexed_fields if f != TENANT_FIELD),
+                **bank_options
+            )
+            for _ in range(shards)
+        ]
+        self._tenants: Dict[str, "TenantMemory"] = {}
+
+    def shard_for(self, tenant_id: str) -> MemoryBank:
+        """The bank holding a tenant's memories."""
+        return self.shards[zlib.crc32(tenant_id.encode("utf-8")) % len(self.shards)]
+
+    def tenant(self, tenant_id: Any, quota: Optional[int] = None) -> "TenantMemory":
+        """A bank-like view of one tenant's memories, created on first use."""
+        tenant_id = str(tenant_id)
+        view = self._tenants.get(tenant_id)
+        if view is None:
+            view = self._tenants[tenant_id] = TenantMemory(self, tenant_id, quota or self.tenant_quota)
+        elif quota is not None:
+            view.quota = quota
+        return view
+
+    async def drop_tenant(self, tenant_id: Any) -> int:
+        """Remove every memory of a tenant, e.g. when its session ends."""
+        tenant_id = str(tenant_id)
+        view = self._tenants.pop(tenant_id, None) or TenantMemory(self, tenant_id, self.tenant_quota)
+        return await view.clear()
+
+    def stats(self) -> dict:
+        """Occupancy per shard and the number of tenants with memories."""
+        return {
+            "shards": [len(bank) for bank in self.shards],
+            "capacity": [bank.max_items for bank in self.shards],
+            "tenants": sum(
+                1 for bank in self.shards for field, _ in bank._postings if field == TENANT_FIELD
+            )
+        }
+
+
+class TenantMemory:
+    """
+    One tenant's slice of a ``MemoryService``, with the ``MemoryBank`` API used by
+    ``Story`` and ``Character``. Every store is tagged with the tenant id and every
+    search is restricted to it.
+    """
+
+    def __init__(self, service: MemoryService, tenant_id: str, quota: int):
+        self.service = service
+        self.tenant_id = tenant_id
+        self.quota = quota
+        self.bank = service.shard_for(tenant_id)
+        self.embedding_dim = service.embedding_dim
+        self.summarizer = self.bank.summarizer
+
+    def _scoped(self, metadata: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        return {**(metadata or {}), TENANT_FIELD: self.tenant_id}
+
+    def _ids(self) -> set:
+        return self.bank._postings.get((TENANT_FIELD, self.tenant_id), set())
+
+    def __len__(self) -> int:
+        return len(self._ids())
+
+    @property
+    def memories(self) -> List[Memory]:
+        """The tenant's live memories ordered from oldest to newest."""
+        ids = np.array(sorted(self._ids()), dtype=np.int64)
+        return [self.bank._memory_at(int(slot)) for slot in self.bank._slots_of(ids)]
+
+    async def store(self, content: str, metadata: Optional[Dict[str, Any]] = None) -> int:
+        """Store a new memory for this tenant; returns its id."""
+        return (await self.store_many([content], [metadata]))[0]
+
+    async def store_many(
+        self,
+        contents: List[str],
+        metadatas: Optional[List[Optional[Dict[str, Any]]]] = None,
+        timestamps: Optional[List[datetime]] = None
+    ) -> List[int]:
+        """Store several memories for this tenant, then enforce its quota; returns their ids."""
+        if metadatas is None:
+            metadatas = [None] * len(contents)
+        ids = await self.bank.store_many(contents, [self._scoped(m) for m in metadatas], timestamps)
+        await self.bank._run_locked(True, self._enforce_quota)
+        return ids
+
+    def _enforce_quota(self) -> None:
+        ids = self._ids()
+        excess = len(ids) - self.quota
+        if excess > 0:
+            # Ids grow monotonically, so the smallest are the tenant's oldest memories
+            self.bank._remove_ids(heapq.nsmallest(excess, ids))
+
+    async def retrieve_relevant(
+        self,
+        query: str,
+        filter_metadata: Optional[Dict[str, Any]] = None,
+        limit: Optional[int] = 5,
+        weights: Optional[RetrievalWeights] = None,
+        max_distance: Optional[float] = None
+    ) -> List[Memory]:
+        """Retrieve the tenant's memories relevant to the query."""
+        return await self.bank.retrieve_relevant(
+            query, self._scoped(filter_metadata), limit, weights, max_distance
+        )
+
+    async def retrieve_many(
+        self,
+        queries: List[str],
+        filters: Optional[List[Optional[Dict[str, Any]]]] = None,
+        limit: Optional[int] = 5,
+        weights: Optional[RetrievalWeights] = None,
+        max_distance: Optional[float] = None
+    ) -> List[List[Memory]]:
+        """Retrieve the tenant's memories for several queries at once."""
+        if filters is None:
+            filters = [None] * len(queries)
+        return await self.bank.retrieve_many(
+            queries, [self._scoped(f) for f in filters], limit, weights, max_distance
+        )
+
+    async def remove(self, memory_ids: List[int]) -> int:
+        """Remove some of the tenant's memories by id."""
+        own = self._ids()
+        return await self.bank.remove([m for m in memory_ids if m in own])
+
+    def get_memory(self, memory_id: int) -> Optional[Memory]:
+        """One of the tenant's memories by id, or None."""
+        return self.bank.get_memory(memory_id) if memory_id in self._ids() else None
+
+    def get_memories(self, memory_ids: List[int]) -> List[Memory]:
+        """The tenant's memories among ``memory_ids``, in the given order."""
+        own = self._ids()
+        return self.bank.get_memories([m for m in memory_ids if m in own])
+
+    async def update_memory(
+        self,
+        memory_id: int,
+        content: Optional[str] = None,
+        metadata: Optional[Dict[str, Any]] = None
+    ) -> bool:
+        """Replace the content and/or metadata of one of the tenant's memories."""
+        if memory_id not in self._ids():
+            return False
+        scoped = None if metadata is None else self._scoped(metadata)
+        return await self.bank.update_memory(memory_id, content, scoped)
+
+    async def delete_memory(self, memory_id: int) -> bool:
+        """Remove one of the tenant's memories by id."""
+        return await self.remove([memory_id]) == 1
+
+    async def clear(self) -> int:
+        """Remove all of the tenant's memories."""
+        return await self.bank.remove(list(self._ids()))
+
+    async def generate_chapter_summary(self, nodes: List["StoryNode"]) -> str:
+        """Summarize the tenant's memories linked from the given story nodes' ``memory_ids``."""
+        wanted = {i for node in nodes for i in node.memory_ids}
+        return await self.bank.summarize_memories(sorted(wanted & self._ids()))
+
+    def export_state(self) -> dict:
+        """
+        Export the tenant's memories in the ``MemoryBank.export_state`` format, with
+        the shard's config, so a ``MemoryBank`` can import them under the same ids.
+        """
+        slots = self.bank._slots_of(np.array(sorted(self._ids()), dtype=np.int64))
+        return {
+            "memories": [
+                {
+                    "id": int(self.bank._slot_ids[slot]),
+                    "content": self.bank._contents[slot],
+                    "metadata": {
+                        k: v for k, v in self.bank._metadata[slot].items() if k != TENANT_FIELD
+                    },
+                    "timestamp": datetime.fromtimestamp(self.bank._timestamps[slot]).isoformat(),
+                    "count": int(self.bank._counts[slot]),
+                    "embedding": self.bank._decode(slot).tolist()
+                }
+                for slot in slots
+            ],
+            "next_id": self.bank._next_id,
+            "config": {**self.bank._config_state(), TENANT_FIELD: self.tenant_id}
+        }
+
+    async def import_state(self, state: dict) -> Dict[int, int]:
+        """
+        Replace the tenant's memories with an exported state, keeping their embeddings.
+
+        The memories get new ids in the shared bank.
+
+        Returns:
+            The new id of each exported id, for rewriting ids kept elsewhere (e.g.
+            ``StoryNode.memory_ids``); memories exported without an id are left out
+        """
+        await self.clear()
+        memories = state["memories"][-self.quota:]
+        if not memories:
+            return {}
+        ids = await self.bank._run_locked(
+            True,
+            self.bank._add_many,
+            [m["content"] for m in memories],
+            [self._scoped(m["metadata"]) for m in memories],
+            np.array([m["embedding"] for m in memories], dtype=np.float32),
+            np.array([datetime.fromisoformat(m["timestamp"]).timestamp() for m in memories])
+        )
+        return {m["id"]: new_id for m, new_id in zip(memories, ids) if "id" in m and new_id >= 0}
@@ -0,0 +1,38 @@
+"""
+Pluggable summarizers used to condense groups of memories.
+"""
+from typing import List
+
+
+class Summarizer:
+    """Base class for turning several memory texts into one summary text."""
+
+    async def summarize(self, texts: List[str]) -> str:
+        """Summarize ``texts``, oldest first, into a single memory."""
+        raise NotImplementedError
+
+
+class LLMSummarizer(Summarizer):
+    """Summarizer backed by ``LLMService.summarize``."""
+
+    def __init__(self, llm_service):
+        self.llm = llm_service
+
+    async def summarize(self, texts: List[str]) -> str:
+        return await self.llm.summarize("\n".join(texts))
+
+
+class ExtractiveSummarizer(Summarizer):
+    """Local stand-in that keeps the first sentence of each text, up to ``max_chars``."""
+
+    def __init__(self, max_chars: int = 500):
+        self.max_chars = max_chars
+
+    async def summarize(self, texts: List[str]) -> str:
+        sentences = []
+        for text in texts:
+            first = text.strip().split(". ", 1)[0].rstrip(".")
+            if first and first not in sentences:
+                sentences.append(first)
+        summary = ". ".join(sentences) + "." if sentences else ""
+        return summary[:self.max_chars]
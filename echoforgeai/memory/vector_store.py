@@ -1,84 +1,751 @@
 """
 Vector-based memory storage implementation using FAISS.
 """
+import asyncio
 import json
-from typing import Dict, List, Optional, Any, UUID
+import os
+import sys
+from collections import defaultdict
+from concurrent.futures import Executor
+from pathlib import Path
+from typing import TYPE_CHECKING, Callable, Dict, Hashable, List, Optional, Any, Set, Tuple, Union
 from datetime import datetime
 import numpy as np
 import faiss
 from pydantic import BaseModel, Field
 
+from echoforgeai.memory.concurrency import ReadWriteLock
+from echoforgeai.memory.embeddings import BatchingEmbedder, Embedder, HashingEmbedder
+from echoforgeai.memory.embedding_cache import CachedEmbedder, EmbeddingCache
+from echoforgeai.memory.lexical import BM25Index
+from echoforgeai.memory.quantization import check_vector_dtype, dequantize, quantize
+from echoforgeai.memory.result_cache import QueryResultCache
+from echoforgeai.memory.summarizers import Summarizer
+from echoforgeai.memory.wal import WriteAheadLog
+from echoforgeai.memory.index_backends import (
+    IndexConfig,
+    build_index,
+    resolve_backend,
+    search_params,
+    supports_removal,
+)
+
+if TYPE_CHECKING:
+    from echoforgeai.graph.story_graph import StoryNode
+
+
+DEFAULT_IMPORTANCE = 0.5
+_DECODE_BLOCK = 2048  # Rows of reduced-precision vectors widened to float32 at a time
+
+
+def _write_replacing(path: Path, write: Callable[[Path], None]) -> None:
+    """
+    Write a file through a temporary sibling that then replaces it.
+    
+    A bank loaded from the old file keeps its memory map of the old contents
+    instead of seeing the file truncated under it.
+    """
+    tmp = path.with_name(f"tmp-{path.name}")
+    write(tmp)
+    os.replace(tmp, path)
+
+
+def _range_search_l2(
+    query_vectors: np.ndarray,
+    vectors: np.ndarray,
+    radius: float
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """The range-search counterpart of ``faiss.knn``: (lims, distances, rows) within ``radius``."""
+    nq = len(query_vectors)
+    result = faiss.RangeSearchResult(nq)
+    faiss.range_search_L2sqr(
+        faiss.swig_ptr(query_vectors), faiss.swig_ptr(vectors),
+        vectors.shape[1], nq, len(vectors), float(radius), result
+    )
+    lims = faiss.rev_swig_ptr(result.lims, nq + 1).copy()
+    found = int(lims[-1])
+    return (
+        lims,
+        faiss.rev_swig_ptr(result.distances, found).copy(),
+        faiss.rev_swig_ptr(result.labels, found).copy()
+    )
+
 
 class Memory(BaseModel):
     """A single memory entry with its metadata."""
     content: str
     metadata: Dict[str, Any] = Field(default_factory=dict)
     timestamp: datetime = Field(default_factory=datetime.now)
-    embedding: Optional[List[float]] = None
+    embedding: Optional[List[float]] = None  # Not populated by MemoryBank, which keeps vectors in its slot matrix
+    id: Optional[int] = None  # Stable 64-bit id, also used as the FAISS id
+    count: int = 1  # Times this memory was stored; near-duplicates merge into one entry
+
+
+class RetrievalWeights(BaseModel):
+    """How retrieval blends relevance with how recent and how important a memory is."""
+    relevance: float = 1.0
+    recency: float = 0.0
+    importance: float = 0.0
+    half_life_hours: float = 24.0  # Age at which the recency score halves
+    candidate_factor: int = 4  # Nearest neighbours fetched per result before re-ranking
+
+    @property
+    def relevance_only(self) -> bool:
+        return not (self.recency or self.importance)
 
 
 class MemoryBank:
     """
     Manages storage and retrieval of memories using vector embeddings.
+    
+    Memories live in a circular buffer of ``max_items`` slots whose vectors form one
+    contiguous float32 matrix. Every memory gets a stable, monotonically increasing
+    int64 id, so evicting the oldest memory never renumbers the others. The flat
+    backend searches the slot matrix directly, making eviction an in-place overwrite;
+    approximate indexes tombstone evicted ids and purge them in batches, keeping
+    inserts at capacity O(1) amortized.
+    
+    Storage is columnar: per-slot arrays of ids, timestamps and importance next to
+    the vector matrix, with content strings interned and identical metadata dicts
+    shared. ``Memory`` objects are only built for the results handed back.
+    
+    Embeddings come from a pluggable ``Embedder``, by default the local, deterministic
+    ``HashingEmbedder``. Concurrent ``store`` and ``retrieve_relevant`` calls are
+    micro-batched into a single embeddings request of at most ``max_batch_size``
+    texts, waiting at most ``max_batch_wait`` seconds.
+    An optional ``EmbeddingCache`` sits in front of the batcher, so repeated texts
+    (the same player input across narrative and character recall) embed once.
+    
+    Metadata fields listed in ``indexed_fields`` are kept in an inverted index. A
+    filtered query resolves its candidate ids from the postings and hands them to
+    FAISS as an id selector, so only matching vectors are scored and the top-k is
+    exact no matter how many other memories share the bank. Candidate sets of up to
+    ``exact_search_limit`` memories are scored directly from the slot vectors.
+    
+    ``backend`` selects the index type: "flat" (alias "faiss"), "ivf", "hnsw" or
+    "ivfpq". Approximate backends start out flat and are built, trained on the
+    vectors stored so far, once the bank holds ``index_config.min_train_size``
+    memories; ``nprobe``/``ef_search`` in the config are applied per query.
+    
+    ``vector_dtype`` sets the precision of the stored vectors: "float32", "float16"
+    at half the memory, or "int8", scalar-quantized per vector at a quarter. Exact
+    searches score float16 slots in place with FAISS's fp16 kernels and widen int8
+    slots to float32 block by block; the IVF and HNSW backends store
+    scalar-quantized vectors of the same precision.
+    
+    With ``max_distance`` set (squared L2 distance; ``2 - 2 * cosine`` for unit
+    vectors), memories farther than that from the query are left out, so weakly
+    related queries return fewer memories; ``range_stats`` counts how many were cut.
+    
+    Results are ranked by vector distance alone unless ``weights`` give recency or
+    importance some weight; then ``candidate_factor`` times as many neighbours are
+    fetched and re-ranked by the blended score in one vectorized pass.
+    
+    By default index work runs inline on the event loop. Given an ``executor``, the
+    async APIs run inserts and searches on its threads instead (FAISS and numpy
+    release the GIL), guarded by a per-bank read/write lock: searches proceed in
+    parallel, inserts run alone. The ``*_sync`` methods bypass the lock and must not
+    be mixed with async calls in flight.
+    
+    With ``dedup_threshold`` set, each new memory is compared with its nearest
+    neighbour among the stored memories that share its indexed metadata. At or above
+    that cosine similarity it is merged: the existing entry's count is bumped and its
+    timestamp and importance refreshed, and no slot is used. Merged memories keep
+    their place in the eviction order.
+    
+    With ``hybrid`` enabled, contents are also kept in a BM25 inverted index, updated
+    on every store and eviction. Retrieval then fuses the vector and lexical rankings
+    by reciprocal-rank fusion (constant ``rrf_k``), so exact names like "Silver
+    Flagon" are found even when their embeddings are not close.
+    
+    ``open_log`` makes the bank durable: every insert, merge and removal is appended
+    to a write-ahead log as it happens, so persisting a turn costs one small append
+    however large the bank is. Once the log outgrows ``checkpoint_bytes`` it is
+    compacted into a binary snapshot, and reopening the log recovers the latest
+    snapshot plus the records written after it.
+    
+    Ids are addressable: ``store`` returns the new memory's id, and ``get_memory``,
+    ``get_memories``, ``update_memory`` and ``delete_memory`` find it in O(1) from
+    the slot it maps to. Story nodes keep the ids of their memories, so chapter
+    summaries fetch them directly.
+    
+    With ``result_cache_size`` set, retrieval results are cached per query in a
+    ``QueryResultCache`` of that many entries. Every store, merge and eviction
+    bumps the bank's ``generation``, which invalidates the cache, so repeated
+    queries against an unchanged bank, e.g. several characters recalling within
+    one turn, skip the index search. Queries that give recency weight are not
+    cached, as their ranking changes with the clock.
     """
     
     def __init__(
         self,
         backend: str = "faiss",
         embedding_dim: int = 1536,  # OpenAI ada-002 dimension
-        max_items: int = 1000
+        max_items: int = 1000,
+        embedder: Optional[Embedder] = None,
+        max_batch_size: int = 64,
+        max_batch_wait: float = 0.005,
+        embedding_cache: Optional[EmbeddingCache] = None,
+        indexed_fields: Tuple[str, ...] = ("character", "type"),
+        index_config: Optional[IndexConfig] = None,
+        exact_search_limit: int = 20000,
+        weights: Optional[RetrievalWeights] = None,
+        executor: Optional[Executor] = None,
+        dedup_threshold: Optional[float] = None,
+        summarizer: Optional[Summarizer] = None,
+        hybrid: bool = False,
+        rrf_k: int = 60,
+        result_cache_size: int = 0,
+        vector_dtype: str = "float32",
+        max_distance: Optional[float] = None
     ):
         """Initialize the memory bank."""
         self.backend = backend
+        self._backend = resolve_backend(backend)
+        self.index_config = index_config or IndexConfig()
         self.embedding_dim = embedding_dim
+        self.vector_dtype = check_vector_dtype(vector_dtype)
         self.max_items = max_items
+        self.indexed_fields = tuple(indexed_fields)
+        self.exact_search_limit = exact_search_limit
+        self.weights = weights or RetrievalWeights()
+        self.executor = executor
+        self._lock = ReadWriteLock()
+        self.dedup_threshold = dedup_threshold
+        self.merged = 0  # Inserts folded into an existing near-duplicate
+        self.summarizer = summarizer
+        self.hybrid = hybrid
+        self.rrf_k = rrf_k
+        self.wal: Optional[WriteAheadLog] = None
+        self.checkpoint_bytes = 64 << 20
+        self.generation = 0  # Bumped by every change to the stored memories
+        self.result_cache = QueryResultCache(result_cache_size) if result_cache_size else None
+        self.max_distance = max_distance
+        self.range_queries = 0
+        self.range_returned = 0
+        self.range_cut = 0  # Results the distance cutoff removed from top-limit searches
         
-        # Initialize FAISS index
-        self.index = faiss.IndexFlatL2(embedding_dim)
-        
-        # Memory storage
-        self.memories: List[Memory] = []
-        
-    def _get_embedding(self, text: str) -> List[float]:
-        """Get embedding for a text string."""
-        # TODO: Implement actual embedding generation using OpenAI or alternative
-        # For now, return random embedding
-        return list(np.random.rand(self.embedding_dim))
-        
-    def store_sync(self, content: str, metadata: Optional[Dict[str, Any]] = None) -> None:
-        """Synchronous version of store for initialization."""
-        embedding = self._get_embedding(content)
-        memory = Memory(
-            content=content,
-            metadata=metadata or {},
-            embedding=embedding
+        if embedder is not None and embedder.dim != embedding_dim:
+            raise ValueError(
+                f"Embedder dimension {embedder.dim} does not match embedding_dim {embedding_dim}"
+            )
+        self.embedder: Embedder = BatchingEmbedder(
+            embedder or HashingEmbedder(embedding_dim),
+            max_batch_size=max_batch_size,
+            max_wait=max_batch_wait
         )
+        self.embedding_cache = embedding_cache
+        if embedding_cache is not None:
+            self.embedder = CachedEmbedder(self.embedder, embedding_cache)
+        self._reset()
+        
+    def _reset(self) -> None:
+        """Reset the index and the slot buffer to an empty state."""
+        self.generation += 1
+        # Approximate FAISS index addressed by stable memory ids; None while the
+        # bank is searched exactly, straight from the slot matrix
+        self.index: Optional[faiss.Index] = None
+        self._index_kind = "flat"
+        
+        # Circular slot buffer: slot -> memory id (-1 when empty), plus the slot's vector
+        self._slot_ids = np.full(self.max_items, -1, dtype=np.int64)
+        self._flat_sq: Optional[faiss.IndexScalarQuantizer] = None
+        if self.vector_dtype == "float16":
+            # The float16 slot matrix is the code array of a scalar-quantizer index,
+            # so exact searches run FAISS's SIMD fp16 kernels on it in place
+            self._flat_sq = faiss.IndexScalarQuantizer(self.embedding_dim, faiss.ScalarQuantizer.QT_fp16)
+            size = self.max_items * self._flat_sq.code_size
+            self._flat_sq.codes.resize(size)
+            self._flat_sq.ntotal = self.max_items
+            self._vectors = faiss.rev_swig_ptr(self._flat_sq.codes.data(), size).view(
+                np.float16
+            ).reshape(self.max_items, self.embedding_dim)
+        else:
+            self._vectors = np.zeros((self.max_items, self.embedding_dim), dtype=self.vector_dtype)
+        # Per-slot scales of int8 vectors
+        self._scales = np.ones(self.max_items, dtype=np.float32) if self.vector_dtype == "int8" else None
+        self._next_slot = 0
+        self._next_id = 0
+        
+        # Per-slot columns
+        self._timestamps = np.zeros(self.max_items, dtype=np.float64)  # POSIX seconds
+        self._importance = np.zeros(self.max_items, dtype=np.float32)
+        self._counts = np.zeros(self.max_items, dtype=np.int32)
+        self._contents: List[Optional[str]] = [None] * self.max_items
+        self._metadata: List[Optional[Dict[str, Any]]] = [None] * self.max_items
+        self._count = 0
+        
+        # Shared metadata dicts with their reference counts
+        self._metadata_pool: Dict[Any, list] = {}
+        
+        # Inverted metadata index: (field, value) -> ids of live memories
+        self._postings: Dict[Tuple[str, Any], Set[int]] = defaultdict(set)
+        
+        # BM25 index over contents for hybrid retrieval
+        self.lexical: Optional[BM25Index] = BM25Index(self.max_items) if self.hybrid else None
+        
+        # Evicted ids still present in the index, purged in batches
+        self._tombstones: set = set()
+        self._compact_threshold = max(1, self.max_items // 4)
+        
+    @property
+    def memories(self) -> List[Memory]:
+        """Live memories ordered from oldest to newest."""
+        return [self._memory_at(slot) for slot in self._live_slots()]
+        
+    def __len__(self) -> int:
+        return self._count
+        
+    def _live_slots(self) -> np.ndarray:
+        """Occupied slots ordered from oldest to newest memory."""
+        order = np.roll(np.arange(self.max_items), -self._next_slot)
+        return order[self._slot_ids[order] >= 0]
+        
+    def _live_mask(self, memory_ids: np.ndarray) -> np.ndarray:
+        """Which of ``memory_ids`` (possibly -1 padded) are still in the bank."""
+        return (memory_ids >= 0) & (self._slot_ids[self._slots_of(memory_ids)] == memory_ids)
+        
+    def _memory_at(self, slot: int) -> Memory:
+        """Materialize the memory stored in a slot."""
+        return Memory(
+            content=self._contents[slot],
+            metadata=self._metadata[slot],
+            timestamp=datetime.fromtimestamp(self._timestamps[slot]),
+            id=int(self._slot_ids[slot]),
+            count=int(self._counts[slot])
+        )
+        
+    def _encode(self, slots: Union[np.ndarray, slice], vectors: np.ndarray) -> None:
+        """Store float32 vectors into slots at the bank's precision."""
+        stored, scales = quantize(vectors, self.vector_dtype)
+        self._vectors[slots] = stored
+        if scales is not None:
+            self._scales[slots] = scales
+            
+    def _decode(self, slots: Union[np.ndarray, slice, int]) -> np.ndarray:
+        """Float32 vectors of the given slots."""
+        return dequantize(
+            self._vectors[slots], self._scales[slots] if self._scales is not None else None
+        )
+        
+    def _get_embedding(self, text: str) -> np.ndarray:
+        """Get embedding for a text string without an event loop."""
+        return self.embedder.embed_sync([text])[0]
+        
+    async def _embed(self, text: str) -> np.ndarray:
+        """Get embedding for a text string, batched with concurrent callers."""
+        return await self.embedder.embed_one(text)
+        
+    def _posting_keys(self, metadata: Dict[str, Any]) -> List[Tuple[str, Any]]:
+        """Inverted-index keys for the indexed fields present in ``metadata``."""
+        return [
+            (field, metadata[field])
+            for field in self.indexed_fields
+            if field in metadata and isinstance(metadata[field], Hashable)
+        ]
+        
+    def _intern_metadata(self, metadata: Dict[str, Any]) -> Dict[str, Any]:
+        """Share one dict between memories with identical metadata."""
+        try:
+            key = tuple(sorted(metadata.items()))
+            hash(key)
+        except TypeError:
+            return dict(metadata)  # Unhashable values are stored unshared
+        entry = self._metadata_pool.get(key)
+        if entry is None:
+            shared = {
+                sys.intern(k): sys.intern(v) if isinstance(v, str) else v
+                for k, v in metadata.items()
+            }
+            entry = self._metadata_pool[key] = [shared, 0]
+        entry[1] += 1
+        return entry[0]
+        
+    def _release_metadata(self, metadata: Dict[str, Any]) -> None:
+        try:
+            key = tuple(sorted(metadata.items()))
+            entry = self._metadata_pool[key]
+        except (TypeError, KeyError):
+            return
+        entry[1] -= 1
+        if not entry[1]:
+            del self._metadata_pool[key]
+        
+    def _write_slot(
+        self,
+        slot: int,
+        memory_id: int,
+        content: str,
+        metadata: Optional[Dict[str, Any]],
+        timestamp: float,
+        count: int = 1
+    ) -> None:
+        """Fill a free slot's columns and make it visible to filtered search."""
+        metadata = self._intern_metadata(metadata or {})
+        importance = metadata.get("importance", DEFAULT_IMPORTANCE)
+        self._slot_ids[slot] = memory_id
+        self._contents[slot] = sys.intern(content)
+        self._metadata[slot] = metadata
+        self._timestamps[slot] = timestamp
+        self._importance[slot] = importance if isinstance(importance, (int, float)) else DEFAULT_IMPORTANCE
+        self._counts[slot] = count
+        self._count += 1
+        self.generation += 1
+        if self.lexical is not None:
+            self.lexical.add(memory_id, content)
+        for key in self._posting_keys(metadata):
+            self._postings[key].add(memory_id)
+        
+    def _evict_slot(self, slot: int) -> None:
+        """Drop the memory in a slot and tombstone its id in the index."""
+        memory_id = int(self._slot_ids[slot])
+        self._clear_slot(slot)
+        self._slot_ids[slot] = -1
+        if self.index is not None:
+            self._tombstones.add(memory_id)
+            if len(self._tombstones) >= self._compact_threshold:
+                self._compact()
+                
+    def _clear_slot(self, slot: int) -> None:
+        """Forget a slot's columns and index entries, except its vector."""
+        memory_id = int(self._slot_ids[slot])
+        metadata = self._metadata[slot]
+        for key in self._posting_keys(metadata):
+            ids = self._postings[key]
+            ids.discard(memory_id)
+            if not ids:
+                del self._postings[key]
+        self._release_metadata(metadata)
+        if self.lexical is not None:
+            self.lexical.remove(memory_id, self._contents[slot])
+        self._contents[slot] = None
+        self._metadata[slot] = None
+        self._count -= 1
+        self.generation += 1
+            
+    def _compact(self) -> None:
+        """Purge tombstoned ids from the FAISS index in a single pass."""
+        if not self._tombstones:
+            return
+        if supports_removal(self._index_kind):
+            self.index.remove_ids(np.fromiter(self._tombstones, dtype=np.int64))
+            self._tombstones.clear()
+        else:
+            self._rebuild_index(self._index_kind)
+            
+    def _rebuild_index(self, kind: str) -> None:
+        """Rebuild the index from the live slots, training it on them if needed."""
+        self._index_kind = kind
+        self._tombstones.clear()
+        if kind == "flat":
+            self.index = None
+            return
+        live = self._slot_ids >= 0
+        vectors = self._decode(live)
+        self.index = build_index(
+            kind, self.embedding_dim, self.index_config,
+            train_vectors=vectors, vector_dtype=self.vector_dtype
+        )
+        if len(vectors):
+            self.index.add_with_ids(vectors, self._slot_ids[live])
+        
+    def _maybe_train_index(self) -> None:
+        """Switch from the flat fallback to the configured backend once large enough."""
+        if (
+            self._index_kind != self._backend
+            and self._count >= self.index_config.min_train_size
+        ):
+            self._rebuild_index(self._backend)
+        
+    def store_sync(self, content: str, metadata: Optional[Dict[str, Any]] = None) -> int:
+        """Synchronous version of store; requires an embedder that supports ``embed_sync``."""
+        return self._add_many([content], [metadata], self._get_embedding(content)[None, :])[0]
+        
+    def _add_many(
+        self,
+        contents: List[str],
+        metadatas: List[Optional[Dict[str, Any]]],
+        embeddings: np.ndarray,
+        timestamps: Optional[np.ndarray] = None
+    ) -> List[int]:
+        """
+        Insert already embedded memories into the next slots with a single index add.
+        
+        Returns:
+            The id of each memory: its new id, the id of the memory it was merged
+            into, or -1 if it fell off the front of an oversized batch
+        """
+        embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+        if timestamps is None:
+            timestamps = np.full(len(contents), datetime.now().timestamp())
+        
+        if self.dedup_threshold is not None and self._count:
+            ids = self._merge_duplicates(metadatas, embeddings)
+            fresh = ids < 0
+            if not fresh.all():
+                contents = [c for c, keep in zip(contents, fresh) if keep]
+                metadatas = [m for m, keep in zip(metadatas, fresh) if keep]
+                embeddings, timestamps = embeddings[fresh], timestamps[fresh]
+            ids[fresh] = self._insert(contents, metadatas, embeddings, timestamps)
+            return ids.tolist()
+        return self._insert(contents, metadatas, embeddings, timestamps).tolist()
+        
+    def _insert(
+        self,
+        contents: List[str],
+        metadatas: List[Optional[Dict[str, Any]]],
+        embeddings: np.ndarray,
+        timestamps: np.ndarray
+    ) -> np.ndarray:
+        """Write new memories into the next slots, evicting the oldest, and log the insert; returns their ids."""
+        # Only the newest max_items of an oversized batch can survive
+        skip = max(0, len(contents) - self.max_items)
+        if skip:
+            contents, metadatas, embeddings = contents[skip:], metadatas[skip:], embeddings[skip:]
+            timestamps = timestamps[skip:]
+            self._next_id += skip
+            self._next_slot = (self._next_slot + skip) % self.max_items
+        n = len(contents)
+        if not n:
+            return np.full(skip, -1, dtype=np.int64)
+            
+        ids = np.arange(self._next_id, self._next_id + n, dtype=np.int64)
+        slots = (self._next_slot + np.arange(n)) % self.max_items
+        self._next_id += n
+        self._next_slot = (self._next_slot + n) % self.max_items
+        
+        # Claim the slots, evicting their previous occupants (the oldest memories)
+        for slot in slots[self._slot_ids[slots] >= 0]:
+            self._evict_slot(int(slot))
+        for slot, memory_id, content, metadata, timestamp in zip(
+            slots, ids, contents, metadatas, timestamps
+        ):
+            self._write_slot(int(slot), int(memory_id), content, metadata, float(timestamp))
+        self._encode(slots, embeddings)
         
         # Add to FAISS index
-        self.index.add(np.array([embedding], dtype=np.float32))
+        if self.index is not None:
+            self.index.add_with_ids(embeddings, ids)
+        self._maybe_train_index()
+        
+        # Evictions follow from the ids, so the insert is the whole record
+        self._log({
+            "op": "add",
+            "first_id": int(ids[0]),
+            "contents": list(contents),
+            "metadata": [m or {} for m in metadatas],
+            "timestamps": [float(t) for t in timestamps]
+        }, embeddings)
+        return np.concatenate([np.full(skip, -1, dtype=np.int64), ids])
+            
+    def _merge_duplicates(
+        self,
+        metadatas: List[Optional[Dict[str, Any]]],
+        embeddings: np.ndarray
+    ) -> np.ndarray:
+        """
+        Fold new memories into stored near-duplicates.
+        
+        Returns the id each memory was merged into, or -1 for the memories that
+        still need a slot of their own.
+        """
+        metadatas = [m or {} for m in metadatas]
+        filters = [dict(self._posting_keys(m)) for m in metadatas]
+        ids, _ = self._search(embeddings, filters, 1)
+        
+        rows = [r for r, found in enumerate(ids) if found]
+        slots = np.array([ids[r][0] for r in rows], dtype=np.int64) % self.max_items
+        neighbours = self._decode(slots)
+        new = embeddings[rows]
+        similarity = np.einsum("ij,ij->i", new, neighbours) / np.maximum(
+            np.linalg.norm(new, axis=1) * np.linalg.norm(neighbours, axis=1), 1e-12
+        )
         
-        # Add to memory list
-        self.memories.append(memory)
+        targets = np.full(len(metadatas), -1, dtype=np.int64)
+        now = datetime.now().timestamp()
+        merged = []
+        for row, slot, score in zip(rows, slots, similarity):
+            metadata = metadatas[row]
+            if score < self.dedup_threshold:
+                continue
+            # Only merge within the same indexed metadata, e.g. the same character
+            if self._posting_keys(self._metadata[slot]) != self._posting_keys(metadata):
+                continue
+            importance = metadata.get("importance", DEFAULT_IMPORTANCE)
+            if isinstance(importance, (int, float)):
+                self._importance[slot] = max(self._importance[slot], importance)
+            self._timestamps[slot] = now
+            self._counts[slot] += 1
+            targets[row] = self._slot_ids[slot]
+            merged.append(slot)
+            self.generation += 1
+        self.merged += len(merged)
+        if merged:
+            merged = np.array(merged, dtype=np.int64)
+            self._log({
+                "op": "merge",
+                "ids": self._slot_ids[merged].tolist(),
+                "timestamps": self._timestamps[merged].tolist(),
+                "importance": self._importance[merged].tolist(),
+                "counts": self._counts[merged].tolist()
+            })
+        return targets
         
-        # Maintain max size
-        if len(self.memories) > self.max_items:
-            # Remove oldest memory
-            self.index.remove_ids(np.array([0]))
-            self.memories.pop(0)
+    def dedup_stats(self) -> dict:
+        """How much space near-duplicate merging has saved."""
+        return {
+            "merged": self.merged,
+            "live": self._count,
+            "bytes_saved": self.merged * self._vectors.itemsize * self.embedding_dim
+        }
+        
+    async def _run_locked(self, write: bool, fn: Callable, *args) -> Any:
+        """Run ``fn`` under the bank's lock, on the executor when one is configured."""
+        if self.executor is None:
+            # Inline calls never yield mid-operation, so the event loop serializes them
+            return fn(*args)
+        async with (self._lock.write() if write else self._lock.read()):
+            return await asyncio.get_running_loop().run_in_executor(self.executor, fn, *args)
             
     async def store(
         self,
         content: str,
         metadata: Optional[Dict[str, Any]] = None
-    ) -> None:
-        """Store a new memory."""
-        self.store_sync(content, metadata)
+    ) -> int:
+        """
+        Store a new memory.
+        
+        Returns:
+            Its id, or the id of the stored memory it was merged into
+        """
+        embedding = await self._embed(content)
+        ids = await self._run_locked(True, self._add_many, [content], [metadata], embedding[None, :])
+        return ids[0]
+        
+    async def store_many(
+        self,
+        contents: List[str],
+        metadatas: Optional[List[Optional[Dict[str, Any]]]] = None,
+        timestamps: Optional[List[datetime]] = None
+    ) -> List[int]:
+        """
+        Store several memories with one embeddings batch and one index add.
+        
+        Args:
+            contents: Memory texts, oldest first
+            metadatas: Optional metadata per memory, aligned with ``contents``
+            timestamps: Optional creation times, aligned with ``contents``; defaults to now
+            
+        Returns:
+            The id of each memory as in ``store``; -1 for memories that did not fit
+            into the bank
+        """
+        if metadatas is None:
+            metadatas = [None] * len(contents)
+        if len(metadatas) != len(contents) or (timestamps is not None and len(timestamps) != len(contents)):
+            raise ValueError("metadatas and timestamps must be aligned with contents")
+        if not contents:
+            return []
+        stamps = None if timestamps is None else np.array([t.timestamp() for t in timestamps])
+        embeddings = await self.embedder.embed(list(contents))
+        return await self._run_locked(
+            True, self._add_many, list(contents), list(metadatas), embeddings, stamps
+        )
+        
+    async def remove(self, memory_ids: List[int]) -> int:
+        """
+        Remove memories by id, freeing their slots for later inserts.
+        
+        Returns:
+            How many of the ids were still in the bank
+        """
+        return await self._run_locked(True, self._remove_ids, memory_ids)
+        
+    def _remove_ids(self, memory_ids: List[int]) -> int:
+        ids = np.asarray(memory_ids, dtype=np.int64)
+        live = ids[self._live_mask(ids)]
+        for slot in self._slots_of(live):
+            self._evict_slot(int(slot))
+        if len(live):
+            self._log({"op": "remove", "ids": live.tolist()})
+        return len(live)
+        
+    async def delete_memory(self, memory_id: int) -> bool:
+        """Remove one memory by id; False if it was no longer in the bank."""
+        return await self.remove([memory_id]) == 1
+
+    def get_memory(self, memory_id: int) -> Optional[Memory]:
+        """The memory with the given id, or None once it was removed or evicted."""
+        memories = self.get_memories([memory_id])
+        return memories[0] if memories else None
+
+    def get_memories(self, memory_ids: List[int]) -> List[Memory]:
+        """The memories still in the bank among ``memory_ids``, in the given order."""
+        ids = np.asarray(memory_ids, dtype=np.int64)
+        if not len(ids):
+            return []
+        return [self._memory_at(int(slot)) for slot in self._slots_of(ids[self._live_mask(ids)])]
+
+    async def update_memory(
+        self,
+        memory_id: int,
+        content: Optional[str] = None,
+        metadata: Optional[Dict[str, Any]] = None
+    ) -> bool:
+        """
+        Replace the content and/or metadata of a memory, keeping its id and timestamp.
+
+        The memory is re-embedded only when its content actually changes.
+
+        Returns:
+            False if the memory was no longer in the bank
+        """
+        current = self.get_memory(memory_id)
+        if current is None:
+            return False
+        embedding = None
+        if content is not None and content != current.content:
+            embedding = await self._embed(content)
+        return await self._run_locked(True, self._update, memory_id, content, metadata, embedding)
+
+    def _update(
+        self,
+        memory_id: int,
+        content: Optional[str],
+        metadata: Optional[Dict[str, Any]],
+        embedding: Optional[np.ndarray]
+    ) -> bool:
+        """Rewrite a live memory's slot in place, moving its vector if it was re-embedded."""
+        ids = np.array([memory_id], dtype=np.int64)
+        if not self._live_mask(ids)[0]:
+            return False
+        slot = int(self._slots_of(ids)[0])
+        content = self._contents[slot] if content is None else content
+        metadata = self._metadata[slot] if metadata is None else metadata
+        timestamp, count = float(self._timestamps[slot]), int(self._counts[slot])
+        self._clear_slot(slot)
+        self._write_slot(slot, memory_id, content, metadata, timestamp, count)
+        if embedding is not None:
+            embedding = np.ascontiguousarray(embedding, dtype=np.float32).reshape(1, -1)
+            self._encode(slice(slot, slot + 1), embedding)
+            if self.index is not None:
+                if supports_removal(self._index_kind):
+                    self.index.remove_ids(ids)
+                    self.index.add_with_ids(self._decode(slice(slot, slot + 1)), ids)
+                else:
+                    self._rebuild_index(self._index_kind)
+        self._log({
+            "op": "update", "id": memory_id, "content": content, "metadata": dict(self._metadata[slot])
+        }, embedding)
+        return True
         
     async def retrieve_relevant(
         self,
         query: str,
         filter_metadata: Optional[Dict[str, Any]] = None,
-        limit: int = 5
+        limit: Optional[int] = 5,
+        weights: Optional[RetrievalWeights] = None,
+        max_distance: Optional[float] = None
     ) -> List[Memory]:
         """
         Retrieve memories relevant to the query.
@@ -86,87 +753,722 @@ class MemoryBank:
         Args:
             query: The query string
             filter_metadata: Optional metadata filters
-            limit: Maximum number of memories to return
+            limit: Maximum number of memories to return; None for every memory
+                within ``max_distance``
+            weights: Optional ranking weights; defaults to the bank's ``weights``
+            max_distance: Optional squared L2 distance cutoff; defaults to the
+                bank's ``max_distance``
             
         Returns:
             List of relevant Memory objects
         """
-        # Get query embedding
-        query_embedding = self._get_embedding(query)
+        return (await self.retrieve_many([query], [filter_metadata], limit, weights, max_distance))[0]
+        
+    async def retrieve_many(
+        self,
+        queries: List[str],
+        filters: Optional[List[Optional[Dict[str, Any]]]] = None,
+        limit: Optional[int] = 5,
+        weights: Optional[RetrievalWeights] = None,
+        max_distance: Optional[float] = None
+    ) -> List[List[Memory]]:
+        """
+        Retrieve memories for several queries at once.
+        
+        Distinct query texts are embedded in one batch. Unfiltered queries share one
+        index search; filtered queries are scored together in one exact pass over
+        the union of their candidates. When ``weights`` give recency or importance
+        any weight, a larger candidate set is fetched and re-ranked by the blended
+        score.
+        
+        With a ``max_distance``, memories farther than that from the query are
+        dropped, so weakly related queries return fewer memories. Without a
+        ``limit`` this is a FAISS range search returning every memory in range.
+        
+        Args:
+            queries: The query strings
+            filters: Optional metadata filters per query, aligned with ``queries``
+            limit: Maximum number of memories to return per query; None for every
+                memory within ``max_distance``
+            weights: Optional ranking weights; defaults to the bank's ``weights``
+            max_distance: Optional squared L2 distance cutoff; defaults to the
+                bank's ``max_distance``
+            
+        Returns:
+            One list of relevant Memory objects per query
+        """
+        if filters is None:
+            filters = [None] * len(queries)
+        if len(filters) != len(queries):
+            raise ValueError("filters must be aligned with queries")
+        if max_distance is None:
+            max_distance = self.max_distance
+        if limit is None and max_distance is None:
+            raise ValueError("A limit or a max_distance is required")
+        if not queries or not self._count:
+            return [[] for _ in queries]
+        weights = weights or self.weights
+            
+        # Embed each distinct query text once
+        unique = list(dict.fromkeys(queries))
+        vectors = await self.embedder.embed(unique)
+        rows = {text: i for i, text in enumerate(unique)}
+        query_vectors = np.ascontiguousarray(
+            vectors[[rows[q] for q in queries]], dtype=np.float32
+        )
         
-        # Search in FAISS
-        D, I = self.index.search(
-            np.array([query_embedding], dtype=np.float32),
-            min(limit * 2, len(self.memories))  # Get extra results for filtering
+        return await self._run_locked(
+            False, self._retrieve_vectors, queries, query_vectors, filters, limit, weights, max_distance
         )
         
-        # Filter and sort results
-        results = []
-        for idx in I[0]:
-            memory = self.memories[idx]
+    def _retrieve_vectors(
+        self,
+        queries: List[str],
+        query_vectors: np.ndarray,
+        filters: List[Optional[Dict[str, Any]]],
+        limit: Optional[int],
+        weights: RetrievalWeights,
+        max_distance: Optional[float] = None
+    ) -> List[List[Memory]]:
+        """Search and rank already embedded queries, then build the resulting memories."""
+        results: List[Optional[Tuple[List[int], int]]] = [None] * len(queries)
+        # Recency scores age with the clock, not the generation
+        cache = self.result_cache if not weights.recency else None
+        if cache is not None:
+            options = (limit, max_distance, tuple(weights.model_dump().values()))
+            keys = [
+                # BM25 scores depend on the words, not just the vector
+                cache.key(vector, filter_metadata, *options, query if self.lexical is not None else None)
+                for query, vector, filter_metadata in zip(queries, query_vectors, filters)
+            ]
+            results = [cache.get(key, self.generation) for key in keys]
             
-            # Apply metadata filters
-            if filter_metadata:
-                matches_filter = all(
-                    memory.metadata.get(k) == v
-                    for k, v in filter_metadata.items()
-                )
-                if not matches_filter:
-                    continue
+        misses = [i for i, result in enumerate(results) if result is None]
+        if misses:
+            ids, cuts = self._search_ranked(
+                [queries[i] for i in misses],
+                query_vectors[misses],
+                [filters[i] for i in misses],
+                limit,
+                weights,
+                max_distance
+            )
+            for i, row, cut in zip(misses, ids, cuts):
+                results[i] = (row, cut)
+                if cache is not None:
+                    cache.put(keys[i], results[i], self.generation)
                     
-            results.append(memory)
-            if len(results) >= limit:
-                break
+        if max_distance is not None:
+            self.range_queries += len(results)
+            self.range_returned += sum(len(row) for row, _ in results)
+            self.range_cut += sum(cut for _, cut in results)
+        return [
+            [self._memory_at(int(slot)) for slot in self._slots_of(np.array(row, dtype=np.int64))]
+            for row, _ in results
+        ]
+        
+    def range_stats(self) -> dict:
+        """How many memories the distance cutoff has kept out of results."""
+        return {
+            "queries": self.range_queries,
+            "returned": self.range_returned,
+            "cut": self.range_cut,
+            "cut_per_query": self.range_cut / self.range_queries if self.range_queries else 0.0
+        }
+        
+    def _search_ranked(
+        self,
+        queries: List[str],
+        query_vectors: np.ndarray,
+        filters: List[Optional[Dict[str, Any]]],
+        limit: Optional[int],
+        weights: RetrievalWeights,
+        max_distance: Optional[float] = None
+    ) -> Tuple[List[List[int]], List[int]]:
+        """
+        Ids of the best memories for each query, in rank order.
+        
+        Also returns, per query, how many memories a search without ``max_distance``
+        would have returned on top; a pure range search (no ``limit``) cuts none.
+        """
+        plain = weights.relevance_only and self.lexical is None
+        depth = limit if plain or limit is None else limit * max(1, weights.candidate_factor)
+        ids, distances = self._search(query_vectors, filters, depth, max_distance if depth is None else None)
+        cuts = [0] * len(ids)
+        if max_distance is not None and depth is not None:
+            for r, (row, row_distances) in enumerate(zip(ids, distances)):
+                keep = int(np.searchsorted(row_distances, max_distance, side="right"))
+                cuts[r] = min(limit, len(row)) - min(limit, keep)
+                ids[r], distances[r] = row[:keep], row_distances[:keep]
+        if plain:
+            return ids, cuts
+            
+        relevance = [[-d for d in row] for row in distances]
+        if self.lexical is not None:
+            ids, relevance = self._fuse(queries, filters, ids, depth, in_range=max_distance is not None)
+        if weights.relevance_only:
+            ids = [row[:limit] for row in ids]
+        else:
+            ids = self._rank(ids, relevance, weights, limit)
+        return ids, cuts
+        
+    def _fuse(
+        self,
+        queries: List[str],
+        filters: List[Optional[Dict[str, Any]]],
+        vector_ids: List[List[int]],
+        depth: Optional[int],
+        in_range: bool = False
+    ) -> Tuple[List[List[int]], List[List[float]]]:
+        """
+        Merge vector and BM25 rankings by reciprocal-rank fusion.
+        
+        With ``in_range``, BM25 only re-orders the vector candidates, which already
+        passed the distance cutoff.
+        """
+        fused_ids = []
+        fused_scores = []
+        for query, filter_metadata, row in zip(queries, filters, vector_ids):
+            row_depth = depth or len(row)
+            candidates = None
+            if in_range:
+                candidates = np.array(row, dtype=np.int64)
+            elif filter_metadata:
+                matching = self._matching_ids(filter_metadata)
+                candidates = np.fromiter(matching, dtype=np.int64, count=len(matching))
+            lexical_ids, _ = self.lexical.search(query, row_depth, candidates)
+            scores: Dict[int, float] = defaultdict(float)
+            for ranking in (row, lexical_ids):
+                for rank, memory_id in enumerate(ranking):
+                    scores[memory_id] += 1.0 / (self.rrf_k + rank + 1)
+            ranked = sorted(scores.items(), key=lambda item: -item[1])[:row_depth]
+            fused_ids.append([memory_id for memory_id, _ in ranked])
+            fused_scores.append([score for _, score in ranked])
+        return fused_ids, fused_scores
+        
+    def _rank(
+        self,
+        ids: List[List[int]],
+        relevance: List[List[float]],
+        weights: RetrievalWeights,
+        limit: Optional[int]
+    ) -> List[List[int]]:
+        """
+        Re-rank candidate ids by blended relevance, recency and importance.
+        
+        All queries are scored in one pass over a padded candidate matrix. Relevance
+        scores (negated L2 distances, or fused rank scores) are min-max normalized
+        within each query's candidates, recency decays exponentially with age, and
+        importance is read from its column.
+        """
+        width = max((len(row) for row in ids), default=0)
+        if not width:
+            return [[] for _ in ids]
+        candidate_ids = np.full((len(ids), width), -1, dtype=np.int64)
+        candidate_scores = np.full((len(ids), width), -np.inf, dtype=np.float32)
+        for r, (row, row_scores) in enumerate(zip(ids, relevance)):
+            candidate_ids[r, :len(row)] = row
+            candidate_scores[r, :len(row)] = row_scores
+        valid = candidate_ids >= 0
+        slots = self._slots_of(np.where(valid, candidate_ids, 0))
+        
+        # Relevance: 1 for the best candidate of each query, 0 for the worst
+        best = np.where(valid, candidate_scores, -np.inf).max(axis=1, keepdims=True)
+        worst = np.where(valid, candidate_scores, np.inf).min(axis=1, keepdims=True)
+        spread = np.where(best > worst, best - worst, 1.0)
+        with np.errstate(invalid="ignore"):  # Padding and empty rows are masked below
+            relevance = 1.0 - (best - candidate_scores) / spread
+        
+        age_hours = np.maximum(datetime.now().timestamp() - self._timestamps[slots], 0.0) / 3600.0
+        recency = np.exp2(-age_hours / weights.half_life_hours)
+        
+        scores = (
+            weights.relevance * relevance
+            + weights.recency * recency
+            + weights.importance * self._importance[slots]
+        )
+        scores[~valid] = -np.inf
+        
+        k = min(limit or width, width)
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        top = np.take_along_axis(top, np.take_along_axis(-scores, top, 1).argsort(1), 1)
+        return [
+            [int(candidate_ids[r, c]) for c in row if valid[r, c]]
+            for r, row in enumerate(top)
+        ]
+        
+    def _search(
+        self,
+        query_vectors: np.ndarray,
+        filters: List[Optional[Dict[str, Any]]],
+        limit: Optional[int],
+        max_distance: Optional[float] = None
+    ) -> Tuple[List[List[int]], List[List[float]]]:
+        """
+        Ids of the nearest live memories for each query vector, with their distances.
+        
+        Without a ``limit``, every memory within ``max_distance`` is returned.
+        """
+        results: List[List[int]] = [[] for _ in filters]
+        result_distances: List[List[float]] = [[] for _ in filters]
+        
+        unfiltered = [i for i, f in enumerate(filters) if not f]
+        if unfiltered and limit is None:
+            for i, (row, row_distances) in zip(unfiltered, self._range_all(query_vectors[unfiltered], max_distance)):
+                results[i] = row
+                result_distances[i] = row_distances
+        elif unfiltered:
+            D, I = self._search_all(query_vectors[unfiltered], limit)
+            live = self._live_mask(I)
+            for i, row, row_distances, row_live in zip(unfiltered, I, D, live):
+                results[i] = row[row_live][:limit].tolist()
+                result_distances[i] = row_distances[row_live][:limit].tolist()
                 
-        return results
+        filtered = [i for i, f in enumerate(filters) if f]
+        if filtered:
+            candidates = [self._matching_ids(filters[i]) for i in filtered]
+            union = set().union(*candidates)
+            if self.index is None or len(union) <= self.exact_search_limit:
+                found = self._exact_search(query_vectors[filtered], candidates, union, limit, max_distance)
+            else:
+                found = [
+                    self._selector_search(query_vectors[i:i + 1], ids, limit, max_distance)
+                    for i, ids in zip(filtered, candidates)
+                ]
+            for i, (row, row_distances) in zip(filtered, found):
+                results[i] = row
+                result_distances[i] = row_distances
+                
+        return results, result_distances
+        
+    def _search_all(self, query_vectors: np.ndarray, limit: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Nearest distances and ids over the whole bank, padded with -1 and dead ids to filter out."""
+        if self.index is None:
+            # Exact search over the slot matrix, over-fetching by its empty slots
+            filled = self._filled
+            k = min(limit + filled - self._count, filled)
+            if self._flat_sq is not None:
+                filled_slots = faiss.IDSelectorRange(0, filled)
+                D, S = self._flat_sq.search(
+                    query_vectors, k, params=search_params("flat", self.index_config, filled_slots)
+                )
+            elif self._vectors.dtype == np.float32:
+                D, S = faiss.knn(query_vectors, self._vectors[:filled], k)
+            else:
+                D, S = self._blocked_knn(query_vectors, filled, k)
+            return D, np.where(S >= 0, self._slot_ids[S], -1)
+            
+        # Over-fetch by the number of tombstones still in the index
+        return self.index.search(
+            query_vectors,
+            min(limit + len(self._tombstones), self.index.ntotal),
+            params=search_params(self._index_kind, self.index_config)
+        )
+        
+    def _blocked_knn(self, query_vectors: np.ndarray, filled: int, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Exact search over reduced-precision slots, widening one block at a time."""
+        heap = faiss.ResultHeap(len(query_vectors), k)
+        for start in range(0, filled, _DECODE_BLOCK):
+            block = self._decode(slice(start, min(start + _DECODE_BLOCK, filled)))
+            D, S = faiss.knn(query_vectors, block, min(k, len(block)))
+            heap.add_result(D, np.where(S >= 0, S + start, -1))
+        heap.finalize()
+        return heap.D, heap.I
+        
+    def _range_all(self, query_vectors: np.ndarray, max_distance: float) -> List[Tuple[List[int], List[float]]]:
+        """Live memories within ``max_distance`` of each query vector over the whole bank, nearest first."""
+        parts: List[List[Tuple[np.ndarray, np.ndarray]]] = [[] for _ in query_vectors]
+        if self.index is not None:
+            lims, D, I = self.index.range_search(
+                query_vectors, max_distance, params=search_params(self._index_kind, self.index_config)
+            )
+            for r in range(len(query_vectors)):
+                parts[r].append((D[lims[r]:lims[r + 1]], I[lims[r]:lims[r + 1]]))
+        else:
+            filled = self._filled
+            step = _DECODE_BLOCK if self._vectors.dtype == np.int8 else max(filled, 1)
+            for start in range(0, filled, step):
+                stop = min(start + step, filled)
+                if self._flat_sq is not None:
+                    block_slots = faiss.IDSelectorRange(start, stop)
+                    lims, D, S = self._flat_sq.range_search(
+                        query_vectors, max_distance,
+                        params=search_params("flat", self.index_config, block_slots)
+                    )
+                else:
+                    vectors = np.ascontiguousarray(self._decode(slice(start, stop)))
+                    lims, D, S = _range_search_l2(query_vectors, vectors, max_distance)
+                    S += start
+                for r in range(len(query_vectors)):
+                    parts[r].append((D[lims[r]:lims[r + 1]], self._slot_ids[S[lims[r]:lims[r + 1]]]))
+                    
+        found = []
+        for row_parts in parts:
+            D = np.concatenate([d for d, _ in row_parts]) if row_parts else np.empty(0, dtype=np.float32)
+            I = np.concatenate([i for _, i in row_parts]) if row_parts else np.empty(0, dtype=np.int64)
+            live = self._live_mask(I)
+            D, I = D[live], I[live]
+            order = np.argsort(D, kind="stable")
+            found.append((I[order].tolist(), D[order].tolist()))
+        return found
+        
+    def _exact_search(
+        self,
+        query_vectors: np.ndarray,
+        candidates: List[Set[int]],
+        union: Set[int],
+        limit: Optional[int],
+        max_distance: Optional[float] = None
+    ) -> List[Tuple[List[int], List[float]]]:
+        """Score every query against its own candidates in one masked distance pass."""
+        if not union:
+            return [([], []) for _ in candidates]
+        union_ids = np.fromiter(union, dtype=np.int64, count=len(union))
+        columns = {int(m): c for c, m in enumerate(union_ids)}
+        mask = np.zeros((len(candidates), len(union_ids)), dtype=bool)
+        for row, ids in enumerate(candidates):
+            mask[row, [columns[m] for m in ids]] = True
+            
+        vectors = self._decode(self._slots_of(union_ids))
+        distances = (
+            np.einsum("ij,ij->i", query_vectors, query_vectors)[:, None]
+            - 2 * query_vectors @ vectors.T
+            + np.einsum("ij,ij->i", vectors, vectors)[None, :]
+        )
+        distances[~mask] = np.inf
+        if max_distance is not None:
+            distances[distances > max_distance] = np.inf
+        
+        k = min(limit or len(union_ids), len(union_ids))
+        top = np.argpartition(distances, k - 1, axis=1)[:, :k]
+        top = np.take_along_axis(top, np.take_along_axis(distances, top, 1).argsort(1), 1)
+        found = []
+        for r, row in enumerate(top):
+            row = row[np.isfinite(distances[r, row])]
+            found.append((union_ids[row].tolist(), distances[r, row].tolist()))
+        return found
+        
+    def _selector_search(
+        self,
+        query_vector: np.ndarray,
+        ids: Set[int],
+        limit: Optional[int],
+        max_distance: Optional[float] = None
+    ) -> Tuple[List[int], List[float]]:
+        """Search the index restricted to ``ids``, for candidate sets too large to score directly."""
+        if not ids:
+            return [], []
+        selector = faiss.IDSelectorBatch(np.fromiter(ids, dtype=np.int64, count=len(ids)))
+        params = search_params(self._index_kind, self.index_config, selector)
+        if limit is None:
+            _, D, I = self.index.range_search(query_vector, max_distance, params=params)
+            order = np.argsort(D, kind="stable")
+            return I[order].tolist(), D[order].tolist()
+        D, I = self.index.search(query_vector, min(limit, len(ids)), params=params)
+        found = I[0] >= 0
+        return I[0][found].tolist(), D[0][found].tolist()
+        
+    @property
+    def _filled(self) -> int:
+        """Number of leading slots that have ever held a memory."""
+        return min(self._next_id, self.max_items)
+        
+    def _slots_of(self, memory_ids: np.ndarray) -> np.ndarray:
+        """Slot positions of live memories; ids and slots advance in lockstep."""
+        return memory_ids % self.max_items
+        
+    def _matching_ids(self, filter_metadata: Dict[str, Any]) -> Set[int]:
+        """Ids of live memories whose metadata matches every filter."""
+        indexed = self._posting_keys(filter_metadata)
+        if indexed:
+            postings = sorted((self._postings.get(key, set()) for key in indexed), key=len)
+            candidates = postings[0].intersection(*postings[1:])
+        else:
+            candidates = set(self._slot_ids[self._slot_ids >= 0].tolist())
+            
+        # Check the remaining, non-indexed filters on the (small) candidate set
+        residual = {k: v for k, v in filter_metadata.items() if (k, v) not in indexed}
+        if residual:
+            candidates = {
+                memory_id for memory_id in candidates
+                if all(
+                    self._metadata[memory_id % self.max_items].get(k) == v
+                    for k, v in residual.items()
+                )
+            }
+        return candidates
+        
+    def _config_state(self) -> dict:
+        return {
+            "backend": self.backend,
+            "embedding_dim": self.embedding_dim,
+            "vector_dtype": self.vector_dtype,
+            "max_items": self.max_items,
+            "index": self.index_config.model_dump()
+        }
+        
+    def _apply_config(self, config: dict) -> None:
+        self.backend = config["backend"]
+        self._backend = resolve_backend(self.backend)
+        self.embedding_dim = config["embedding_dim"]
+        self.vector_dtype = check_vector_dtype(config.get("vector_dtype", "float32"))
+        self.max_items = config["max_items"]
+        if "index" in config:
+            self.index_config = IndexConfig(**config["index"])
         
     def export_state(self) -> dict:
         """Export memory state for serialization."""
         return {
             "memories": [
                 {
-                    "content": m.content,
-                    "metadata": m.metadata,
-                    "timestamp": m.timestamp.isoformat(),
-                    "embedding": m.embedding
+                    "id": int(self._slot_ids[slot]),
+                    "content": self._contents[slot],
+                    "metadata": self._metadata[slot],
+                    "timestamp": datetime.fromtimestamp(self._timestamps[slot]).isoformat(),
+                    "count": int(self._counts[slot]),
+                    "embedding": self._decode(slot).tolist()
                 }
-                for m in self.memories
+                for slot in self._live_slots()
             ],
-            "config": {
-                "backend": self.backend,
-                "embedding_dim": self.embedding_dim,
-                "max_items": self.max_items
-            }
+            "next_id": self._next_id,
+            "config": self._config_state()
         }
         
     async def import_state(self, state: dict) -> None:
         """Import a previously exported memory state."""
-        # Reset current state
-        self.index = faiss.IndexFlatL2(self.embedding_dim)
-        self.memories.clear()
+        await self._run_locked(True, self._restore_state, state)
         
-        # Update config
-        config = state["config"]
-        self.backend = config["backend"]
-        self.embedding_dim = config["embedding_dim"]
-        self.max_items = config["max_items"]
+    def _restore_state(self, state: dict) -> None:
+        # Update config and reset current state
+        self._apply_config(state["config"])
+        self._reset()
+        
+        # Restore memories under their ids, so ids kept elsewhere (e.g. on story nodes)
+        # stay valid; older exports without ids are numbered from 0, oldest first
+        memories = state["memories"][-self.max_items:]
+        for position, memory_data in enumerate(memories):
+            memory_id = memory_data.get("id", position)
+            slot = memory_id % self.max_items
+            self._write_slot(
+                slot,
+                memory_id,
+                memory_data["content"],
+                memory_data["metadata"],
+                datetime.fromisoformat(memory_data["timestamp"]).timestamp(),
+                memory_data.get("count", 1)
+            )
+            self._encode(slot, np.asarray(memory_data["embedding"], dtype=np.float32))
+            
+        self._next_id = state.get("next_id", len(memories))
+        self._next_slot = self._next_id % self.max_items
+        self._maybe_train_index()
+        if self.wal is not None:
+            self.checkpoint()
+        
+    def save_snapshot(self, path: Union[str, Path], dtype: Optional[str] = None) -> None:
+        """
+        Write a binary snapshot of the bank to the directory ``path``.
+        
+        The snapshot holds the slot matrix as a raw ``vectors.npy`` block, by default
+        at the bank's ``vector_dtype`` (int8 codes come with their ``scales.npy``),
+        ``slots.npy`` with the memory id in each slot, the native FAISS file
+        ``index.faiss`` with the ``tombstones.npy`` of evicted ids it still holds
+        when an approximate index is trained, and ``memories.json``, a column table
+        of contents, metadata and timestamps.
+        
+        Every file is replaced whole, so saving into the directory the bank was
+        loaded from is safe.
+        """
+        dtype = check_vector_dtype(dtype or self.vector_dtype)
+        path = Path(path)
+        path.mkdir(parents=True, exist_ok=True)
+        
+        filled = self._filled
+        if dtype == self.vector_dtype:
+            vectors = self._vectors[:filled]
+            scales = self._scales[:filled] if self._scales is not None else None
+        else:
+            vectors, scales = quantize(self._decode(slice(0, filled)), dtype)
+        _write_replacing(path / "vectors.npy", lambda tmp: np.save(tmp, vectors))
+        scales_path = path / "scales.npy"
+        if scales is not None:
+            _write_replacing(scales_path, lambda tmp: np.save(tmp, scales))
+        elif scales_path.exists():
+            scales_path.unlink()
+        slot_ids = self._slot_ids[:filled]
+        _write_replacing(path / "slots.npy", lambda tmp: np.save(tmp, slot_ids))
+        index_path, tombstones_path = path / "index.faiss", path / "tombstones.npy"
+        if self.index is not None:
+            tombstones = np.fromiter(self._tombstones, dtype=np.int64, count=len(self._tombstones))
+            _write_replacing(index_path, lambda tmp: faiss.write_index(self.index, str(tmp)))
+            _write_replacing(tombstones_path, lambda tmp: np.save(tmp, tombstones))
+        else:
+            for stale in (index_path, tombstones_path):
+                if stale.exists():
+                    stale.unlink()
+            
+        slots = np.flatnonzero(self._slot_ids[:filled] >= 0)
+        table = {
+            "config": self._config_state(),
+            "next_id": self._next_id,
+            "next_slot": self._next_slot,
+            "index_kind": self._index_kind,
+            "slots": slots.tolist(),
+            "contents": [self._contents[slot] for slot in slots],
+            "metadata": [self._metadata[slot] for slot in slots],
+            "timestamps": self._timestamps[slots].tolist(),
+            "importance": self._importance[slots].tolist(),
+            "counts": self._counts[slots].tolist()
+        }
+        # Written last, so a snapshot with a table is complete
+        def write_table(tmp: Path) -> None:
+            with open(tmp, "w") as f:
+                json.dump(table, f, separators=(",", ":"))
+        _write_replacing(path / "memories.json", write_table)
+            
+    def load_snapshot(self, path: Union[str, Path]) -> None:
+        """
+        Replace the bank's contents with a snapshot written by ``save_snapshot``.
+        
+        A full snapshot at the bank's own precision is memory-mapped copy-on-write and
+        used as the slot matrix directly, so loading does not read or copy the
+        vectors; pages are only copied when new memories overwrite them. Partial
+        snapshots, or ones saved at another precision, are copied into a fresh matrix.
+        """
+        path = Path(path)
+        with open(path / "memories.json") as f:
+            table = json.load(f)
+        self._apply_config(table["config"])
+        self._reset()
+        
+        vectors = np.load(path / "vectors.npy", mmap_mode="c")
+        scales = np.load(path / "scales.npy") if vectors.dtype == np.int8 else None
+        filled = len(vectors)
+        if filled == self.max_items and vectors.dtype == self._vectors.dtype and self._flat_sq is None:
+            self._vectors = vectors
+            if scales is not None:
+                self._scales = scales
+        else:
+            self._encode(slice(0, filled), dequantize(vectors, scales))
+        slot_ids = np.load(path / "slots.npy")
+        self._next_id = table["next_id"]
+        self._next_slot = table["next_slot"]
         
-        # Restore memories
-        embeddings = []
-        for memory_data in state["memories"]:
-            memory = Memory(
-                content=memory_data["content"],
-                metadata=memory_data["metadata"],
-                timestamp=datetime.fromisoformat(memory_data["timestamp"]),
-                embedding=memory_data["embedding"]
+        counts = table.get("counts") or [1] * len(table["slots"])
+        for slot, content, metadata, timestamp, count in zip(
+            table["slots"], table["contents"], table["metadata"], table["timestamps"], counts
+        ):
+            self._write_slot(slot, int(slot_ids[slot]), content, metadata, timestamp, count)
+        if "importance" in table:
+            # Merges can raise importance above what the metadata says
+            self._importance[table["slots"]] = table["importance"]
+            
+        if table["index_kind"] != "flat":
+            self.index = faiss.read_index(str(path / "index.faiss"))
+            self._index_kind = table["index_kind"]
+            tombstones_path = path / "tombstones.npy"
+            if tombstones_path.exists():
+                self._tombstones = set(np.load(tombstones_path).tolist())
+            else:
+                # Older snapshots did not record which indexed ids were evicted
+                self._rebuild_index(self._index_kind)
+        self._maybe_train_index()
+        if self.wal is not None:
+            self.checkpoint()
+            
+    def open_log(
+        self,
+        path: Union[str, Path],
+        checkpoint_bytes: int = 64 << 20,
+        fsync: bool = False
+    ) -> int:
+        """
+        Recover the bank from the write-ahead log in ``path`` and log every later change.
+        
+        The bank is replaced by the latest checkpoint in ``path``, if there is one,
+        and the records logged after it are replayed. An empty directory starts a
+        new log for the bank's current contents.
+        
+        Args:
+            path: Directory holding the log segments and checkpoints
+            checkpoint_bytes: Log size at which it is compacted into a checkpoint
+            fsync: Force every record to disk, not just to the OS
+            
+        Returns:
+            The number of log records replayed
+        """
+        self.close_log()
+        wal = WriteAheadLog(path, fsync=fsync)
+        checkpoint = wal.latest_checkpoint()
+        if checkpoint is not None:
+            self.load_snapshot(checkpoint)
+        replayed = 0
+        for header, vectors in wal.records():
+            self._replay(header, vectors)
+            replayed += 1
+        self.wal = wal
+        self.checkpoint_bytes = checkpoint_bytes
+        if checkpoint is None and not replayed and self._count:
+            self.checkpoint()  # Memories stored before the log was opened
+        return replayed
+        
+    def _replay(self, header: Dict[str, Any], vectors: Optional[np.ndarray]) -> None:
+        """Re-apply one logged change."""
+        op = header["op"]
+        if op == "add":
+            # Inserts skipped by an oversized batch still consumed their ids
+            self._next_id = header["first_id"]
+            self._next_slot = self._next_id % self.max_items
+            self._insert(
+                header["contents"],
+                header["metadata"],
+                vectors.reshape(-1, self.embedding_dim),
+                np.array(header["timestamps"], dtype=np.float64)
             )
-            self.memories.append(memory)
-            embeddings.append(memory.embedding)
+        elif op == "merge":
+            ids = np.array(header["ids"], dtype=np.int64)
+            live = self._live_mask(ids)
+            slots = self._slots_of(ids[live])
+            self._timestamps[slots] = np.array(header["timestamps"])[live]
+            self._importance[slots] = np.array(header["importance"])[live]
+            self._counts[slots] = np.array(header["counts"])[live]
+            self.generation += 1
+        elif op == "remove":
+            self._remove_ids(header["ids"])
+        elif op == "update":
+            self._update(header["id"], header["content"], header["metadata"], vectors)
+        else:
+            raise ValueError(f"Unknown log record: {op}")
             
-        # Restore FAISS index
-        if embeddings:
-            self.index.add(np.array(embeddings, dtype=np.float32)) 
+    def _log(self, header: Dict[str, Any], vectors: Optional[np.ndarray] = None) -> None:
+        """Append a change to the write-ahead log, compacting it when it grows too large."""
+        if self.wal is None:
+            return
+        self.wal.append(header, vectors)
+        if self.wal.size >= self.checkpoint_bytes:
+            self.checkpoint()
+            
+    def checkpoint(self) -> None:
+        """Compact the write-ahead log into a snapshot of the bank's current state."""
+        if self.wal is None:
+            raise RuntimeError("No write-ahead log is open; call open_log first")
+        self.wal.checkpoint(self.save_snapshot)
+        
+    def close_log(self) -> None:
+        """Stop logging changes; the log directory stays recoverable."""
+        if self.wal is not None:
+            self.wal.close()
+            self.wal = None
 
-    async def generate_chapter_summary(self, node_ids: List[UUID]) -> str:
-        memories = [self.get_memory(id) for id in node_ids]
-        return await self.llm.summarize("\n".join([m.content for m in memories])) 
\ No newline at end of file
+    async def generate_chapter_summary(self, nodes: List["StoryNode"]) -> str:
+        """Summarize the memories linked from the given story nodes' ``memory_ids``, oldest first."""
+        return await self.summarize_memories(sorted({i for node in nodes for i in node.memory_ids}))
+        
+    async def summarize_memories(self, memory_ids: List[int]) -> str:
+        """Summarize the given memories, e.g. those linked from a chapter's story nodes, oldest first."""
+        if self.summarizer is None:
+            raise RuntimeError("A summarizer is required to generate chapter summaries")
+        memories = sorted(self.get_memories(memory_ids), key=lambda m: m.id)
+        if not memories:
+            return ""
+        return await self.summarizer.summarize([m.content for m in memories])
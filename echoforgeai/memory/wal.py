@@ -0,0 +1,159 @@
+"""
+Append-only write-ahead log with checkpoints, for persisting a memory bank incrementally.
+"""
+import json
+import os
+import shutil
+import struct
+import zlib
+from pathlib import Path
+from typing import Any, BinaryIO, Callable, Dict, Iterator, List, Optional, Tuple, Union
+
+import numpy as np
+
+_FRAME = struct.Struct("<II")  # Payload length, CRC-32 of the payload
+_HEADER = struct.Struct("<I")  # JSON header length
+
+
+class WriteAheadLog:
+    """
+    A directory of log segments and checkpoints.
+
+    Every change is appended to the current ``wal-<n>.log`` segment as one framed
+    record: a JSON header followed by an optional raw float32 vector block, with
+    its length and CRC-32 in front so a record torn by a crash is recognized and
+    cut off on recovery. A checkpoint starts a new segment and writes the full
+    state to ``checkpoint-<n>``; once it is in place, older segments and
+    checkpoints are deleted. Recovery loads the latest checkpoint and replays the
+    segments written after it.
+
+    Appends are flushed to the OS, which survives a crash of the process; with
+    ``fsync`` each append is also forced to disk, which survives a crash of the
+    machine at the cost of one sync per record.
+    """
+
+    def __init__(self, path: Union[str, Path], fsync: bool = False):
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.fsync = fsync
+        checkpoints = self.checkpoints()
+        self._base = checkpoints[-1] if checkpoints else 0
+        self._seq = max(self._segments(), default=self._base)
+        self._file: Optional[BinaryIO] = None
+        self.size = sum(self._segment_path(seq).stat().st_size for seq in self._segments())
+
+    def _segment_path(self, seq: int) -> Path:
+        return self.path / f"wal-{seq:06d}.log"
+
+    def _checkpoint_path(self, seq: int) -> Path:
+        return self.path / f"checkpoint-{seq:06d}"
+
+    def _segments(self) -> List[int]:
+        """Segments written since the latest checkpoint, in order."""
+        seqs = (int(p.stem.split("-")[1]) for p in self.path.glob("wal-*.log"))
+        return sorted(seq for seq in seqs if seq >= self._base)
+
+    def checkpoints(self) -> List[int]:
+        """Numbers of the complete checkpoints on disk, in order."""
+        return sorted(int(p.name.split("-")[1]) for p in self.path.glob("checkpoint-*") if p.is_dir())
+
+    def latest_checkpoint(self) -> Optional[Path]:
+        """Directory of the newest checkpoint, if any."""
+        checkpoints = self.checkpoints()
+        return self._checkpoint_path(checkpoints[-1]) if checkpoints else None
+
+    def records(self) -> Iterator[Tuple[Dict[str, Any], Optional[np.ndarray]]]:
+        """
+        Records logged since the latest checkpoint, oldest first, as (header, vectors).
+
+        A torn or corrupt record ends the log: it is truncated away, together with
+        any later segment, so new appends continue from the last good record.
+        """
+        for seq in self._segments():
+            path = self._segment_path(seq)
+            data = path.read_bytes()
+            offset = 0
+            while offset + _FRAME.size <= len(data):
+                length, crc = _FRAME.unpack_from(data, offset)
+                payload = data[offset + _FRAME.size:offset + _FRAME.size + length]
+                if len(payload) < length or zlib.crc32(payload) != crc:
+                    break
+                yield self._decode(payload)
+                offset += _FRAME.size + length
+            if offset < len(data):
+                self._truncate(seq, offset)
+                return
+
+    def _truncate(self, seq: int, offset: int) -> None:
+        self._close_file()
+        with open(self._segment_path(seq), "r+b") as f:
+            f.truncate(offset)
+        for later in self._segments():
+            if later > seq:
+                self._segment_path(later).unlink()
+        self._seq = seq
+        self.size = sum(self._segment_path(s).stat().st_size for s in self._segments())
+
+    @staticmethod
+    def _decode(payload: bytes) -> Tuple[Dict[str, Any], Optional[np.ndarray]]:
+        (header_length,) = _HEADER.unpack_from(payload)
+        start = _HEADER.size
+        header = json.loads(payload[start:start + header_length])
+        block = payload[start + header_length:]
+        vectors = np.frombuffer(block, dtype=np.float32).copy() if block else None
+        return header, vectors
+
+    def append(self, header: Dict[str, Any], vectors: Optional[np.ndarray] = None) -> int:
+        """
+        Append one record and flush it.
+
+        Returns:
+            The number of bytes written
+        """
+        encoded = json.dumps(header, separators=(",", ":")).encode("utf-8")
+        payload = _HEADER.pack(len(encoded)) + encoded
+        if vectors is not None:
+            payload += np.ascontiguousarray(vectors, dtype=np.float32).tobytes()
+        if self._file is None:
+            self._file = open(self._segment_path(self._seq), "ab")
+        self._file.write(_FRAME.pack(len(payload), zlib.crc32(payload)) + payload)
+        self._file.flush()
+        if self.fsync:
+            os.fsync(self._file.fileno())
+        written = _FRAME.size + len(payload)
+        self.size += written
+        return written
+
+    def checkpoint(self, write: Callable[[Path], None]) -> Path:
+        """
+        Compact the log: ``write`` saves the full current state into the directory
+        it is given, which becomes the new checkpoint, and the records it covers
+        are deleted.
+        """
+        self._close_file()
+        seq = self._seq + 1
+        tmp = self.path / f"tmp-checkpoint-{seq:06d}"
+        shutil.rmtree(tmp, ignore_errors=True)
+        write(tmp)
+        # Renamed into place only once complete; until then recovery uses the previous one
+        checkpoint = self._checkpoint_path(seq)
+        os.replace(tmp, checkpoint)
+        self._base = self._seq = seq
+        self.size = 0
+
+        for old in self.path.glob("wal-*.log"):
+            if int(old.stem.split("-")[1]) < seq:
+                old.unlink()
+        for old in self.checkpoints():
+            if old < seq:
+                shutil.rmtree(self._checkpoint_path(old), ignore_errors=True)
+        return checkpoint
+
+    def _close_file(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def close(self) -> None:
+        """Close the current segment; later appends reopen it."""
+        self._close_file()
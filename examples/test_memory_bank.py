@@ -0,0 +1,774 @@
+"""
+Tests for the FAISS-backed memory bank.
+"""
+import asyncio
+import hashlib
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+
+from echoforgeai import Character, PersonalityModel, StoryNode
+from echoforgeai.memory.consolidation import ColdArchive, MemoryConsolidator
+from echoforgeai.memory.embedding_cache import CachedEmbedder, EmbeddingCache
+from echoforgeai.memory.embeddings import Embedder, HashingEmbedder, TruncatingEmbedder
+from echoforgeai.memory.index_backends import IndexConfig, resolve_backend
+from echoforgeai.memory.service import MemoryService
+from echoforgeai.memory.summarizers import ExtractiveSummarizer
+from echoforgeai.memory.vector_store import MemoryBank, RetrievalWeights
+
+
+class SeededEmbedder(Embedder):
+    """Deterministic stand-in for the embedding model that counts its calls."""
+    model = "seeded"
+    
+    def __init__(self, dim: int = 16):
+        self.dim = dim
+        self.calls = []
+        
+    def embed_sync(self, texts):
+        self.calls.append(list(texts))
+        return np.stack([
+            np.random.default_rng(
+                int.from_bytes(hashlib.sha256(t.encode()).digest()[:4], "little")
+            ).random(self.dim, dtype=np.float32)
+            for t in texts
+        ])
+        
+    async def embed(self, texts):
+        return self.embed_sync(texts)
+
+
+@pytest.fixture
+def embedder():
+    """Create a deterministic embedder."""
+    return SeededEmbedder()
+
+
+@pytest.fixture
+def bank(embedder):
+    """Create a small memory bank with deterministic embeddings."""
+    return MemoryBank(embedding_dim=16, max_items=8, embedder=embedder)
+
+
+def test_eviction_keeps_newest_memories(bank):
+    """Test that inserting past capacity drops the oldest memories."""
+    for i in range(20):
+        bank.store_sync(f"memory {i}")
+        
+    assert len(bank) == 8
+    assert [m.content for m in bank.memories] == [f"memory {i}" for i in range(12, 20)]
+
+
+@pytest.mark.asyncio
+async def test_retrieval_after_many_evictions(bank):
+    """Test that ids stay aligned with memories across repeated evictions."""
+    for i in range(5000):
+        bank.store_sync(f"memory {i}")
+        
+    for i in range(4992, 5000):
+        results = await bank.retrieve_relevant(f"memory {i}", limit=1)
+        assert results[0].content == f"memory {i}"
+
+
+@pytest.mark.asyncio
+async def test_export_import_roundtrip(bank, embedder):
+    """Test that an exported bank restores in order and keeps accepting memories."""
+    for i in range(12):
+        bank.store_sync(f"memory {i}")
+        
+    restored = MemoryBank(embedding_dim=16, embedder=embedder)
+    await restored.import_state(bank.export_state())
+    assert [m.content for m in restored.memories] == [m.content for m in bank.memories]
+    
+    restored.store_sync("memory 12")
+    assert restored.memories[0].content == "memory 5"
+    assert (await restored.retrieve_relevant("memory 12", limit=1))[0].content == "memory 12"
+
+
+@pytest.mark.asyncio
+async def test_concurrent_calls_share_one_request(bank, embedder):
+    """Test that concurrent stores and retrievals are micro-batched."""
+    character = Character(
+        name="Old Tom",
+        personality=PersonalityModel(traits={}, goals=[]),
+        initial_knowledge=[f"fact {i}" for i in range(4)]
+    )
+    await character.bind_memory_bank_async(bank)
+    assert embedder.calls == [[f"fact {i}" for i in range(4)]]
+    
+    results = await asyncio.gather(*(character.recall(f"fact {i}", limit=1) for i in range(4)))
+    assert len(embedder.calls) == 2
+    assert results == [[f"fact {i}"] for i in range(4)]
+
+
+@pytest.mark.asyncio
+async def test_batches_respect_max_size(embedder):
+    """Test that large bursts are split into max-size requests."""
+    bank = MemoryBank(embedding_dim=16, embedder=embedder, max_batch_size=3)
+    await asyncio.gather(*(bank.store(f"memory {i}") for i in range(7)))
+    assert [len(c) for c in embedder.calls] == [3, 3, 1]
+    assert [m.content for m in bank.memories] == [f"memory {i}" for i in range(7)]
+
+
+@pytest.mark.asyncio
+async def test_embedding_cache_embeds_repeated_text_once(embedder):
+    """Test that the same query is embedded once across narrative and character recall."""
+    cache = EmbeddingCache(max_entries=2)
+    bank = MemoryBank(embedding_dim=16, embedder=embedder, embedding_cache=cache)
+    await bank.store("Old Tom polishes a mug", {"character": "Old Tom"})
+    
+    await bank.retrieve_relevant("Approach the bar")
+    await bank.retrieve_relevant("Approach the bar", filter_metadata={"character": "Old Tom"})
+    assert embedder.calls == [["Old Tom polishes a mug"], ["Approach the bar"]]
+    assert (cache.hits, cache.misses) == (1, 2)
+
+
+def test_embedding_cache_survives_restart(tmp_path, embedder):
+    """Test that vectors evicted from the LRU are served from the disk tier after reopening."""
+    cache = EmbeddingCache(max_entries=1, path=tmp_path)
+    first = CachedEmbedder(embedder, cache).embed_sync(["a", "b", "c"])
+    cache.close()
+    
+    reopened = EmbeddingCache(max_entries=1, path=tmp_path)
+    again = CachedEmbedder(embedder, reopened).embed_sync(["a", "b", "c"])
+    np.testing.assert_array_equal(first, again)
+    assert len(embedder.calls) == 1
+    assert reopened.stats()["disk_hits"] == 3
+
+
+def test_embedding_caches_can_share_a_directory(tmp_path, embedder):
+    """Test that caches writing to the same directory each find the right vectors."""
+    first, second = EmbeddingCache(max_entries=0, path=tmp_path), EmbeddingCache(max_entries=0, path=tmp_path)
+    vectors = {t: embedder.embed_sync([t])[0] for t in ["alpha", "beta", "gamma", "delta"]}
+    first.put_many("m", 16, ["alpha", "beta"], np.stack([vectors["alpha"], vectors["beta"]]))
+    second.put_many("m", 16, ["gamma"], vectors["gamma"][None, :])
+    first.put_many("m", 16, ["delta", "alpha"], np.stack([vectors["delta"], vectors["alpha"]]))
+    
+    for cache in (first, second, EmbeddingCache(max_entries=0, path=tmp_path)):
+        for text, vector in vectors.items():
+            np.testing.assert_array_equal(cache.get("m", 16, text), vector)
+        assert cache.stats()["disk_entries"] == 4
+
+
+@pytest.mark.asyncio
+async def test_filtered_retrieval_returns_exact_top_k(embedder):
+    """Test that a character's recall is exact even when other characters dominate the bank."""
+    bank = MemoryBank(embedding_dim=16, max_items=500, embedder=embedder)
+    for i in range(450):
+        bank.store_sync(f"memory {i}", {"character": f"npc {i % 10}", "type": "learned_knowledge"})
+        
+    query = embedder.embed_sync(["memory 3"])[0]
+    own = [m for m in bank.memories if m.metadata["character"] == "npc 7"]
+    vectors = dict(zip([m.id for m in own], embedder.embed_sync([m.content for m in own])))
+    expected = sorted(own, key=lambda m: float(np.sum((vectors[m.id] - query) ** 2)))[:5]
+    
+    results = await bank.retrieve_relevant("memory 3", filter_metadata={"character": "npc 7"})
+    assert [m.id for m in results] == [m.id for m in expected]
+    
+    results = await bank.retrieve_relevant(
+        "memory 3", filter_metadata={"character": "npc 7", "type": "learned_knowledge"}, limit=50
+    )
+    assert len(results) == 45
+
+
+@pytest.mark.asyncio
+async def test_filtered_retrieval_skips_evicted_memories(bank):
+    """Test that evicted memories leave the inverted index."""
+    bank.store_sync("secret", {"character": "The Stranger"})
+    for i in range(8):
+        bank.store_sync(f"memory {i}", {"character": "Old Tom"})
+        
+    assert await bank.retrieve_relevant("secret", filter_metadata={"character": "The Stranger"}) == []
+    assert ("character", "The Stranger") not in bank._postings
+
+
+@pytest.mark.parametrize("backend", ["ivf", "hnsw", "ivfpq"])
+@pytest.mark.asyncio
+async def test_approximate_backend_trains_once_large_enough(backend, embedder):
+    """Test that approximate backends stay flat until the training threshold."""
+    bank = MemoryBank(
+        backend=backend,
+        embedding_dim=16,
+        max_items=600,
+        embedder=embedder,
+        index_config=IndexConfig(min_train_size=400, pq_m=4)
+    )
+    for i in range(399):
+        bank.store_sync(f"memory {i}")
+    assert bank._index_kind == "flat"
+    
+    for i in range(399, 1000):
+        bank.store_sync(f"memory {i}", {"character": "Old Tom" if i % 2 else "The Stranger"})
+    assert bank._index_kind == backend
+    assert bank.index.ntotal - len(bank._tombstones) == 600
+    
+    results = await bank.retrieve_relevant("memory 999", filter_metadata={"character": "Old Tom"})
+    assert len(results) == 5
+    assert all(m.metadata["character"] == "Old Tom" for m in results)
+
+
+def test_unknown_backend_is_rejected():
+    """Test that an unsupported backend name fails fast."""
+    with pytest.raises(ValueError):
+        MemoryBank(backend="annoy")
+
+
+@pytest.mark.asyncio
+async def test_store_many_embeds_once_and_keeps_newest(bank, embedder):
+    """Test that bulk stores use one embeddings batch and respect capacity."""
+    await bank.store_many([f"memory {i}" for i in range(11)], [{"n": i} for i in range(11)])
+    assert len(embedder.calls) == 1
+    assert [m.metadata["n"] for m in bank.memories] == list(range(3, 11))
+    
+    await bank.store_many(["memory 11", "memory 12"])
+    assert [m.content for m in bank.memories][-3:] == ["memory 10", "memory 11", "memory 12"]
+    assert (await bank.retrieve_relevant("memory 11", limit=1))[0].content == "memory 11"
+
+
+@pytest.mark.parametrize("exact_search_limit", [0, 20000])
+@pytest.mark.asyncio
+async def test_retrieve_many_matches_single_queries(exact_search_limit, embedder):
+    """Test that batched retrieval returns the same memories as one query at a time."""
+    bank = MemoryBank(
+        embedding_dim=16, max_items=100, embedder=embedder, exact_search_limit=exact_search_limit
+    )
+    await bank.store_many(
+        [f"memory {i}" for i in range(150)],
+        [{"character": f"npc {i % 3}"} for i in range(150)]
+    )
+    filters = [None, {"character": "npc 0"}, {"character": "npc 1"}, {"character": "nobody"}]
+    
+    batched = await bank.retrieve_many(["memory 7"] * 4, filters, limit=4)
+    embedder.calls.clear()
+    single = [await bank.retrieve_relevant("memory 7", f, limit=4) for f in filters]
+    assert [[m.id for m in r] for r in batched] == [[m.id for m in r] for r in single]
+    assert [len(r) for r in batched] == [4, 4, 4, 0]
+
+
+@pytest.mark.parametrize("backend", ["flat", "hnsw"])
+@pytest.mark.parametrize("dtype", ["float32", "float16"])
+@pytest.mark.asyncio
+async def test_snapshot_roundtrip(tmp_path, backend, dtype, embedder):
+    """Test that a binary snapshot restores memories, vectors and the trained index."""
+    bank = MemoryBank(
+        backend=backend,
+        embedding_dim=16,
+        max_items=50,
+        embedder=embedder,
+        index_config=IndexConfig(min_train_size=40)
+    )
+    await bank.store_many(
+        [f"memory {i}" for i in range(70)], [{"character": f"npc {i % 2}"} for i in range(70)]
+    )
+    bank.save_snapshot(tmp_path, dtype=dtype)
+    
+    restored = MemoryBank(embedding_dim=16, embedder=embedder)
+    restored.load_snapshot(tmp_path)
+    assert restored._index_kind == bank._index_kind
+    assert [(m.id, m.content, m.metadata) for m in restored.memories] == [
+        (m.id, m.content, m.metadata) for m in bank.memories
+    ]
+    if dtype == "float32":
+        assert isinstance(restored._vectors, np.memmap)
+        
+    result = await restored.retrieve_relevant("memory 69", {"character": "npc 1"}, limit=1)
+    assert result[0].content == "memory 69"
+    
+    # The restored bank keeps evicting in order without touching the snapshot
+    await restored.store_many(["memory 70", "memory 71"])
+    assert restored.memories[0].content == "memory 22"
+    assert (await restored.retrieve_relevant("memory 71", limit=1))[0].content == "memory 71"
+    assert np.load(tmp_path / "vectors.npy").dtype == np.dtype(dtype)
+
+
+@pytest.mark.asyncio
+async def test_snapshot_can_be_saved_over_the_one_it_was_loaded_from(tmp_path, embedder):
+    """Test that checkpointing into the directory a memory-mapped bank came from keeps both intact."""
+    bank = MemoryBank(embedding_dim=16, max_items=50, embedder=embedder)
+    await bank.store_many([f"memory {i}" for i in range(50)])
+    bank.save_snapshot(tmp_path)
+    
+    restored = MemoryBank(embedding_dim=16, embedder=embedder)
+    restored.load_snapshot(tmp_path)
+    for turn in range(2):
+        await restored.store(f"new memory {turn}")
+        restored.save_snapshot(tmp_path)
+        assert (await restored.retrieve_relevant("memory 30", limit=1))[0].content == "memory 30"
+        
+    reloaded = MemoryBank(embedding_dim=16, embedder=embedder)
+    reloaded.load_snapshot(tmp_path)
+    assert [m.content for m in reloaded.memories] == [m.content for m in restored.memories]
+    assert (await reloaded.retrieve_relevant("new memory 1", limit=1))[0].content == "new memory 1"
+
+
+@pytest.mark.parametrize("backend", ["ivf", "hnsw"])
+@pytest.mark.asyncio
+async def test_snapshot_keeps_evicted_ids_out_of_approximate_results(tmp_path, backend, embedder):
+    """Test that ids evicted but still in an approximate index stay tombstoned after a reload."""
+    bank = MemoryBank(
+        backend=backend,
+        embedding_dim=16,
+        max_items=400,
+        embedder=embedder,
+        index_config=IndexConfig(min_train_size=200, nlist=8, nprobe=8)
+    )
+    for start in range(0, 480, 80):
+        await bank.store_many([f"memory {i}" for i in range(start, start + 80)])
+    assert len(bank._tombstones) == 80
+    bank.save_snapshot(tmp_path)
+    
+    restored = MemoryBank(embedding_dim=16, embedder=embedder)
+    restored.load_snapshot(tmp_path)
+    assert restored._tombstones == bank._tombstones
+    queries = [f"memory {i}" for i in range(0, 480, 40)]
+    expected = await bank.retrieve_many(queries, limit=10)
+    found = await restored.retrieve_many(queries, limit=10)
+    assert [len(r) for r in found] == [len(r) for r in expected] == [10] * len(queries)
+    
+    # Snapshots without tombstones rebuild the index from the live slots
+    (tmp_path / "tombstones.npy").unlink()
+    rebuilt = MemoryBank(embedding_dim=16, embedder=embedder)
+    rebuilt.load_snapshot(tmp_path)
+    assert rebuilt.index.ntotal == len(rebuilt) == 400
+
+
+def test_identical_metadata_is_shared_and_released(bank):
+    """Test that memories with equal metadata share one dict that is freed on eviction."""
+    for i in range(8):
+        bank.store_sync(f"memory {i}", {"character": "Old Tom", "type": "learned_knowledge"})
+    assert len(bank._metadata_pool) == 1
+    assert bank._metadata[0] is bank._metadata[7]
+    
+    returned = bank.memories[0].metadata
+    returned["character"] = "Somebody else"
+    assert bank._metadata[0]["character"] == "Old Tom"
+    
+    for i in range(8):
+        bank.store_sync(f"memory {i}", {"character": "The Stranger"})
+    assert [entry[1] for entry in bank._metadata_pool.values()] == [8]
+
+
+@pytest.mark.asyncio
+async def test_weighted_retrieval_blends_recency_and_importance(bank):
+    """Test that recency and importance weights re-rank the nearest candidates."""
+    for i in range(4):
+        bank.store_sync(f"memory {i}", {"importance": 0.1 * i})
+    bank._timestamps[:4] -= np.array([0, 3, 2, 1]) * 24 * 3600  # Memory 0 is the newest
+    
+    by_importance = await bank.retrieve_relevant(
+        "memory 0", limit=2, weights=RetrievalWeights(relevance=0, importance=1)
+    )
+    assert [m.content for m in by_importance] == ["memory 3", "memory 2"]
+    
+    by_recency = await bank.retrieve_relevant(
+        "memory 3", limit=4, weights=RetrievalWeights(relevance=0, recency=1)
+    )
+    assert [m.content for m in by_recency] == ["memory 0", "memory 3", "memory 2", "memory 1"]
+    
+    assert (await bank.retrieve_relevant("memory 2", limit=1))[0].content == "memory 2"
+
+
+@pytest.mark.asyncio
+async def test_contextual_memories_stay_with_their_character(bank):
+    """Test that contextual memories come from the character's own recall results."""
+    character = Character(
+        name="Old Tom",
+        personality=PersonalityModel(traits={}, goals=[]),
+        initial_knowledge=["The well is dry"]
+    )
+    character.bind_memory_bank(bank)
+    await bank.store("The stranger paid in gold", {"character": "The Stranger"})
+    
+    assert await character.get_contextual_memories("gold") == ["The well is dry (0 days ago)"]
+
+
+@pytest.mark.asyncio
+async def test_executor_mode_runs_searches_in_parallel(embedder):
+    """Test that an executor-backed bank overlaps searches but serializes inserts."""
+    bank = MemoryBank(
+        embedding_dim=16,
+        max_items=64,
+        embedder=embedder,
+        executor=ThreadPoolExecutor(max_workers=4)
+    )
+    await bank.store_many([f"memory {i}" for i in range(32)])
+    
+    active = []
+    peak = []
+    search = bank._search
+    
+    def slow_search(*args):
+        active.append(1)
+        peak.append(len(active))
+        time.sleep(0.05)
+        active.pop()
+        return search(*args)
+    bank._search = slow_search
+    
+    add_many = bank._add_many
+    
+    def checked_add_many(*args):
+        assert not active, "insert overlapped a search"
+        return add_many(*args)
+    bank._add_many = checked_add_many
+    
+    results = await asyncio.gather(
+        *(bank.retrieve_relevant(f"memory {i}", limit=1) for i in range(4)),
+        bank.store("memory 32")
+    )
+    assert max(peak) > 1
+    assert [r[0].content for r in results[:4]] == [f"memory {i}" for i in range(4)]
+    assert len(bank) == 33
+
+
+@pytest.mark.asyncio
+async def test_near_duplicates_merge_instead_of_evicting(embedder):
+    """Test that a repeated memory bumps its count rather than using a slot."""
+    bank = MemoryBank(embedding_dim=16, max_items=4, embedder=embedder, dedup_threshold=0.999)
+    await bank.store_many([f"memory {i}" for i in range(4)], [{"importance": 0.2}] * 4)
+    bank._timestamps[:] -= 3600
+    
+    await bank.store("memory 3", {"importance": 0.9})
+    await bank.store("memory 2", {"character": "Old Tom"})
+    
+    assert len(bank) == 4
+    assert bank.memories[0].content == "memory 1"  # Different metadata still appends
+    merged = (await bank.retrieve_relevant("memory 3", limit=1))[0]
+    assert merged.count == 2
+    assert bank._importance[3] == pytest.approx(0.9)
+    assert (datetime.now() - merged.timestamp).total_seconds() < 60
+    assert bank.dedup_stats() == {"merged": 1, "live": 4, "bytes_saved": 64}
+
+
+@pytest.mark.asyncio
+async def test_consolidation_summarizes_and_archives_oldest(tmp_path, embedder):
+    """Test that a background pass replaces the oldest memories with per-character summaries."""
+    bank = MemoryBank(
+        embedding_dim=16, max_items=16, embedder=embedder, summarizer=ExtractiveSummarizer()
+    )
+    names = ["Old Tom", "The Stranger"]
+    await bank.store_many(
+        [f"Memory {i}. Details" for i in range(15)],
+        [{"character": names[i % 2], "importance": i / 20} for i in range(15)]
+    )
+    consolidator = MemoryConsolidator(
+        bank, archive=ColdArchive(tmp_path), batch_size=8, cluster_size=2
+    )
+    await consolidator.schedule()
+    
+    summaries = [m for m in bank.memories if m.metadata.get("type") == "summary"]
+    assert len(bank) == 7 + len(summaries)
+    assert sum(m.metadata["summarized"] for m in summaries) == 8
+    assert consolidator.schedule() is None  # Back under the high-water mark
+    
+    recalled = await bank.retrieve_relevant("Memory 0", {"character": "Old Tom", "type": "summary"})
+    raw = consolidator.archive.expand(recalled[0])
+    assert raw and all(m.metadata["character"] == "Old Tom" for m in raw)
+    assert all(m.content.split(".")[0] in recalled[0].content for m in raw)
+    assert recalled[0].timestamp == max(m.timestamp for m in raw)
+
+
+@pytest.mark.asyncio
+async def test_chapter_summary_covers_its_nodes(bank):
+    """Test that chapter summaries are built from the memories the given nodes link to."""
+    bank.summarizer = ExtractiveSummarizer()
+    nodes = [StoryNode(title=f"Node {i}", content="") for i in range(3)]
+    for i, node in enumerate(nodes):
+        node.memory_ids.append(await bank.store(f"Beat {i}. More", {"type": "story_beat"}))
+    nodes[1].memory_ids.insert(0, await bank.store("Aside. More"))
+        
+    assert await bank.generate_chapter_summary(nodes[:2]) == "Beat 0. Beat 1. Aside."
+
+
+@pytest.mark.asyncio
+async def test_hybrid_retrieval_finds_exact_names(embedder):
+    """Test that BM25 fusion surfaces a named memory the vectors miss, and forgets evicted ones."""
+    bank = MemoryBank(embedding_dim=16, max_items=32, embedder=embedder, hybrid=True)
+    await bank.store_many(
+        [f"memory {i}" for i in range(20)] + ["Old Tom keeps the Silver Flagon"]
+        + [f"memory {i}" for i in range(20, 31)]
+    )
+    results = await bank.retrieve_relevant("where is the silver flagon?", limit=3)
+    assert "Old Tom keeps the Silver Flagon" in [m.content for m in results]
+    
+    named = await bank.retrieve_relevant("Old Tom", {"type": "missing"}, limit=3)
+    assert named == []
+    
+    await bank.store_many([f"later {i}" for i in range(32)])
+    assert bank.lexical.search("silver flagon", 3) == ([], [])
+    assert len(bank.lexical) == 32
+
+
+@pytest.mark.asyncio
+async def test_updated_memories_drop_their_old_keywords(tmp_path, embedder):
+    """Test that BM25 forgets a memory's old text when it is updated, live and after log recovery."""
+    bank = MemoryBank(embedding_dim=16, max_items=32, embedder=embedder, hybrid=True)
+    bank.open_log(tmp_path)
+    await bank.store_many([f"memory {i}" for i in range(10)] + ["Mira found a silver coin"])
+    flagon = await bank.store("The Silver Flagon is closed")
+    await bank.update_memory(flagon, content="Old Tom went fishing")
+    
+    recovered = MemoryBank(embedding_dim=16, max_items=32, embedder=embedder, hybrid=True)
+    recovered.open_log(tmp_path)
+    for b in (bank, recovered):
+        assert b.lexical.search("silver flagon", 3)[0] == [flagon - 1]  # Only the coin
+        assert b.lexical.search("fishing", 3)[0] == [flagon]
+    query = "is the silver flagon open?"
+    assert [m.id for m in await recovered.retrieve_relevant(query)] == [
+        m.id for m in await bank.retrieve_relevant(query)
+    ]
+
+
+def test_hashing_embedder_is_deterministic_and_lexically_aware():
+    """Test that the local embedder is reproducible and puts similar texts close together."""
+    texts = ["Old Tom keeps the Silver Flagon", "old tom keeps the silver flagon!", "A dragon sleeps"]
+    vectors = HashingEmbedder(64).embed_sync(texts)
+    
+    assert np.array_equal(vectors, HashingEmbedder(64).embed_sync(texts))
+    assert not np.array_equal(vectors, HashingEmbedder(64, seed=1).embed_sync(texts))
+    assert np.allclose(np.linalg.norm(vectors, axis=1), 1.0)
+    assert vectors[0] @ vectors[1] > 0.9 > vectors[0] @ vectors[2]
+    
+
+
+@pytest.mark.asyncio
+async def test_memory_service_isolates_tenants_and_enforces_quotas(embedder):
+    """Test that tenants share shards but only see, and only lose, their own memories."""
+    service = MemoryService(
+        shards=2, shard_capacity=64, tenant_quota=4, embedding_dim=16, embedder=embedder
+    )
+    tom, mira = service.tenant("story-1"), service.tenant("story-2")
+    await tom.store_many([f"tom {i}" for i in range(6)])
+    await mira.store_many(["mira 0", "mira 1"], [{"character": "Mira"}] * 2)
+    
+    assert [m.content for m in tom.memories] == [f"tom {i}" for i in range(2, 6)]
+    assert len(mira) == 2
+    assert all(m.content.startswith("mira") for m in await mira.retrieve_relevant("tom 3"))
+    assert await mira.retrieve_relevant("mira 0", {"character": "Mira"}, limit=1) != []
+    
+    restored = service.tenant("story-3")
+    await restored.import_state(tom.export_state())
+    assert [m.content for m in restored.memories] == [f"tom {i}" for i in range(2, 6)]
+    
+    assert await service.drop_tenant("story-1") == 4
+    assert sum(service.stats()["shards"]) == 6
+
+
+@pytest.mark.asyncio
+async def test_tenant_state_round_trips_through_a_memory_bank(embedder):
+    """Test that a tenant export loads into a MemoryBank under its ids, and back into a service with an id map."""
+    service = MemoryService(shard_capacity=64, tenant_quota=8, embedding_dim=16, embedder=embedder)
+    await service.tenant("other").store_many(["noise 0", "noise 1", "noise 2"])
+    tom = service.tenant("tom")
+    ids = await tom.store_many([f"tom {i}" for i in range(4)], [{"character": "Tom"}] * 4)
+    
+    bank = MemoryBank(embedding_dim=16, max_items=8, embedder=embedder)
+    await bank.import_state(tom.export_state())
+    assert (bank.max_items, bank.embedding_dim) == (64, 16)
+    assert [m.content for m in bank.get_memories(ids)] == [f"tom {i}" for i in range(4)]
+    
+    fresh = MemoryService(shard_capacity=64, tenant_quota=8, embedding_dim=16, embedder=embedder)
+    await fresh.tenant("other").store("noise")
+    id_map = await fresh.tenant("tom").import_state(bank.export_state())
+    assert sorted(id_map) == ids and id_map[ids[0]] != ids[0]
+    restored = fresh.tenant("tom").get_memories([id_map[i] for i in ids])
+    assert [(m.content, m.metadata) for m in restored] == [(f"tom {i}", {"character": "Tom", "tenant": "tom"}) for i in range(4)]
+
+
+@pytest.mark.asyncio
+async def test_write_ahead_log_recovers_after_crash(tmp_path, embedder):
+    """Test that a reopened log replays stores, merges and removals, and survives a torn tail."""
+    def make_bank():
+        return MemoryBank(embedding_dim=16, max_items=8, embedder=embedder, dedup_threshold=0.999)
+        
+    bank = make_bank()
+    bank.open_log(tmp_path)
+    await bank.store_many([f"memory {i}" for i in range(10)], [{"character": "Mira"}] * 10)
+    await bank.store("memory 9", {"character": "Mira", "importance": 0.9})
+    await bank.remove([bank.memories[0].id])
+    expected = [(m.id, m.content, m.count) for m in bank.memories]
+    
+    # Simulate a crash in the middle of an append
+    segment = sorted(tmp_path.glob("wal-*.log"))[-1]
+    with open(segment, "ab") as f:
+        f.write(b"\x40\x00\x00\x00torn")
+        
+    recovered = make_bank()
+    assert recovered.open_log(tmp_path) == 3
+    assert [(m.id, m.content, m.count) for m in recovered.memories] == expected
+    assert recovered._importance[recovered._slot_ids == expected[-1][0]][0] == pytest.approx(0.9)
+    
+    # New records follow the last good one
+    await recovered.store("memory 10")
+    again = make_bank()
+    assert again.open_log(tmp_path) == 4
+    assert again.memories[-1].content == "memory 10"
+    
+    
+@pytest.mark.asyncio
+async def test_write_ahead_log_compacts_into_checkpoints(tmp_path, embedder):
+    """Test that a growing log is folded into a checkpoint and only its tail is replayed."""
+    bank = MemoryBank(embedding_dim=16, max_items=8, embedder=embedder)
+    bank.open_log(tmp_path, checkpoint_bytes=2048)
+    for i in range(30):
+        await bank.store(f"memory {i}", {"character": f"npc {i % 3}"})
+        
+    assert len(list(tmp_path.glob("checkpoint-*"))) == 1
+    assert len(list(tmp_path.glob("wal-*.log"))) == 1
+    assert bank.wal.size < 2048
+    
+    recovered = MemoryBank(embedding_dim=16, max_items=8, embedder=embedder)
+    assert recovered.open_log(tmp_path) < 30
+    assert [(m.id, m.content) for m in recovered.memories] == [(m.id, m.content) for m in bank.memories]
+    result = await recovered.retrieve_relevant("memory 29", {"character": "npc 2"}, limit=1)
+    assert result[0].content == "memory 29"
+
+
+@pytest.mark.asyncio
+async def test_repeated_recalls_skip_the_index_until_the_bank_changes(embedder, monkeypatch):
+    """Test that identical queries reuse cached results and any store invalidates them."""
+    bank = MemoryBank(embedding_dim=16, max_items=8, embedder=embedder, result_cache_size=16)
+    tom = Character(name="Old Tom", personality=PersonalityModel(traits={}, goals=[]))
+    tom.bind_memory_bank(bank)
+    await tom.learn("The cellar door sticks")
+    await tom.learn("Mira owes me three silver")
+    
+    searches = []
+    search = bank._search
+    monkeypatch.setattr(bank, "_search", lambda *args: searches.append(1) or search(*args))
+    first = await tom.recall("silver", limit=1)
+    assert await tom.recall("silver", limit=1) == first
+    assert await tom.recall("silver", limit=2) != first
+    assert len(searches) == 2
+    assert bank.result_cache.stats()["hit_rate"] == pytest.approx(1 / 3)
+    
+    await tom.learn("The stranger paid in gold")
+    await tom.recall("silver", limit=1)
+    assert len(searches) == 3
+    assert bank.result_cache.invalidations == 1
+
+
+@pytest.mark.asyncio
+async def test_recency_weighted_queries_follow_the_clock(embedder, monkeypatch):
+    """Test that a recency-weighted query is re-ranked as time passes instead of served from the cache."""
+    bank = MemoryBank(
+        embedding_dim=16, max_items=8, embedder=embedder, result_cache_size=16,
+        weights=RetrievalWeights(recency=2.0, half_life_hours=1.0)
+    )
+    start = datetime(2030, 1, 1, 12)
+    await bank.store_many(["silver", "gold"], timestamps=[start - timedelta(hours=10), start])
+    
+    class Clock(datetime):
+        offset = timedelta(0)
+        
+        @classmethod
+        def now(cls, tz=None):
+            return start + cls.offset
+            
+    monkeypatch.setattr("echoforgeai.memory.vector_store.datetime", Clock)
+    assert [m.content for m in await bank.retrieve_relevant("silver", limit=1)] == ["gold"]
+    Clock.offset = timedelta(hours=100)
+    assert [m.content for m in await bank.retrieve_relevant("silver", limit=1)] == ["silver"]
+    assert bank.result_cache.stats()["hit_rate"] == 0
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("backend", ["flat", "hnsw", "ivf"])
+@pytest.mark.parametrize("vector_dtype", ["float16", "int8"])
+async def test_reduced_precision_vectors(tmp_path, backend, vector_dtype):
+    """Test that float16 and int8 banks store smaller vectors and still find the nearest memory."""
+    embedder = TruncatingEmbedder(SeededEmbedder(32), 16)
+    bank = MemoryBank(
+        backend=backend,
+        embedding_dim=16,
+        max_items=100,
+        embedder=embedder,
+        index_config=IndexConfig(min_train_size=80),
+        vector_dtype=vector_dtype
+    )
+    await bank.store_many([f"memory {i}" for i in range(120)])
+    assert bank._vectors.dtype == np.dtype(vector_dtype)
+    assert bank._index_kind == resolve_backend(backend)
+    
+    result = await bank.retrieve_relevant("memory 119", limit=1)
+    assert result[0].content == "memory 119"
+    exported = np.array(bank.export_state()["memories"][-1]["embedding"])
+    assert np.dot(exported, embedder.embed_sync(["memory 119"])[0]) > 0.99
+    
+    bank.save_snapshot(tmp_path)
+    restored = MemoryBank(embedding_dim=16, embedder=embedder)
+    restored.load_snapshot(tmp_path)
+    assert restored.vector_dtype == vector_dtype
+    result = await restored.retrieve_relevant("memory 115", limit=1)
+    assert result[0].content == "memory 115"
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("backend,vector_dtype", [
+    ("flat", "float32"), ("flat", "float16"), ("flat", "int8"), ("hnsw", "float32"), ("ivf", "float32")
+])
+async def test_range_search_drops_distant_memories(backend, vector_dtype, embedder):
+    """Test that a distance cutoff returns only nearby memories and counts what it cut."""
+    bank = MemoryBank(
+        backend=backend,
+        embedding_dim=16,
+        max_items=100,
+        embedder=embedder,
+        index_config=IndexConfig(min_train_size=80, nprobe=64),
+        vector_dtype=vector_dtype
+    )
+    contents = [f"memory {i}" for i in range(90)]
+    await bank.store_many(contents, [{"character": f"npc {i % 2}"} for i in range(90)])
+    vectors = embedder.embed_sync(contents)
+    distances = ((vectors - vectors[42]) ** 2).sum(axis=1)
+    radius = float(np.sort(distances)[3:5].mean())  # Memory 42 and its three nearest neighbours
+    expected = [contents[i] for i in np.argsort(distances)[:4]]
+    
+    in_range = await bank.retrieve_relevant("memory 42", limit=None, max_distance=radius)
+    assert [m.content for m in in_range] == expected
+    capped = await bank.retrieve_relevant("memory 42", limit=10, max_distance=radius)
+    assert [m.content for m in capped] == expected
+    assert bank.range_stats()["cut"] == 6
+    
+    filtered = await bank.retrieve_relevant("memory 42", {"character": "npc 0"}, limit=None, max_distance=radius)
+    assert [m.content for m in filtered] == [c for c in expected if int(c.split()[1]) % 2 == 0]
+    with pytest.raises(ValueError):
+        await bank.retrieve_relevant("memory 42", limit=None)
+    
+    
+@pytest.mark.asyncio
+@pytest.mark.parametrize("backend", ["flat", "hnsw"])
+async def test_memories_are_addressable_by_id(tmp_path, backend, embedder):
+    """Test that stored ids fetch, update and delete memories, and that updates are logged."""
+    def make_bank():
+        return MemoryBank(
+            backend=backend, embedding_dim=16, max_items=8, embedder=embedder,
+            index_config=IndexConfig(min_train_size=4)
+        )
+        
+    bank = make_bank()
+    bank.open_log(tmp_path)
+    ids = await bank.store_many([f"memory {i}" for i in range(6)], [{"character": "Mira"}] * 6)
+    tavern = await bank.store("The tavern smells of smoke", {"character": "Ugo"})
+    assert ids == list(range(6)) and tavern == 6
+    assert [m.content for m in bank.get_memories([tavern, 2, 99])] == ["The tavern smells of smoke", "memory 2"]
+    
+    calls = len(embedder.calls)
+    assert await bank.update_memory(tavern, metadata={"character": "Ugo", "importance": 0.9})
+    assert len(embedder.calls) == calls  # Unchanged content is not re-embedded
+    assert await bank.update_memory(tavern, content="The tavern burned down")
+    found = await bank.retrieve_relevant("The tavern burned down", limit=1)
+    assert (found[0].id, found[0].metadata["importance"]) == (tavern, 0.9)
+    assert [m.id for m in await bank.retrieve_relevant("smoke", {"character": "Ugo"})] == [tavern]
+    
+    assert await bank.delete_memory(3)
+    assert not await bank.delete_memory(3)
+    assert bank.get_memory(3) is None
+    
+    recovered = make_bank()
+    recovered.open_log(tmp_path)
+    assert recovered.get_memory(tavern).content == "The tavern burned down"
+    assert recovered.get_memory(3) is None
@@ -0,0 +1,149 @@
+"""
+Tests for the story controller.
+"""
+import asyncio
+
+import pytest
+
+from echoforgeai import Character, LLMResponse, PersonalityModel, Story, StoryConfig, StoryNode
+from echoforgeai.memory.service import MemoryService
+
+
+class ScriptedLLM:
+    """Stand-in for the LLM service that answers every input after a short delay."""
+
+    def __init__(self, delay: float = 0.05):
+        self.delay = delay
+        self.beats = []
+
+    async def generate_character_reflection(self, usage=None, **kwargs) -> str:
+        if usage is not None:
+            usage["total_tokens"] = usage.get("total_tokens", 0) + 30
+        return "Hmm."
+
+    async def generate_story_beat(self, current_content: str, user_input: str, **kwargs) -> LLMResponse:
+        self.beats.append(user_input)
+        await asyncio.sleep(self.delay)
+        return LLMResponse(
+            text=f"You {user_input}.",
+            choices=[f"{user_input} again", "rest", "leave"],
+            usage={"total_tokens": 100}
+        )
+
+
+@pytest.fixture
+def story():
+    """A story with a scripted LLM and speculation on the first two choices."""
+    story = Story(StoryConfig(
+        title="Test Story",
+        api_key="dummy_key",
+        embedding_provider="hashing",
+        embedding_dim=64,
+        speculative_choices=2
+    ))
+    story.llm = ScriptedLLM()
+    story.graph.add_node(StoryNode(title="Start", content="You wake up.", is_entry_point=True))
+    return story
+
+
+@pytest.mark.asyncio
+async def test_speculated_choices_skip_the_llm_round_trip(story):
+    """Test that picking a speculated choice reuses its beat and the others are counted as waste."""
+    await story.start()
+    await story.advance("look")
+    await asyncio.sleep(0.2)  # The player reads while the first two choices are drafted
+    assert sorted(story.llm.beats) == ["look", "look again", "rest"]
+
+    result = await story.advance("Look again")
+    assert result["text"] == "You look again."
+    assert story.llm.beats.count("look again") == 1
+    assert story.graph.get_previous_node(story.current_node.id).content == "You look."
+
+    await story.advance("dance")  # Not offered, so the round is cancelled and generated afresh
+    stats = story.speculation_stats()
+    assert (stats["hits"], stats["misses"]) == (1, 1)
+    assert stats["used_tokens"] == 100
+    assert stats["wasted_tokens"] == 100  # The finished but unused "rest" beat
+    assert stats["cancelled"] == 2  # The second round was still running
+
+
+@pytest.mark.asyncio
+async def test_character_reflections_count_against_the_speculation_budget(story):
+    """Test that speculative drafts are charged for their characters' reflections too."""
+    story.speculator.token_budget = 120
+    story.speculator._semaphore = asyncio.Semaphore(1)  # Draft one choice at a time
+    await story.add_character(Character(name="Old Tom", personality=PersonalityModel(traits={}, goals=[])))
+    await story.start()
+    await story.advance("look")
+    await asyncio.sleep(0.2)
+    
+    # 100 beat tokens and 30 for Old Tom's reflection: the beat alone would stay under budget
+    await story.advance("dance")
+    stats = story.speculation_stats()
+    assert stats["skipped"] == 1
+    assert stats["wasted_tokens"] == 130
+
+
+@pytest.mark.asyncio
+async def test_repeated_beats_merge_when_dedup_is_on():
+    """Test that identical story beats fold into one memory that every node links to."""
+    story = Story(StoryConfig(
+        title="Test Story",
+        api_key="dummy_key",
+        embedding_provider="hashing",
+        embedding_dim=64,
+        memory_dedup_threshold=0.97
+    ))
+    story.llm = ScriptedLLM(delay=0)
+    story.graph.add_node(StoryNode(title="Start", content="You wake up.", is_entry_point=True))
+    await story.start()
+    nodes = []
+    for _ in range(5):
+        await story.advance("wait")
+        nodes.append(story.current_node)
+        
+    stats = story.narrative_memory.dedup_stats()
+    assert (stats["merged"], stats["live"]) == (4, 1)
+    assert len({memory_id for node in nodes for memory_id in node.memory_ids}) == 1
+
+
+@pytest.mark.asyncio
+async def test_node_memory_ids_survive_save_and_load():
+    """Test that memories keep their ids through a save and load, so nodes still find their beats."""
+    config = StoryConfig(
+        title="Test Story", api_key="dummy_key", embedding_provider="hashing", embedding_dim=64, max_memory_items=4
+    )
+    story = Story(config)
+    story.llm = ScriptedLLM(delay=0)
+    story.graph.add_node(StoryNode(title="Start", content="You wake up.", is_entry_point=True))
+    await story.start()
+    for turn in range(6):
+        await story.advance(f"act {turn}")  # The first two beats are evicted
+    path = story.graph.get_narrative_path(story.current_node)
+    await story.narrative_memory.delete_memory(path[-2].memory_ids[0])
+    
+    loaded = await Story.load_state(story.save_state())
+    loaded.llm = story.llm
+    memories = [loaded.narrative_memory.get_memory(node.memory_ids[0]) for node in path[-4:]]
+    assert [m and m.content for m in memories] == ["You act 2.", "You act 3.", None, "You act 5."]
+    await loaded.advance("act 6")
+    assert loaded.current_node.memory_ids == [story.current_node.memory_ids[0] + 1]
+
+
+@pytest.mark.asyncio
+async def test_node_memory_ids_follow_memories_into_a_memory_service():
+    """Test that loading a story into a shared memory service rewrites node memory ids to the new ids."""
+    config = StoryConfig(title="Test Story", api_key="dummy_key", embedding_provider="hashing", embedding_dim=64)
+    story = Story(config)
+    story.llm = ScriptedLLM(delay=0)
+    story.graph.add_node(StoryNode(title="Start", content="You wake up.", is_entry_point=True))
+    await story.start()
+    for turn in range(3):
+        await story.advance(f"act {turn}")
+        
+    service = MemoryService(embedding_dim=64, embedder=story.narrative_memory.embedder)
+    await service.tenant("other").store_many(["noise 0", "noise 1"])
+    loaded = await Story.load_state(story.save_state(), memory_service=service)
+    path = loaded.graph.get_narrative_path(loaded.current_node)
+    contents = [loaded.narrative_memory.get_memory(node.memory_ids[0]).content for node in path[-3:]]
+    assert contents == ["You act 0.", "You act 1.", "You act 2."]
@@ -0,0 +1,239 @@
+"""
+Tests for the story graph.
+"""
+import random
+from collections import Counter
+from uuid import uuid4
+
+import pytest
+
+from echoforgeai import LLMResponse, StoryNode
+from echoforgeai.graph.node_store import CompactNodeStore, DictNodeStore
+from echoforgeai.graph.story_graph import NodeArchive, StoryGraph
+
+
+def response(text: str, *choices: str) -> LLMResponse:
+    return LLMResponse(text=text, choices=list(choices), metadata={})
+
+
+def make_graph(backend: str, **kwargs) -> StoryGraph:
+    graph = StoryGraph(backend=backend, **kwargs)
+    if backend == "compact":
+        graph.nodes.pack_every = 2  # Pack nearly every node, so views and packed edges are exercised
+    return graph
+
+
+@pytest.fixture(params=["dict", "compact"])
+def graph(request):
+    """A graph holding a single entry node, for each storage backend."""
+    graph = make_graph(request.param)
+    graph.add_node(StoryNode(title="Start", content="You wake up.", is_entry_point=True))
+    return graph
+
+
+@pytest.mark.asyncio
+async def test_narrative_path_follows_parent_index(graph):
+    """Test that turns are linked to the node they came from and paths walk back to the start."""
+    node = graph.get_entry_node()
+    for turn in range(5):
+        beat = await graph.process_input(node, f"turn {turn}", [], response(f"beat {turn}", "left", "right"))
+        node = beat.next_node
+
+    path = graph.get_narrative_path(node)
+    assert [n.content for n in path] == ["You wake up."] + [f"beat {t}" for t in range(5)]
+    assert [n.depth for n in path] == list(range(6))
+    assert [n.id for n in graph.get_narrative_path(node, max_depth=2)] == [n.id for n in path[-2:]]
+
+    # The index survives a save and reload into the other backend, and forgets removed parents
+    restored = make_graph("dict" if isinstance(graph.nodes, CompactNodeStore) else "compact")
+    await restored.import_state(graph.export_state())
+    assert [n.id for n in restored.get_narrative_path(restored.get_node(node.id))] == [n.id for n in path]
+    restored.remove_node(path[-2].id)
+    assert restored.get_previous_node(node.id) is None
+
+
+def test_replacing_a_branch_moves_its_parent_edge(graph):
+    """Test that rebinding a branch condition updates the reverse edges."""
+    start = graph.get_entry_node()
+    first, second = StoryNode(title="A", content="a"), StoryNode(title="B", content="b")
+    graph.add_node(first)
+    graph.add_node(second)
+    graph.add_branch(start, "go", first)
+    assert graph.get_previous_node(first.id).id == start.id
+
+    graph.add_branch(start, "go", second)
+    assert graph.get_previous_node(first.id) is None
+    assert graph.get_previous_node(second.id).id == start.id
+    assert graph.get_node(start.id).branches == {"go": second.id}
+
+
+@pytest.mark.asyncio
+async def test_choices_stay_pending_until_taken(graph):
+    """Test that offered choices allocate no nodes until a player takes one, and round-trip exports."""
+    start = graph.get_entry_node()
+    beat = await graph.process_input(start, "look around", [], response("A dark hall.", "north", "south", "wait"))
+    assert len(graph.nodes) == 2
+    assert all(graph.is_pending(target) for target in beat.next_node.branches.values())
+
+    north_id = beat.next_node.branches["north"]
+    taken = await graph.process_input(beat.next_node, "north", [], response("A cold stair.", "up"))
+    assert taken.next_node.id == north_id and not graph.is_pending(north_id)
+    assert graph.get_previous_node(north_id).id == beat.next_node.id
+    assert len(graph.nodes) == 3
+
+    # Exports keep the placeholder nodes earlier versions wrote
+    state = graph.export_state()
+    south = state["nodes"][str(beat.next_node.branches["south"])]
+    assert (south["content"], south["title"]) == ("To be generated", "Choice: south...")
+    restored = StoryGraph()
+    await restored.import_state(state)
+    assert len(restored.nodes) == 3
+    assert restored.get_node(beat.next_node.branches["wait"]).content == "To be generated"
+    assert len(restored.nodes) == 4
+
+
+@pytest.mark.asyncio
+async def test_reentering_an_existing_choice_links_the_new_beat(graph):
+    """Test that authored and already materialized choices lead to the new beat, with its parent recorded."""
+    start = graph.get_entry_node()
+    authored = StoryNode(title="Door", content="A locked door.")
+    graph.add_node(authored)
+    graph.add_branch(start, "open the door", authored)
+    
+    beat = await graph.process_input(start, "open the door", [], response("It creaks open.", "enter"))
+    assert graph.get_node(start.id).branches["open the door"] == beat.next_node.id
+    assert graph.get_previous_node(beat.next_node.id).id == start.id
+    assert graph.get_previous_node(authored.id) is None
+    
+    enter_id = beat.next_node.branches["enter"]
+    assert graph.get_node(enter_id).content == "To be generated"  # Materialized before it is taken
+    entered = await graph.process_input(graph.get_node(beat.next_node.id), "enter", [], response("A dusty hall."))
+    assert entered.next_node.id == enter_id
+    assert graph.get_node(enter_id).content == "A dusty hall."
+    assert [n.id for n in graph.get_narrative_path(entered.next_node)] == [start.id, beat.next_node.id, enter_id]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("backend", ["dict", "compact"])
+async def test_old_nodes_are_archived_and_summarized_in_chapters(tmp_path, backend):
+    """Test that finalized nodes move to the cold archive, still resolve, and are summarized in order."""
+    graph = make_graph(backend, archive=NodeArchive(tmp_path))
+    graph.max_context_nodes = 6
+    graph.add_node(StoryNode(title="Start", content="You wake up.", is_entry_point=True))
+    node = graph.get_entry_node()
+    visited = [node]
+    for turn in range(12):
+        beat = await graph.process_input(node, f"turn {turn}", [], response(f"Beat {turn}. More.", "on"))
+        node = beat.next_node
+        visited.append(node)
+    await graph.wait_for_chapters()
+
+    assert len(graph.nodes) <= graph.max_context_nodes + 1
+    assert graph.get_entry_node().content == "You wake up."
+    assert len(graph.archive) > 0
+    first = visited[1]
+    assert first.id not in graph.nodes and graph.get_node(first.id).content == "Beat 0. More."
+    assert graph.chapter_summaries[0].startswith("Beat 0")
+
+    # Archived nodes survive a save and reload, and a reopened archive directory
+    restored = StoryGraph()
+    await restored.import_state(graph.export_state())
+    assert restored.get_node(first.id).content == "Beat 0. More."
+    assert restored.chapter_summaries == graph.chapter_summaries
+    assert NodeArchive(tmp_path).get(first.id).title == first.title
+
+
+def test_compact_store_round_trips_nodes():
+    """Test that packed nodes come back as equal views, addressable by handle, after rewrites and removals."""
+    store = CompactNodeStore(StoryNode, pack_every=3)
+    nodes = [
+        StoryNode(title="Hall", content=f"Room {i} \u2013 dusty.", tags={"indoor", f"floor {i % 2}"}, depth=i)
+        for i in range(7)
+    ]
+    for a, b in zip(nodes, nodes[1:]):
+        a.branches["on"] = b.id
+    nodes[2].memory_ids = [4, 5]
+    nodes[3].requirements = {"key": True}
+    for node in nodes:
+        store[node.id] = node
+    store.pack()
+
+    assert len(store) == 7
+    for node in nodes:
+        assert store[node.id].model_dump() == node.model_dump()
+    first = store.handle_of(nodes[0].id)
+    assert store.uuid_of(store.children(first)[0]) == nodes[1].id
+    assert store.parents(nodes[4].id) == [nodes[3].id]
+
+    # Rewriting moves a node to the overlay; removal drops it and its edges
+    moved = store[nodes[1].id]
+    moved.title = "Vault"
+    store[moved.id] = moved
+    assert store.handle_of(moved.id) == -1 and store[moved.id].title == "Vault"
+    del store[nodes[5].id]
+    store.pack()
+    assert nodes[5].id not in store and len(store) == 6
+    assert store.parents(nodes[6].id) == [] and store.parents(nodes[2].id) == [nodes[1].id]
+    assert store.uuid_of(store.children(first)[0]) == nodes[1].id
+
+
+def test_compact_reverse_edges_match_the_dict_store():
+    """Test that random links, unlinks and packs give the same parents on both stores, duplicate and self edges included."""
+    rng = random.Random(7)
+    ids = [uuid4() for _ in range(5)]
+    compact, reference = CompactNodeStore(StoryNode), DictNodeStore()
+    for _ in range(2000):
+        source, target = rng.choice(ids), rng.choice(ids)
+        op = rng.random()
+        if op < 0.5:
+            compact.link(source, target)
+            reference.link(source, target)
+        elif op < 0.9:
+            compact.unlink(source, target)
+            reference.unlink(source, target)
+        else:
+            compact.pack()
+        for node_id in ids:
+            assert compact.parents(node_id) == reference.parents(node_id)
+
+
+@pytest.mark.asyncio
+async def test_reverse_edges_follow_the_stored_branches(graph):
+    """Test that shared targets, rebinding, stale views and random play keep parents equal to the stored branches."""
+    start = graph.get_entry_node()
+    b, c = StoryNode(title="B", content="b"), StoryNode(title="C", content="c")
+    graph.add_node(b)
+    graph.add_node(c)
+    graph.add_branch(start, "x", b)
+    graph.add_branch(start, "y", b)
+    if isinstance(graph.nodes, CompactNodeStore):
+        graph.nodes.pack()
+    stale = graph.get_node(start.id).model_copy(deep=True)
+    graph.add_branch(graph.get_node(start.id), "x", c)
+    assert graph.get_previous_node(b.id).id == start.id
+    assert graph.get_previous_node(c.id).id == start.id
+    
+    stale.branches["z"] = b.id  # A view from before the rebinding, stored back
+    graph.save_node(stale)
+    assert graph.nodes.parents(b.id) == [start.id] * 3
+    assert graph.get_previous_node(c.id) is None
+    
+    changed = graph.get_node(b.id)  # Changed in place, then stored back
+    changed.branches["back"] = start.id
+    graph.save_node(changed)
+    assert graph.nodes.parents(start.id) == [b.id]
+    
+    rng = random.Random(3)
+    node = graph.get_node(start.id)
+    for turn in range(60):
+        choices = list(graph.get_node(node.id).branches)
+        user_input = rng.choice(choices) if choices and rng.random() < 0.7 else f"act {turn % 4}"
+        beat = await graph.process_input(graph.get_node(node.id), user_input, [], response(f"beat {turn}", "x", "y"))
+        node = rng.choice([beat.next_node, start, b, c])
+        if rng.random() < 0.2:
+            graph.add_branch(graph.get_node(node.id), rng.choice(["x", "y"]), graph.get_node(start.id))
+            
+    expected = Counter((node_id, target) for node_id in graph.nodes for target in graph.nodes[node_id].branches.values())
+    targets = {target for _, target in expected} | set(graph.nodes)
+    found = Counter((source, target) for target in targets for source in graph.nodes.parents(target))
+    assert found == expected